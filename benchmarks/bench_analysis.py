@@ -0,0 +1,73 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   Micro-benchmark: row-wise (DataFrame.apply) analysis vs. the column-wise DataAnalyzer implementation,
+#   for VHF results and HIV DRM percentages/calls, on 96- and 384-well plates.
+#
+#   Run from the repo folder:
+#       python benchmarks/bench_analysis.py
+#
+#
+
+
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'shared'))) #look for custom dependencies in shared folder
+
+import timeit
+import numpy as np
+import pandas as pd
+from data_analysis import DataAnalyzer
+
+
+class PlateData:
+    '''Stand-in for a parsed DataImporter, with random Cq/dRn/quantity values.'''
+    def __init__(self, wells:int, division:str, seed=0):
+        rng = np.random.default_rng(seed)
+        self.machine_type = 'QuantStudio 5'
+        self.cq_cutoff = 35
+        if division == 'vhf':
+            self.reporter_dict = {'CY5': 'Internal Control', 'FAM': 'EBOV', 'VIC': 'MARV'}
+        else:
+            self.reporter_dict = {'CY5': 'VQ', 'FAM': '076V', 'NED': '184VI'}
+        self.reporter_list = list(self.reporter_dict)
+        self.ic = 'CY5'
+
+        self.results = pd.DataFrame({'Well': [f'{chr(65 + i//24)}{i%24 + 1}' for i in range(wells)],
+                                     'Sample Name': [f'Sample {i}' for i in range(wells)]})
+        for fluor in self.reporter_list:
+            self.results[f'{fluor} CT'] = rng.uniform(15, 35, size=wells)
+            self.results[f'{fluor} dRn'] = rng.uniform(0, 100000, size=wells)
+            self.results[f'{fluor} Quantity'] = 10**rng.uniform(0, 6, size=wells)
+        self.max_dRn_dict = {fluor: 100000.0 for fluor in self.reporter_list}
+
+
+def legacy_vhf(analyzer):
+    analyzer.df['Result'] = analyzer.df.apply(analyzer.vhf_result, axis=1)
+
+
+def legacy_hiv(analyzer):
+    for fluor in analyzer.reporter_list[1:]:
+        kwargs = {f'{analyzer.reporter_dict[fluor]} DRM Percentage':
+                  lambda x: x[fluor + ' Quantity'] / x[analyzer.ic + ' Quantity']}
+        analyzer.df = analyzer.df.assign(**kwargs).fillna(0)
+        analyzer.df[f'{analyzer.reporter_dict[fluor]} Call'] = analyzer.df.apply(analyzer.hiv_result, col=f'{analyzer.reporter_dict[fluor]} DRM Percentage', axis=1)
+
+
+def best_time(func, division:str, wells:int, repeat=5):
+    '''Best-of-`repeat` time (ms) to analyze a freshly loaded plate.'''
+    data = PlateData(wells, division)
+    def run():
+        func(DataAnalyzer(data))
+    return min(timeit.repeat(run, number=1, repeat=repeat)) * 1000
+
+
+if __name__ == '__main__':
+    cases = [('vhf', legacy_vhf, DataAnalyzer.vhf_analysis),
+             ('hiv', legacy_hiv, DataAnalyzer.hiv_analysis)]
+    print(f"{'analysis':<10} {'wells':>6} {'row-wise ms':>12} {'columnar ms':>12} {'speedup':>8}")
+    for division, legacy, columnar in cases:
+        for wells in (96, 384):
+            before = best_time(legacy, division, wells)
+            after = best_time(columnar, division, wells)
+            print(f'{division:<10} {wells:>6} {before:12.2f} {after:12.2f} {before/after:7.1f}x')
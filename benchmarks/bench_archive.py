@@ -0,0 +1,100 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   Time to answer "all 184VI positives on QuantStudio 5 last quarter" from a results archive (shared/archive.py),
+#   vs. reading every summary CSV (with its header block) and filtering.
+#
+#   Synthetic analyzed HIV plates (384 wells) are spread over a year of run dates and four machines.
+#
+#   Run from the repo folder:
+#       python benchmarks/bench_archive.py --plates 500
+#
+#
+
+
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'shared'))) #look for custom dependencies in shared folder
+
+import argparse
+import csv
+import datetime
+import glob
+import tempfile
+import time
+import pandas as pd
+from bench_analysis import PlateData
+from data_analysis import DataAnalyzer
+from archive import ResultsArchive
+
+machines = ['QuantStudio 3', 'QuantStudio 5', 'Mic', 'Rotor-Gene']
+assay = '076V 184VI'
+
+
+def make_plates(folder:str, archive:ResultsArchive, plates:int):
+    '''Write each synthetic plate as a summary CSV (header block + results), and add it to the archive.'''
+    first_day = datetime.date(2026, 1, 1)
+    for i in range(plates):
+        data = PlateData(384, 'hiv', seed=i)
+        analyzer = DataAnalyzer(data)
+        analyzer.hiv_analysis()
+        machine = machines[i % len(machines)]
+        header = [['Experiment Name', f'plate {i}'], ['Instrument Type', machine],
+                  ['Run End Time', (first_day + datetime.timedelta(days=i*365//plates)).isoformat()]]
+
+        source = os.path.join(folder, f'plate {i}.xlsx')
+        archive.append(analyzer.df, header, assay, machine, data.reporter_dict, division='hiv', source=source)
+        with open(os.path.splitext(source)[0] + ' - Summary.csv', 'w', newline='') as f:
+            csv.writer(f).writerows(header)
+            f.write('\n\n')
+            analyzer.df.to_csv(f, index=False)
+
+
+def from_summaries(folder:str):
+    '''Read every summary CSV, keep plates from the right machine and quarter, then filter wells.'''
+    found = []
+    for filepath in glob.glob(os.path.join(folder, '* - Summary.csv')):
+        with open(filepath, newline='') as f:
+            header = dict(row for row in csv.reader(f) if len(row) == 2)
+        if header['Instrument Type'] != 'QuantStudio 5' or not '2026-07-01' <= header['Run End Time'] <= '2026-09-30':
+            continue
+        results = pd.read_csv(filepath, skiprows=len(header)+2)
+        found.append(results.loc[results['184VI Call'] == 'Positive', ['Well', 'Sample Name', 'NED Quantity', '184VI DRM Percentage']])
+    return pd.concat(found, ignore_index=True)
+
+
+def from_archive(archive:ResultsArchive):
+    return archive.query(['well', 'sample_name', 'copies', 'drm_percentage'], assay=assay, machine='QuantStudio 5',
+                         target='184VI', call='Positive', since='2026-07-01', until='2026-09-30')
+
+
+def best_time(func, *args, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)*1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive queries vs. re-reading summary CSVs.')
+    parser.add_argument('--plates', type=int, default=500, help='number of 384-well plates (default: 500)')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    archive = ResultsArchive(os.path.join(folder, 'archive'))
+    start = time.perf_counter()
+    make_plates(folder, archive, args.plates)
+    print(f'{args.plates} plates written and archived in {time.perf_counter() - start:.1f} s')
+
+    csv_ms, expected = best_time(from_summaries, folder)
+    archive_ms, found = best_time(from_archive, archive)
+    assert len(found) == len(expected)
+    print(f'{len(found)} matching wells')
+    print(f'summary CSVs: {csv_ms:9.1f} ms')
+    print(f'archive:      {archive_ms:9.1f} ms  ({csv_ms/archive_ms:.0f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
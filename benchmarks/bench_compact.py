@@ -0,0 +1,66 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   Memory of holding many analyzed plates at once, as standard results frames vs. in compact form (shared/compact.py).
+#
+#   Plates are synthetic 384-well QuantStudio plates (VHF results or HIV calls), with samples run in triplicate.
+#   Memory is traced while the plates are held, so the shared well lookup is only counted once, as in a real batch.
+#
+#   Run from the repo folder:
+#       python benchmarks/bench_compact.py --plates 200
+#
+#
+
+
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'shared'))) #look for custom dependencies in shared folder
+
+import argparse
+import gc
+import tracemalloc
+from bench_analysis import PlateData
+from data_analysis import DataAnalyzer
+from compact import compact
+
+
+def analyzed_plate(division:str, seed:int):
+    data = PlateData(384, division, seed=seed)
+    data.results['Sample Name'] = [f'Sample {i//3}' for i in range(384)]
+    analyzer = DataAnalyzer(data)
+    if division == 'vhf':
+        analyzer.vhf_analysis()
+    else:
+        analyzer.hiv_analysis()
+    return analyzer.df
+
+
+def held_memory(division:str, plates:int, compact_plates:bool):
+    '''Traced memory (MB) still in use while `plates` analyzed plates are held in a list.'''
+    gc.collect()
+    tracemalloc.start()
+    held = []
+    for seed in range(plates):
+        df = analyzed_plate(division, seed)
+        held.append(compact(df) if compact_plates else df)
+        del df
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current/1024**2
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory of standard vs. compact analyzed plates.')
+    parser.add_argument('--plates', type=int, default=200, help='number of 384-well plates held (default: 200)')
+    args = parser.parse_args()
+
+    print(f"{'analysis':<10}{'plates':>7}{'standard MB':>13}{'compact MB':>12}{'saved':>8}")
+    for division in ('vhf', 'hiv'):
+        standard = held_memory(division, args.plates, False)
+        compacted = held_memory(division, args.plates, True)
+        print(f'{division:<10}{args.plates:>7}{standard:>13.2f}{compacted:>12.2f}{1 - compacted/standard:>8.0%}')
+
+
+if __name__ == '__main__':
+    main()
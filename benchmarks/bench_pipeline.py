@@ -0,0 +1,74 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   Benchmark: wall time of a multi-plate run, one stage after another (BatchRunner, one process) compared with the
+#   pipeline (shared/pipeline.py), where reading, parsing, analysis, export and PDFs of different plates overlap.
+#
+#   The pipeline's wall time is also compared with its busiest stage's busy time (per worker) - the best it could do.
+#
+#   Run from the repo folder:
+#       python benchmarks/bench_pipeline.py --plates 24 --wells 96
+#
+#
+
+
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'shared'))) #look for custom dependencies in shared folder
+
+import argparse
+import tempfile
+import time
+import tomli
+from batch import BatchRunner
+from pipeline import PipelineRunner, format_utilization
+from synthetic import SyntheticPlate
+
+repo = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def load_config(division:str):
+    with open(os.path.join(repo, division, 'config.toml'), mode='rb') as f:
+        return tomli.load(f)
+
+
+def timed_run(runner, folder:str):
+    runner.collect([folder])
+    start = time.perf_counter()
+    runner.run()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare sequential and pipelined multi-plate runs.')
+    parser.add_argument('--assay', default='PANDAA LASV')
+    parser.add_argument('--machine', default='QuantStudio 5')
+    parser.add_argument('--format', default='.xlsx')
+    parser.add_argument('--plates', type=int, default=24)
+    parser.add_argument('--wells', type=int, default=96)
+    parser.add_argument('--pdf', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--parse-workers', type=int, default=1)
+    parser.add_argument('--pdf-workers', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        division = None
+        for seed in range(args.plates):
+            plate = SyntheticPlate(args.assay, wells=args.wells, seed=seed)
+            plate.write(folder, args.machine, args.format)
+            division = plate.division
+        config = load_config(division)
+
+        sequential = timed_run(BatchRunner(args.assay, args.machine, config, create_pdf=args.pdf), folder)
+        pipeline = PipelineRunner(args.assay, args.machine, config, create_pdf=args.pdf,
+                                  parse_workers=args.parse_workers, pdf_workers=args.pdf_workers)
+        pipelined = timed_run(pipeline, folder)
+
+    summary = pipeline.summary()
+    slowest = max(summary['utilization'], key=lambda name: summary['utilization'][name]['busy'] / pipeline.workers_per_stage[name])
+    bound = summary['utilization'][slowest]['busy'] / pipeline.workers_per_stage[slowest]
+    print(f"{args.plates} plates, {args.machine} {args.format} {args.wells} wells{', with PDFs' if args.pdf else ''}")
+    print(f'  one stage at a time  {sequential:7.2f} s')
+    print(f'  pipeline             {pipelined:7.2f} s  ({sequential/pipelined:.1f}x)')
+    print(f'  slowest stage        {bound:7.2f} s  ({slowest})')
+    print(format_utilization(summary))
@@ -0,0 +1,109 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   Benchmark: PDF report generation time for 96-, 384- and 1536-row results tables, comparing the old renderer (one
+#   Paragraph per results cell, stylesheet rebuilt and every page held in memory) with the current Report.
+#
+#   Run from the repo folder:
+#       python benchmarks/bench_report.py
+#
+#
+
+
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'shared'))) #look for custom dependencies in shared folder
+
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from reportlab.lib import colors
+from reportlab.platypus import Paragraph, Spacer, Table, TableStyle
+from reportlab.lib.units import inch
+from reportlab.pdfgen import canvas
+import reportbuilder
+from reportbuilder import Report
+
+
+HEAD = [['Experiment Name', 'Benchmark run'], ['Instrument Type', 'QuantStudio 5 System'], ['User Name', 'bench']]
+
+
+def make_results(rows:int, seed=0):
+    '''Results table shaped like an HIV export with many columns.'''
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'Well': [f'{chr(65 + (i//24)%16)}{i%24 + 1}' for i in range(rows)],
+                         'Sample Name': [f'Sample {i}' for i in range(rows)],
+                         'VQ Cq': rng.uniform(15, 35, size=rows),
+                         'VQ Quantity': 10**rng.uniform(0, 6, size=rows),
+                         '076V DRM Percentage': rng.uniform(0, 1, size=rows),
+                         '076V Call': rng.choice(['Mutant', 'Wild Type', 'Invalid'], size=rows),
+                         '184VI DRM Percentage': rng.uniform(0, 1, size=rows),
+                         '184VI Call': rng.choice(['Mutant', 'Wild Type', 'Invalid'], size=rows)})
+
+
+class LegacyCanvas(canvas.Canvas):
+    '''Page numbering as before: every page's state is copied and replayed on save.'''
+    def __init__(self, *args, **kwargs):
+        canvas.Canvas.__init__(self, *args, **kwargs)
+        self.pages = []
+
+    def showPage(self):
+        self.pages.append(dict(self.__dict__))
+        self._startPage()
+
+    def save(self):
+        page_count = len(self.pages)
+        for page in self.pages:
+            self.__dict__.update(page)
+            self.setFont('Helvetica-Oblique', 9)
+            self.drawRightString(7.75*inch-5, 0.5*inch+3, 'Page %s of %s' % (self._pageNumber, page_count))
+            canvas.Canvas.showPage(self)
+        canvas.Canvas.save(self)
+
+
+class LegacyReport(Report):
+    '''Report with the results table built from one Paragraph per cell, and styles/header rebuilt on every page.'''
+    def create_results(self):
+        self.elements.append(Paragraph('<font size=14><b>Samples</b></font>', self.styles['Normal']))
+        self.elements.append(Spacer(1, 0.2*inch))
+        data = self.csv_to_table(self.results, bold='top')
+        numCols = self.count_columns(self.results)
+        colWidths = [6.375*inch // (numCols-1)]*(numCols-1)
+        colWidths.insert(0, 0.5*inch)
+        table = Table(data, colWidths=colWidths, repeatRows=1)
+        table.setStyle(TableStyle([('INNERGRID', (0,0), (-1,-1), 0.25, colors.black),
+                                   ('BOX', (0,0), (-1,-1), 0.25, colors.black),
+                                   ('VALIGN',(0,0),(-1,-1),'MIDDLE')]))
+        table.hAlign = 'LEFT'
+        self.elements.append(table)
+
+    def save(self):
+        def decorate(canv, doc):
+            doc.header_paragraphs = doc.footer_paragraph = None #lay out header and footer again on each page
+            reportbuilder.sample_styles = None                  #and rebuild stylesheet each time
+            reportbuilder.header_and_footer(canv, doc)
+        def first_page(canv, doc):
+            doc.footer_paragraph = None
+            reportbuilder.footer(canv, doc)
+        self.doc.build(self.elements, onFirstPage=first_page, onLaterPages=decorate, canvasmaker=LegacyCanvas)
+
+
+def best_time(report_class, results, repeat=3):
+    '''Best-of-`repeat` time (s) to create a report.'''
+    best = float('inf')
+    with tempfile.TemporaryDirectory() as folder:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            report_class(os.path.join(folder, 'report.pdf'), HEAD, results).create()
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == '__main__':
+    print(f"{'rows':>6} {'legacy s':>9} {'current s':>10} {'speedup':>8} {'ms/row':>7}")
+    for rows in (96, 384, 1536):
+        results = make_results(rows)
+        before = best_time(LegacyReport, results)
+        after = best_time(Report, results)
+        print(f'{rows:>6} {before:9.3f} {after:10.3f} {before/after:7.1f}x {after/rows*1000:7.3f}')
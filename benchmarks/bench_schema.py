@@ -0,0 +1,170 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   Compare the time and memory of reading results tables the old way (read everything as text/objects, then replace
+#   tokens, convert, fill and rename column by column) with reading them typed by the column schemas in shared/schemas.toml.
+#
+#   Excel workbooks are loaded once beforehand (loading costs the same either way), so only building the table is timed.
+#
+#   Synthetic QuantStudio (.xlsx and .txt) and Rotor-Gene exports are generated, so no real files are needed:
+#       python benchmarks/bench_schema.py --wells 384
+#
+#
+
+
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'shared'))) #look for custom dependencies in shared folder
+
+import argparse
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook as OpenpyxlWorkbook
+from workbook import Workbook
+from data_analysis import DataImporter
+
+reporters = ['CY5', 'FAM', 'NED', 'VIC']
+qs_columns = ['Well', 'Well Position', 'Sample Name', 'Reporter', 'CT', 'Cq Conf', 'Baseline End', 'Delta Rn (last cycle)', 'Quantity']
+
+
+##############################################################################################################################
+### Synthetic exports
+##############################################################################################################################
+
+def qs_rows(wells:int, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for well in range(1, wells+1):
+        for reporter in reporters:
+            ct = 'Undetermined' if rng.random() < 0.2 else round(float(rng.uniform(15, 35)), 3)
+            quantity = '' if rng.random() < 0.5 else round(float(rng.uniform(10, 1e6)), 2)
+            rows.append([well, f'{chr(65 + (well-1)//24)}{(well-1)%24 + 1}', f'Sample {well}', reporter, ct,
+                         round(float(rng.uniform(0, 1)), 3), int(rng.integers(3, 15)), round(float(rng.uniform(0, 1e5)), 1), quantity])
+    return rows
+
+
+def write_qs_xlsx(path:str, wells:int):
+    wb = OpenpyxlWorkbook()
+    ws = wb.active
+    ws.title = 'Results'
+    ws.append(['Experiment Name', 'Benchmark'])
+    for _ in range(42):
+        ws.append([])
+    ws.append(qs_columns)
+    for row in qs_rows(wells):
+        ws.append([None if value == '' else value for value in row])
+    wb.save(path)
+
+
+def write_qs_txt(path:str, wells:int):
+    lines = ['* Experiment Name = Benchmark', '', '[Results]', '\t'.join(qs_columns)]
+    lines += ['\t'.join(f'{value:,}' if isinstance(value, float) else str(value) for value in row) for row in qs_rows(wells)]
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n\n')
+
+
+def write_rgq_csv(path:str, wells:int, seed=0):
+    rng = np.random.default_rng(seed)
+    lines = ['Experiment Information,Benchmark'] + [f'Info {i},value {i}' for i in range(26)]
+    lines.append('No.,Colour,Name,Type,Ct,Ct Comment,Given Conc (copies/reaction),Calc Conc (copies/reaction)')
+    for well in range(1, wells+1):
+        ct = '' if rng.random() < 0.2 else f'{rng.uniform(15, 35):.2f}'
+        lines.append(f'{well},,Sample {well},Unknown,{ct},,,')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+##############################################################################################################################
+### Old and new reads
+##############################################################################################################################
+
+def load_workbook(path:str):
+    workbook = Workbook(path)
+    workbook.sheet_rows('Results')
+    return workbook
+
+
+def legacy_qs_xlsx(importer, workbook:Workbook):
+    results_table = importer.extract_results(workbook.read_sheet('Results', skiprows=43))
+    results_table['CT'] = results_table['CT'].replace(to_replace='Undetermined', value=importer.cq_cutoff)
+    for col in ['CT', 'Cq Conf', 'Baseline End']:
+        results_table[col] = results_table[col].apply(pd.to_numeric)
+    results_table['Quantity'] = results_table['Quantity'].fillna(0)
+    results_table['Quantity'] = results_table['Quantity'].apply(pd.to_numeric)
+    return results_table.rename(columns={'Well': 'Well No.', 'Well Position': 'Well'})
+
+
+def schema_qs_xlsx(importer, workbook:Workbook):
+    return workbook.read_table('Results', skiprows=43, schema=importer.schema('results', '.xlsx'))
+
+
+def legacy_qs_txt(importer, path:str):
+    with open(path, newline='') as f:
+        results_table = importer.csv_to_df(f, '\t', '[Results]')
+    results_table['CT'] = results_table['CT'].replace(to_replace='Undetermined', value=importer.cq_cutoff)
+    for col in ['CT', 'Cq Conf', 'Baseline End', 'Delta Rn (last cycle)', 'Quantity']:
+        results_table[col] = pd.to_numeric(results_table[col].str.replace(',', ''), errors='coerce')
+    results_table['Quantity'] = results_table['Quantity'].fillna(0)
+    return results_table.rename(columns={'Well': 'Well No.', 'Well Position': 'Well'})
+
+
+def schema_qs_txt(importer, path:str):
+    return importer.read_qs_txt(path)[1]
+
+
+def legacy_rgq(importer, path:str):
+    results_table = pd.read_csv(path, skiprows=27)
+    results_table['Ct'] = results_table['Ct'].fillna(importer.cq_cutoff)
+    return results_table.rename(columns={'No.': 'Well', 'Name': 'Sample Name', 'Ct Comment': 'Comments',
+                                         'Given Conc (copies/reaction)': 'Copies'})
+
+
+def schema_rgq(importer, path:str):
+    schema = importer.schema('results', '.csv', 'Rotor-Gene')
+    return schema.finish(pd.read_csv(path, skiprows=27, **schema.read_options()))
+
+
+##############################################################################################################################
+
+def measure(func, importer, source, repeat=5):
+    '''Get best-of-`repeat` wall time (ms), peak traced memory (MB), and size of resulting frame (MB).'''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = func(importer, source)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(importer, source)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best*1000, peak/1024**2, df.memory_usage(deep=True).sum()/1024**2
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark schema-typed reads against read-then-convert.')
+    parser.add_argument('--wells', type=int, default=384, help='wells per plate (default: 384)')
+    args = parser.parse_args()
+
+    importer = DataImporter(machine_type='QuantStudio 5')
+    folder = tempfile.mkdtemp()
+    cases = [('QuantStudio .xlsx', write_qs_xlsx, 'plate.xlsx', load_workbook, legacy_qs_xlsx, schema_qs_xlsx),
+             ('QuantStudio .txt', write_qs_txt, 'plate.txt', str, legacy_qs_txt, schema_qs_txt),
+             ('Rotor-Gene .csv', write_rgq_csv, 'channel.csv', str, legacy_rgq, schema_rgq)]
+
+    print(f'{args.wells} wells per plate ({len(reporters)} reporters for QuantStudio)')
+    print(f"{'file':<20}{'read':<8}{'time (ms)':>10}{'peak (MB)':>11}{'frame (MB)':>12}")
+    for name, write, filename, load, legacy, typed in cases:
+        path = os.path.join(folder, filename)
+        write(path, args.wells)
+        source = load(path)
+        for label, func in [('old', legacy), ('schema', typed)]:
+            ms, peak, size = measure(func, importer, source)
+            print(f'{name:<20}{label:<8}{ms:>10.2f}{peak:>11.2f}{size:>12.3f}')
+
+
+if __name__ == '__main__':
+    main()
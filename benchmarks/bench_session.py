@@ -0,0 +1,101 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   Benchmark: per-plate overhead of analyzing many small plates, with and without an analysis session (shared/session.py).
+#
+#   "cold" clears everything a session keeps before each plate - assay and schema configuration, column names, report
+#   stylesheet and decoded logo - as when every plate set itself up; "session" keeps them. Both run the full import -> analyze ->
+#   export -> PDF chain on the same 8-well plate, so the difference is the setup cost paid again by every plate.
+#   The fixed costs themselves are also timed, one by one.
+#
+#   Run from the repo folder:
+#       python benchmarks/bench_session.py
+#
+#
+
+
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'shared'))) #look for custom dependencies in shared folder
+
+import tempfile
+import time
+import tomli
+from reportlab.lib import utils
+from reportlab.lib.styles import getSampleStyleSheet
+import data_analysis
+import reportbuilder
+from session import AnalysisSession
+from schema import load_schemas
+from synthetic import SyntheticPlate
+
+repo = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+shared = os.path.join(repo, 'shared')
+
+
+def load_config(division:str):
+    with open(os.path.join(repo, division, 'config.toml'), mode='rb') as f:
+        return tomli.load(f)
+
+
+def forget():
+    '''Drop everything kept between plates.'''
+    data_analysis.load_assays.cache_clear()
+    load_schemas.cache_clear()
+    data_analysis.column_names.cache_clear()
+    reportbuilder.sample_styles = None
+    reportbuilder.logo = None
+
+
+def run_plate(session:AnalysisSession, filepath:str, pdf:bool):
+    importer = session.importer(filepath)
+    importer.parse()
+    exporter = session.exporter(importer, session.analyzer(importer))
+    exporter.export()
+    if pdf:
+        session.report(exporter)
+
+
+def per_plate(filepath:str, config:dict, assay:str, machine_type:str, plates:int, cold:bool, pdf:bool):
+    '''Mean seconds per plate.'''
+    session = AnalysisSession(assay, machine_type, config)
+    run_plate(session, filepath, pdf) #warm up imports
+    start = time.perf_counter()
+    for _ in range(plates):
+        if cold:
+            forget()
+            session = AnalysisSession(assay, machine_type, config)
+        run_plate(session, filepath, pdf)
+    return (time.perf_counter() - start) / plates
+
+
+def best_time(function, repeat=20):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == '__main__':
+    logo = os.path.join(shared, 'assets', 'aldatulogo_icon.gif')
+    def read_assays():
+        with open(os.path.join(shared, 'assays.toml'), mode='rb') as f:
+            tomli.load(f)
+    print('fixed costs, paid once per session')
+    for name, function in (('assays.toml', read_assays),
+                           ('stylesheet', getSampleStyleSheet),
+                           ('logo', lambda: utils.ImageReader(logo).getRGBData())):
+        print(f'  {name:<12} {best_time(function)*1000:7.2f} ms')
+
+    print(f"\n{'case':<28} {'cold ms':>8} {'session ms':>11} {'saved ms':>9}")
+    with tempfile.TemporaryDirectory() as folder:
+        for assay, machine_type, ext in (('PANDAA LASV', 'QuantStudio 5', '.xlsx'), ('076V 184VI', 'Mic', '.csv')):
+            plate = SyntheticPlate(assay, wells=8)
+            filepath = plate.write(folder, machine_type, ext)
+            for pdf in (False, True):
+                cold = per_plate(filepath, load_config(plate.division), assay, machine_type, 30, cold=True, pdf=pdf)
+                warm = per_plate(filepath, load_config(plate.division), assay, machine_type, 30, cold=False, pdf=pdf)
+                name = f"{machine_type} {ext}{' + pdf' if pdf else ''}"
+                print(f'{name:<28} {cold*1000:8.2f} {warm*1000:11.2f} {(cold-warm)*1000:9.2f}')
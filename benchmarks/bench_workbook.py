@@ -0,0 +1,73 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   Compare the time and peak memory of reading Excel results files the old way (one pd.read_excel call per sheet/range)
+#   with the single-pass Workbook loader in shared/workbook.py.
+#
+#   Run from the repo folder, passing one or more real QuantStudio or Mic exports:
+#       python benchmarks/bench_workbook.py "exports/2024-01-17 QS3.xlsx" "exports/2024-02-02 Mic.xlsx"
+#
+#
+
+
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'shared'))) #look for custom dependencies in shared folder
+
+import time
+import tracemalloc
+import pandas as pd
+from workbook import Workbook
+
+
+def legacy_reads(filepath:str):
+    '''Reads performed by DataImporter before the Workbook loader existed.'''
+    sheetnames = pd.ExcelFile(filepath).sheet_names
+    if 'Results' in sheetnames: #QuantStudio
+        pd.read_excel(filepath, sheet_name='Results', skiprows=43)
+        pd.read_excel(filepath, sheet_name='Results', usecols='A:B')
+    else: #Mic
+        pd.read_excel(filepath, sheet_name='General Information', usecols='A:B')
+        pd.read_excel(filepath, sheet_name='Samples')
+        for tab in sheetnames:
+            if 'Result' in tab and 'Absolute' not in tab:
+                pd.read_excel(filepath, sheet_name=tab, skiprows=32)
+
+
+def workbook_reads(filepath:str):
+    '''The same reads, served from a single in-memory Workbook.'''
+    workbook = Workbook(filepath)
+    if 'Results' in workbook.sheet_names: #QuantStudio
+        workbook.read_sheet('Results', skiprows=43)
+        workbook.read_sheet('Results', usecols='A:B')
+    else: #Mic
+        workbook.read_sheet('General Information', usecols='A:B')
+        workbook.read_sheet('Samples')
+        for tab in workbook.sheet_names:
+            if 'Result' in tab and 'Absolute' not in tab:
+                workbook.read_sheet(tab, skiprows=32)
+    workbook.close()
+
+
+def measure(func, filepath:str, repeat=3):
+    '''Get best-of-`repeat` wall time (s) and peak traced memory (MB) for reading one file.'''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(filepath)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(filepath)
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return best, peak
+
+
+if __name__ == '__main__':
+    print(f"{'file':<40} {'legacy s':>9} {'single s':>9} {'saved s':>8} {'legacy MB':>10} {'single MB':>10}")
+    for filepath in sys.argv[1:]:
+        legacy_time, legacy_peak = measure(legacy_reads, filepath)
+        single_time, single_peak = measure(workbook_reads, filepath)
+        print(f'{os.path.basename(filepath)[:40]:<40} {legacy_time:9.3f} {single_time:9.3f} {legacy_time-single_time:8.3f} '
+              f'{legacy_peak:10.1f} {single_peak:10.1f}')
@@ -0,0 +1,133 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   Load test of the analysis service (shared/service.py): many clients upload synthetic plates at the same time, and
+#   request latency (p50, p90, p99, max), throughput and turned-away requests (503) are reported.
+#
+#   Without --url, a service is started in this process on a free port, with --workers and --queue-size; with --url, an
+#   already running service is tested. The first request is reported on its own - it builds the assay's runner.
+#
+#   Run from the repo folder:
+#       python benchmarks/load_test.py --requests 200 --concurrency 8 --workers 2 --queue-size 8
+#       python benchmarks/load_test.py --url http://127.0.0.1:8765 --machine Mic --format .csv --assay "076V 184VI"
+#
+#
+
+
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'shared'))) #look for custom dependencies in shared folder
+
+import argparse
+import json
+import tempfile
+import threading
+import time
+import http.client
+from urllib.parse import urlencode, urlsplit
+import numpy as np
+import tomli
+from synthetic import SyntheticPlate
+
+repo = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def start_service(workers:int, queue_size:int):
+    '''Start a service in this process, on a free port; returns it and its URL.'''
+    from service import AnalysisService, AssayRegistry
+
+    tool_configs = []
+    for division in ('hiv', 'vhf'):
+        with open(os.path.join(repo, division, 'config.toml'), mode='rb') as f:
+            tool_configs.append(tomli.load(f))
+    service = AnalysisService(AssayRegistry(tool_configs), workers=workers, queue_size=queue_size, log=lambda line: None)
+    host, port = service.start(port=0)
+    return service, f'http://{host}:{port}'
+
+
+def client(url:str, uploads:list, count:int, latencies:list, statuses:dict, lock:threading.Lock):
+    '''Send `count` requests over one keep-alive connection, recording each latency and status.'''
+    address = urlsplit(url)
+    connection = http.client.HTTPConnection(address.hostname, address.port, timeout=600)
+    for i in range(count):
+        path, data = uploads[i % len(uploads)]
+        start = time.perf_counter()
+        try:
+            connection.request('POST', path, body=data, headers={'Content-Type': 'application/octet-stream'})
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException): #e.g. connection closed - reconnect for the next request
+            connection.close()
+            connection = http.client.HTTPConnection(address.hostname, address.port, timeout=600)
+            status = 'error'
+        with lock:
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+    connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the PANDAA analysis service.')
+    parser.add_argument('--url', help='running service to test (default: start one in this process)')
+    parser.add_argument('--assay', default='PANDAA LASV', help='assay of uploaded plates (default: PANDAA LASV)')
+    parser.add_argument('--machine', default='QuantStudio 5', help='machine of uploaded plates (default: QuantStudio 5)')
+    parser.add_argument('--format', default='.xlsx', help='export format of uploaded plates (default: .xlsx)')
+    parser.add_argument('--wells', type=int, default=96, help='wells per plate (default: 96)')
+    parser.add_argument('--plates', type=int, default=8, help='different plates to upload, in turn (default: 8)')
+    parser.add_argument('--requests', type=int, default=100, help='total requests (default: 100)')
+    parser.add_argument('--concurrency', type=int, default=8, help='clients sending at the same time (default: 8)')
+    parser.add_argument('--workers', type=int, default=2, help='workers of an in-process service (default: 2)')
+    parser.add_argument('--queue-size', type=int, default=8, help='queue size of an in-process service (default: 8)')
+    parser.add_argument('--out', help='save results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    uploads = []
+    with tempfile.TemporaryDirectory() as folder:
+        for seed in range(args.plates):
+            filepath = SyntheticPlate(args.assay, wells=args.wells, seed=seed).write(folder, args.machine, args.format)
+            with open(filepath, 'rb') as f:
+                query = urlencode({'assay': args.assay, 'machine': args.machine, 'filename': os.path.basename(filepath)})
+                uploads.append((f'/analyze?{query}', f.read()))
+
+    service, url = start_service(args.workers, args.queue_size) if args.url is None else (None, args.url)
+    try:
+        first, statuses = [], {}
+        client(url, uploads, 1, first, statuses, threading.Lock()) #cold: builds the runner
+
+        latencies, statuses, lock = [], {}, threading.Lock()
+        per_client = [args.requests // args.concurrency + (i < args.requests % args.concurrency) for i in range(args.concurrency)]
+        threads = [threading.Thread(target=client, args=(url, uploads, count, latencies, statuses, lock)) for count in per_client]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        if service is not None:
+            service.shutdown()
+
+    ms = np.array(latencies) * 1000
+    results = {'url': url, 'assay': args.assay, 'machine': args.machine, 'format': args.format, 'wells': args.wells,
+               'requests': args.requests, 'concurrency': args.concurrency,
+               'first_ms': round(first[0]*1000, 1) if first else None,
+               'statuses': {str(status): count for status, count in statuses.items()},
+               'elapsed': round(elapsed, 3), 'plates_per_second': round(len(latencies) / elapsed, 2) if elapsed else None,
+               'latency_ms': {name: round(float(np.percentile(ms, q)), 1) if len(ms) else None
+                              for name, q in (('p50', 50), ('p90', 90), ('p99', 99), ('max', 100))}}
+
+    print(f"{args.requests} requests, {args.concurrency} clients, {args.machine} {args.format} {args.wells} wells -> {url}")
+    print(f"  first request  {results['first_ms']} ms")
+    print(f"  statuses       {results['statuses']}")
+    print(f"  throughput     {results['plates_per_second']} plates/s over {results['elapsed']} s")
+    print('  latency        ' + '  '.join(f'{name} {value} ms' for name, value in results['latency_ms'].items()))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
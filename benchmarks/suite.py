@@ -0,0 +1,162 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   Benchmark suite: parse, analyze, export and PDF times (and peak memory) of every supported export format, on
+#   synthetic plates (shared/synthetic.py) - so releases can be compared, and regressions caught, without real runs.
+#
+#   Cases are every machine and export format, for an HIV and a VHF assay, on 96- and 384-well plates. Each case runs
+#   the same importer -> analyzer -> exporter -> report chain as shared/batch.py:
+#     - times are the best of `--repeat` runs, per stage
+#     - peak memory is traced in one extra run (tracing slows Python down, so it is never timed); it is the peak of all
+#       traced memory during the stage, including objects kept from earlier stages
+#   A stage that fails is recorded with its error, and the next case runs. Rotor-Gene HIV cases are skipped: Rotor-Gene
+#   exports have no quantities, which HIV analysis needs.
+#
+#   Results are saved as JSON (environment, versions, and per case: status, file size, seconds and peak MB per stage);
+#   pass an earlier results file to --compare to print the change per case and stage.
+#
+#   Run from the repo folder:
+#       python benchmarks/suite.py --out bench-1.0.0.json
+#       python benchmarks/suite.py --out bench-new.json --compare bench-1.0.0.json
+#
+#
+
+
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'shared'))) #look for custom dependencies in shared folder
+
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+import tomli
+from synthetic import SyntheticPlate, formats, machine_family
+from batch import BatchRunner
+
+repo = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+machines = ['QuantStudio 5', 'Mic', 'Rotor-Gene']
+assays = ['076V 184VI', 'PANDAA Ebola + Marburg']
+stages = ['parse', 'analyze', 'export', 'pdf']
+
+
+def load_config(division:str):
+    with open(os.path.join(repo, division, 'config.toml'), mode='rb') as f:
+        return tomli.load(f)
+
+
+def environment():
+    '''Versions of everything that affects the results.'''
+    import numpy, pandas, openpyxl, reportlab
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError): #not a git checkout
+        commit = None
+    return {'commit': commit,
+            'tools': {division: load_config(division)['info']['version'] for division in ('hiv', 'vhf')},
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'packages': {module.__name__: module.__version__ for module in (numpy, pandas, openpyxl, reportlab)}}
+
+
+def run_case(folder:str, assay:str, machine_type:str, ext:str, wells:int, repeat:int):
+    '''Write a synthetic plate, then time (and trace peak memory of) every stage of its analysis.'''
+    plate = SyntheticPlate(assay, wells=wells)
+    case = {'name': f'{machine_type} {ext} {plate.division} {wells}',
+            'machine': machine_type, 'format': ext, 'assay': assay, 'division': plate.division, 'wells': wells,
+            'status': 'ok', 'error': None, 'file_bytes': None, 'seconds': {}, 'peak_mb': {}}
+    if machine_family(machine_type) == 'Rotor-Gene' and plate.division == 'hiv':
+        case['status'] = 'skipped'
+        return case
+
+    written = plate.write(os.path.join(folder, case['name']), machine_type, ext)
+    case['file_bytes'] = sum(os.path.getsize(filepath) for filepath in (written if isinstance(written, list) else [written]))
+    runner = BatchRunner(assay, machine_type, load_config(plate.division), create_pdf=True)
+
+    for _ in range(repeat):
+        record = runner.analyze(written)
+        if record['status'] != 'ok':
+            case['status'], case['error'] = record['status'], record['error']
+        for stage in stages:
+            if stage in record['timings']:
+                case['seconds'][stage] = min(case['seconds'].get(stage, float('inf')), record['timings'][stage])
+
+    tracemalloc.start()
+    record = runner.analyze(written)
+    tracemalloc.stop()
+    case['peak_mb'] = {stage: peak/1024**2 for stage, peak in record['peak_memory'].items()}
+    return case
+
+
+def run_suite(wells:list, repeat:int, folder:str):
+    results = {'suite': 'pandaa benchmarks', 'suite_version': 1,
+               'created': datetime.datetime.now().isoformat(timespec='seconds'),
+               'environment': environment(),
+               'repeat': repeat,
+               'cases': []}
+    for assay in assays:
+        for machine_type in machines:
+            for ext in formats[machine_family(machine_type)]:
+                for n in wells:
+                    case = run_case(folder, assay, machine_type, ext, n, repeat)
+                    print(format_case(case), flush=True)
+                    results['cases'].append(case)
+    return results
+
+
+def format_case(case:dict):
+    if case['status'] == 'skipped':
+        return f"{case['name']:<28} skipped"
+    times = ''.join(f"{case['seconds'][stage]*1000:>11.1f}" if stage in case['seconds'] else f"{'-':>11}" for stage in stages)
+    peak = max(case['peak_mb'].values(), default=0)
+    line = f"{case['name']:<28}{times}{peak:>9.1f}"
+    return line + (f"  FAILED {case['error']}" if case['error'] else '')
+
+
+def compare(old:dict, new:dict):
+    '''Format the change in time and peak memory of every stage, for cases in both results.'''
+    old_cases = {case['name']: case for case in old['cases']}
+    lines = [f"compared with {old['environment']['commit'] or 'unknown commit'} ({old['created']}) - new/old"]
+    lines.append(f"{'case':<28}" + ''.join(f'{stage:>9}' for stage in stages) + f"{'peak MB':>9}")
+    for case in new['cases']:
+        before = old_cases.get(case['name'])
+        if before is None or case['status'] == 'skipped':
+            continue
+        ratios = []
+        for stage in stages:
+            if stage in case['seconds'] and before['seconds'].get(stage):
+                ratios.append(f"{case['seconds'][stage]/before['seconds'][stage]:>8.2f}x")
+            else:
+                ratios.append(f"{'-':>9}")
+        old_peak, new_peak = max(before['peak_mb'].values(), default=0), max(case['peak_mb'].values(), default=0)
+        ratios.append(f'{new_peak/old_peak:>8.2f}x' if old_peak else f"{'-':>9}")
+        lines.append(f"{case['name']:<28}" + ''.join(ratios))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time every analysis stage, for every supported export format.')
+    parser.add_argument('--wells', type=int, nargs='+', default=[96, 384], help='plate sizes (default: 96 384)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case; the best is kept (default: 3)')
+    parser.add_argument('--out', help='save results as JSON to this file')
+    parser.add_argument('--compare', help='earlier results file to compare with')
+    args = parser.parse_args()
+
+    print(f"{'case':<28}" + ''.join(f'{stage + " ms":>11}' for stage in stages) + f"{'peak MB':>9}")
+    with tempfile.TemporaryDirectory() as folder:
+        results = run_suite(args.wells, args.repeat, folder)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print('\n' + compare(json.load(f), results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   This module contains the ResultsArchive class, a local columnar dataset of every analyzed plate.
+#
+#   Each run otherwise only leaves a '... - Summary.csv' next to its raw results file, so questions across runs
+#   ("all 184VI positives on QuantStudio 5 last quarter") meant finding and re-parsing thousands of CSVs. When DataExporter
+#   is given an archive, it also appends the plate here, as Parquet files partitioned by assay, machine and run date:
+#
+#       <archive>/assay=076V%20184VI/machine=QuantStudio%205/run_date=2026-07-14/<plate id>-0.parquet
+#
+#   Rows are well-level results - one row per well and target (Cq, Cq Conf, dRn, copies, DRM percentage, call, result),
+#   with the run header (as JSON) and source file of the plate. Exporting the same plate again replaces its rows - its earlier
+#   files are looked for in the partition being written, and in partitions a query for its id finds (see `plate_run_dates`),
+#   so adding a plate doesn't get slower as the archive grows.
+#
+#   query() only opens the partitions and row groups that can match its filters (predicate pushdown), so questions like
+#   the one above are answered in milliseconds. From the command line (run from the repo folder):
+#       python shared/archive.py archive/ --assay "076V 184VI" --machine "QuantStudio 5" --target 184VI --call Positive --since 2026-07-01
+#
+#
+
+
+##############################################################################################################################
+### Imports
+##############################################################################################################################
+
+import os, sys
+sys.path.insert(0, os.path.dirname(__file__)) #look for custom dependencies in shared folder
+
+import argparse #command-line options
+import datetime #run dates
+import glob #finding a plate's earlier files
+import hashlib #plate ids
+import json #run header storage
+import urllib.parse #partition folder names
+import numpy as np
+import pandas as pd #file and data handling
+
+
+##############################################################################################################################
+### Run dates
+##############################################################################################################################
+
+# header fields holding the run date, most preferred first (QuantStudio, Mic, Rotor-Gene exports name them differently)
+run_date_fields = ('Run End', 'Run Start', 'Date')
+
+
+def header_fields(header):
+    '''Get (name, value) pairs from a run header: rows of name, value cells, or QuantStudio .txt rows '* name = value'.'''
+    pairs = []
+    for row in header if isinstance(header, list) else []:
+        cells = [str(cell) for cell in row]
+        if cells and cells[0].lstrip().startswith('*') and '=' in cells[0]:
+            name, value = ','.join(cells).split('=', 1) #rejoin values the header's csv reader split at commas
+            pairs.append((name.strip(' *'), value.strip()))
+        elif len(cells) > 1:
+            pairs.append((cells[0], cells[1]))
+    return pairs
+
+
+def run_date(header, source=None):
+    '''Get the date a plate was run (as 'YYYY-MM-DD') from its header; falls back to the source file's modification date, then today.'''
+    from dateutil import parser as date_parser #installed with pandas
+
+    pairs = header_fields(header)
+    for field in run_date_fields:
+        for name, value in pairs:
+            if field.lower() in name.lower() and value.strip():
+                try:
+                    return date_parser.parse(value, fuzzy=True, ignoretz=True).date().isoformat()
+                except (ValueError, OverflowError): #not a date - keep looking
+                    continue
+
+    try:
+        return datetime.date.fromtimestamp(os.path.getmtime(source)).isoformat()
+    except (OSError, TypeError, ValueError): #no source file (e.g. file object)
+        return datetime.date.today().isoformat()
+
+
+##############################################################################################################################
+### Archive
+##############################################################################################################################
+
+class ResultsArchive:
+    '''Local Parquet dataset of analyzed plates, partitioned by assay, machine and run date.'''
+
+    partition_columns = ['assay', 'machine', 'run_date']
+
+    def __init__(self, directory:str):
+        '''
+        Args:
+            directory (str): folder holding the dataset; created if it doesn't exist
+        '''
+        import pyarrow as pa #only needed when an archive is used
+
+        self.directory = directory
+        self.partitioning = self.make_partitioning()
+        self.schema = pa.schema([('plate', pa.string()), ('source', pa.string()), ('division', pa.string()),
+                                 ('well', pa.string()), ('sample_name', pa.string()),
+                                 ('fluor', pa.string()), ('target', pa.string()),
+                                 ('cq', pa.float64()), ('cq_conf', pa.float64()), ('drn', pa.float64()),
+                                 ('copies', pa.float64()), ('drm_percentage', pa.float64()),
+                                 ('call', pa.string()), ('result', pa.string()),
+                                 ('header', pa.string()), ('archived_at', pa.timestamp('s'))]
+                                + [(column, pa.string()) for column in self.partition_columns])
+        os.makedirs(self.directory, exist_ok=True)
+
+
+    def make_partitioning(self):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        return ds.HivePartitioning(pa.schema([(column, pa.string()) for column in self.partition_columns]))
+
+
+    def plate_id(self, source, assay:str, machine_type:str):
+        '''Stable id of a plate, so that exporting it again replaces its rows.'''
+        name = source if isinstance(source, str) else getattr(source, 'name', repr(source))
+        return hashlib.sha1(json.dumps([os.path.abspath(name), assay, machine_type]).encode()).hexdigest()[:16]
+
+
+    def partition_directory(self, **values):
+        '''Folder of a partition (or, given only leading partition columns, of every partition under it), named as pyarrow
+           names them: column=value, with values percent-encoded.'''
+        names = [f'{column}={urllib.parse.quote(values[column], safe="")}' for column in self.partition_columns if column in values]
+        return os.path.join(self.directory, *names)
+
+
+    def plate_run_dates(self, plate:str, assay:str, machine_type:str):
+        '''Get the run dates of partitions holding rows of a plate.
+
+           A plate's id includes its assay and machine, so only that assay and machine's partitions are looked in, and the
+           filter on `plate` is pushed down - only row groups whose statistics can hold the plate are read.
+        '''
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        folder = self.partition_directory(assay=assay, machine=machine_type)
+        if not os.path.isdir(folder):
+            return set()
+        dataset = ds.dataset(folder, format='parquet', partitioning=ds.HivePartitioning(pa.schema([('run_date', pa.string())])))
+        return set(dataset.to_table(columns=['run_date'], filter=ds.field('plate') == plate).column('run_date').to_pylist())
+
+
+    def rows(self, results:pd.DataFrame, reporter_dict:dict):
+        '''Turn a wide analyzed results frame (one row per well) into columns of well-level rows, one per well and target.'''
+        wells = len(results)
+        fluors = list(reporter_dict)
+        targets = [reporter_dict[fluor] for fluor in fluors]
+
+        def stacked(column_names:list):
+            '''One column per target, stacked in target order; missing columns are blank.'''
+            return np.concatenate([results[name].to_numpy(dtype=object) if name in results else np.full(wells, None)
+                                   for name in column_names])
+
+        def tiled(column_name:str):
+            '''Well-level column, repeated for every target.'''
+            return stacked([column_name]*len(fluors))
+
+        def numbers(values):
+            return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=float)
+
+        def labels(values):
+            return [None if pd.isna(value) else str(value) for value in values]
+
+        return {'well': labels(tiled('Well')),
+                'sample_name': labels(tiled('Sample Name')),
+                'fluor': np.repeat(fluors, wells).tolist(),
+                'target': np.repeat(targets, wells).tolist(),
+                'cq': numbers(stacked([f'{fluor} CT' for fluor in fluors])),
+                'cq_conf': numbers(stacked([f'{fluor} Cq Conf' for fluor in fluors])),
+                'drn': numbers(stacked([f'{fluor} dRn' for fluor in fluors])),
+                'copies': numbers(stacked([f'{fluor} Quantity' for fluor in fluors])),
+                'drm_percentage': numbers(stacked([f'{target} DRM Percentage' for target in targets])),
+                'call': labels(stacked([f'{target} Call' for target in targets])),
+                'result': labels(tiled('Result'))}
+
+
+    def append(self, results:pd.DataFrame, header, assay:str, machine_type:str, reporter_dict:dict, division=None, source=None):
+        '''Add an analyzed plate (or replace it, if it was archived before); returns its plate id.
+
+        Args:
+            results (pd.DataFrame): analyzed results, as in DataAnalyzer.df (before export rounding)
+            header (list or str): run header, as in DataImporter.head
+            assay, machine_type (str): partition values
+            reporter_dict (dict): fluorophore -> target, as in DataImporter.reporter_dict
+            division (str): 'hiv' or 'vhf'
+            source (str): results file the plate came from
+        '''
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        plate = self.plate_id(source, assay, machine_type)
+        columns = self.rows(results, reporter_dict)
+        n_rows = len(columns['well'])
+        constants = {'plate': plate, 'division': division, 'header': json.dumps(header),
+                     'source': source if isinstance(source, str) else getattr(source, 'name', None),
+                     'archived_at': datetime.datetime.now().replace(microsecond=0),
+                     'assay': assay, 'machine': machine_type, 'run_date': run_date(header, source)}
+        arrays = [pa.array(columns[field.name], type=field.type) if field.name in columns
+                  else pa.repeat(pa.scalar(constants[field.name], type=field.type), n_rows) #same value for every row - dictionary-encoded on disk
+                  for field in self.schema]
+        table = pa.Table.from_arrays(arrays, schema=self.schema)
+
+        # remove earlier copies of this plate - they may be in another partition, if e.g. its run date was read differently
+        for date in {constants['run_date']} | self.plate_run_dates(plate, assay, machine_type):
+            folder = self.partition_directory(assay=assay, machine=machine_type, run_date=date)
+            for path in glob.glob(os.path.join(glob.escape(folder), f'{plate}-*.parquet')):
+                os.remove(path)
+        ds.write_dataset(table, self.directory, format='parquet', partitioning=self.partitioning,
+                         basename_template=f'{plate}-{{i}}.parquet', existing_data_behavior='overwrite_or_ignore')
+        return plate
+
+
+    def dataset(self):
+        import pyarrow.dataset as ds
+        return ds.dataset(self.directory, format='parquet', partitioning=self.partitioning, schema=self.schema)
+
+
+    def filter(self, since:str=None, until:str=None, **equals):
+        '''Build a pyarrow filter expression.
+
+        Args:
+            since, until (str): first and last run dates to include ('YYYY-MM-DD', or anything with a .isoformat())
+            equals: column -> value; a list or tuple matches any of its values
+        '''
+        import pyarrow.dataset as ds
+
+        expression = None
+        conditions = []
+        if since is not None:
+            conditions.append(ds.field('run_date') >= getattr(since, 'isoformat', lambda: str(since))())
+        if until is not None:
+            conditions.append(ds.field('run_date') <= getattr(until, 'isoformat', lambda: str(until))())
+        for column, value in equals.items():
+            if value is None:
+                continue
+            if column not in self.schema.names:
+                raise ValueError(f'Unknown archive column: {column}')
+            if isinstance(value, (list, tuple, set)):
+                conditions.append(ds.field(column).isin(list(value)))
+            else:
+                conditions.append(ds.field(column) == value)
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+
+
+    def query(self, columns:list=None, since:str=None, until:str=None, **equals):
+        '''Get matching well-level rows as a dataframe - only partitions and row groups that can match are read.
+
+           e.g. `archive.query(assay='076V 184VI', machine='QuantStudio 5', target='184VI', call='Positive', since='2026-07-01')`
+        '''
+        if not os.listdir(self.directory): #nothing archived yet
+            return pd.DataFrame(columns=columns or self.schema.names)
+        table = self.dataset().to_table(columns=columns, filter=self.filter(since, until, **equals))
+        return table.to_pandas()
+
+
+    def plates(self, since:str=None, until:str=None, **equals):
+        '''Get one row per matching plate: id, source, partition values and run header.'''
+        columns = ['plate', 'source', 'assay', 'machine', 'run_date', 'header', 'archived_at']
+        return self.query(columns, since, until, **equals).drop_duplicates('plate').reset_index(drop=True)
+
+
+##############################################################################################################################
+### Command-line entry point
+##############################################################################################################################
+
+def main(argv=None):
+    '''Parse command-line options, then print matching archived results as CSV.'''
+    parser = argparse.ArgumentParser(description='Query archived PANDAA results.')
+    parser.add_argument('archive', help='archive folder')
+    for column in ['assay', 'machine', 'target', 'fluor', 'call', 'result', 'sample_name', 'well']:
+        parser.add_argument(f"--{column.replace('_', '-')}", dest=column, help=f'only rows with this {column.replace("_", " ")}')
+    parser.add_argument('--since', help='first run date to include (YYYY-MM-DD)')
+    parser.add_argument('--until', help='last run date to include (YYYY-MM-DD)')
+    parser.add_argument('--columns', help='comma-separated columns to output (default: all but header)')
+    args = vars(parser.parse_args(argv))
+
+    archive = ResultsArchive(args.pop('archive'))
+    columns = args.pop('columns')
+    columns = columns.split(',') if columns else [name for name in archive.schema.names if name != 'header']
+    archive.query(columns, **args).to_csv(sys.stdout, index=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
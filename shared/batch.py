@@ -0,0 +1,373 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   This script runs PANDAA data analysis on many results files at once, without the GUI.
+#
+#   Every results file (or, for Rotor-Gene, every set of per-channel files) is treated as one plate.
+#   Each plate goes through the same importer -> analyzer -> exporter chain used by hiv/main.py and vhf/main.py,
+#   so summary CSVs (and, optionally, PDFs) are written next to the raw results files, exactly as in the GUI.
+#
+#   A plate that fails does not stop the run; after all plates have been processed, a summary of timings and failures
+#   is printed and, optionally, saved as JSON.
+#
+#   Plates can be spread across a pool of worker processes (--workers); results are always reported in the same order
+#   as the plates were collected, regardless of which worker finishes first. Each worker builds its own runner once, so
+#   only the plate's file path(s) are sent with each task. If a worker process dies outright (e.g. out of memory, or a
+#   crash in a native library), the pool breaks and every unfinished plate's task fails with it: those plates are
+#   retried in a fresh pool, and the plates that may have been running when it broke are each retried alone, so that
+#   only the plate that kills its worker is reported as failed.
+#
+#   Example (run from the repo folder):
+#       python shared/batch.py --config hiv/config.toml --assay "076V 184VI" --machine "QuantStudio 5" exports/*.xlsx
+#
+#
+
+
+##############################################################################################################################
+### Imports
+##############################################################################################################################
+
+import os, sys
+sys.path.insert(0, os.path.dirname(__file__)) #look for custom dependencies in shared folder
+
+import argparse #command-line options
+import glob #expand file patterns
+import json #summary output
+import time #stage timings
+import tracemalloc #stage peak memory, when traced
+import tomli #for tool config
+from concurrent.futures import ProcessPoolExecutor #multi-plate mode
+from concurrent.futures.process import BrokenProcessPool
+
+import data_analysis
+from data_analysis import group_rgq_files #Rotor-Gene channel files -> runs, by name stem and run header
+import compact
+from session import AnalysisSession
+import instrument
+from platecache import PlateCache
+from archive import ResultsArchive
+
+
+##############################################################################################################################
+### File collection
+##############################################################################################################################
+
+# file extensions accepted for each machine - matches the file dialogs in gui.py
+machine_extensions = {'QuantStudio': ('.xlsx', '.xls', '.txt'),
+                      'Mic': ('.xlsx', '.xls', '.csv'),
+                      'Rotor-Gene': ('.csv',)}
+
+
+def get_extensions(machine_type:str):
+    '''Get allowable results file extensions for a given machine.'''
+    for machine in machine_extensions:
+        if machine in machine_type:
+            return machine_extensions[machine]
+    raise ValueError(f'Unsupported machine type: {machine_type}')
+
+
+def is_output(filepath:str):
+    '''Check if file was generated by this program (summary CSV or PDF), rather than by a qPCR machine.'''
+    return os.path.splitext(filepath)[0].endswith(' - Summary')
+
+
+def expand_paths(paths:list, extensions:tuple):
+    '''Expand directories and glob patterns into a sorted list of results files.'''
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = [os.path.join(path, name) for name in os.listdir(path)]
+        else:
+            candidates = glob.glob(path) or [path]
+        for candidate in candidates:
+            if (os.path.splitext(candidate)[1].lower() in extensions
+                and not is_output(candidate)
+                and candidate not in found):
+                found.append(candidate)
+    return sorted(found)
+
+
+##############################################################################################################################
+### Batch runner
+##############################################################################################################################
+
+def measure_peak(record:dict, stage):
+    '''If memory is being traced (e.g. by benchmarks), save peak traced memory (bytes) since the last call as `stage`'s peak.'''
+    if tracemalloc.is_tracing():
+        if stage is not None:
+            record['peak_memory'][stage] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+
+
+class BatchRunner:
+    '''Run importer -> analyzer -> exporter for many plates in one process.'''
+    def __init__(self, assay:str, machine_type:str, config:dict, create_pdf=None, workers=1, cache=None, keep_results=False,
+                       archive=None):
+        '''
+        Args:
+            assay (str): assay name, as defined in assays.toml
+            machine_type (str): qPCR machine used for all plates
+            config (dict): tool configuration, as found in hiv/config.toml or vhf/config.toml
+            create_pdf (bool): if given, overrides `create_pdf` setting in tool configuration
+            workers (int): number of worker processes; 1 analyzes plates one after another in this process,
+                           None uses one process per CPU
+            cache (PlateCache): if given, parsed plates are cached, and plates already in cache are not parsed again
+            keep_results (bool): if True, every plate's analyzed results are kept in `self.results` (source -> frame),
+                                 in compact form (see compact.py), e.g. for batch reports or trending
+            archive (ResultsArchive): if given, every analyzed plate is also added to this results archive
+        '''
+        self.assay = assay
+        self.machine_type = machine_type
+        self.config = config
+        self.info, self.intc, self.extc = config['info'], config['int'], config['ext']
+        self.division = self.intc['division']
+        self.create_pdf = self.extc['create_pdf'] if create_pdf is None else create_pdf
+        self.workers = workers
+        self.cache = cache
+        self.keep_results = keep_results
+        self.archive = archive
+        self.session = AnalysisSession(assay, machine_type, config, cache=cache, archive=archive) #set up once, for every plate
+
+        self.plates = []
+        self.records = []
+        self.results = {}
+        self.elapsed = 0
+
+
+    def collect(self, paths:list):
+        '''Find all results files in the given directories / glob patterns, and split them into plates.'''
+        filepaths = expand_paths(paths, get_extensions(self.machine_type))
+        self.records = []
+
+        if self.machine_type == 'Rotor-Gene':
+            self.plates, ungrouped = group_rgq_files(filepaths, self.reporter_dict())
+            for filepath in ungrouped:
+                self.records.append(self.new_record(filepath, 'failed', 'File name does not match any fluorophore in assay.'))
+        else:
+            self.plates = filepaths
+
+        return self.plates
+
+
+    def reporter_dict(self):
+        '''Get fluorophore -> target of the assay, as in DataImporter.reporter_dict.'''
+        return self.session.reporter_dict
+
+
+    def new_importer(self, filepath):
+        '''Create DataImporter for a single plate.'''
+        return self.session.importer(filepath)
+
+
+    def new_record(self, plate, status='ok', error=None):
+        '''Create summary record for a single plate.'''
+        return {'source': plate if isinstance(plate, str) else os.path.commonprefix(plate),
+                'files': [plate] if isinstance(plate, str) else list(plate),
+                'status': status,
+                'error': error,
+                'summary': None,
+                'summary_bytes': None,
+                'archive_error': None,
+                'pdf': None,
+                'timings': {},
+                'peak_memory': {}}
+
+
+    def analyze(self, plate):
+        '''Run the full analysis chain for a single plate, timing each stage.'''
+        record = self.new_record(plate)
+        timings = record['timings']
+        stage = 'parse'
+        measure_peak(record, None) #start measuring from here
+
+        try:
+            start = time.perf_counter()
+            importer = self.new_importer(plate)
+            importer.parse()
+            timings['parse'] = time.perf_counter() - start
+            measure_peak(record, 'parse')
+
+            stage = 'analyze'
+            start = time.perf_counter()
+            analyzer = self.session.analyzer(importer)
+            if self.keep_results: #before export, which rounds values in place
+                record['results'] = compact.compact(analyzer.df)
+            timings['analyze'] = time.perf_counter() - start
+            measure_peak(record, 'analyze')
+
+            stage = 'export'
+            start = time.perf_counter()
+            exporter = self.session.exporter(importer, analyzer)
+            exporter.export()
+            record['summary'] = exporter.dest_filepath
+            record['summary_bytes'] = exporter.bytes_written
+            record['archive_error'] = exporter.archive_error #plate is still analyzed - only the archive is missing it
+            timings['export'] = time.perf_counter() - start
+            measure_peak(record, 'export')
+
+            if self.create_pdf:
+                stage = 'pdf'
+                start = time.perf_counter()
+                record['pdf'] = self.create_report(exporter)
+                timings['pdf'] = time.perf_counter() - start
+                measure_peak(record, 'pdf')
+
+        except Exception as e: #PandaaError, or anything unexpected - only this plate fails
+            record['status'] = 'failed'
+            record['error'] = f'{stage}: {e}'
+
+        record['timings']['total'] = sum(timings.values())
+        return record
+
+
+    def create_report(self, exporter:data_analysis.DataExporter):
+        '''Make the exported results into a PDF, as in main().'''
+        return self.session.report(exporter)
+
+
+    def run(self):
+        '''Analyze all collected plates, either one after another or across a pool of worker processes.'''
+        start = time.perf_counter()
+        if self.workers == 1 or len(self.plates) < 2:
+            for plate in self.plates:
+                self.records.append(self.analyze(plate))
+        else:
+            self.records.extend(self.run_pool())
+        for record in self.records: #frames are kept apart from records, so that the summary stays JSON
+            if 'results' in record:
+                self.results[record['source']] = record.pop('results')
+        self.elapsed = time.perf_counter() - start
+        return self.records
+
+
+    def worker_settings(self):
+        '''Arguments for building an equivalent single-process runner in each worker.'''
+        return {'assay': self.assay, 'machine_type': self.machine_type, 'config': self.config, 'create_pdf': self.create_pdf,
+                'workers': 1, 'cache': self.cache, 'keep_results': self.keep_results, 'archive': self.archive}
+
+
+    def run_pool(self):
+        '''Analyze plates in worker processes, returning records in the same order as `self.plates`.'''
+        records = {}
+        pending = list(range(len(self.plates)))
+        while pending:
+            workers = min(self.workers or os.cpu_count() or 1, len(pending))
+            unfinished = self.run_in_pool(pending, workers, records)
+            # tasks are handed to workers in order, and at most `workers` + 1 are queued or running at a time - so only the
+            # first unfinished plates can have been running when the pool broke; the rest never started
+            suspects, pending = unfinished[:workers+1], unfinished[workers+1:]
+            for i in suspects:
+                if self.run_in_pool([i], 1, records): #broke again, on its own
+                    records[i] = self.new_record(self.plates[i], 'failed', 'worker: process terminated abruptly while analyzing this plate')
+        return [records[i] for i in range(len(self.plates))]
+
+
+    def run_in_pool(self, indices:list, workers:int, records:dict):
+        '''Analyze the plates at `indices` in a new pool, saving their records; returns indices of plates left unfinished
+           because a worker process died.'''
+        unfinished = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(type(self), self.worker_settings())) as pool:
+            futures = [(i, pool.submit(analyze_plate, self.plates[i])) for i in indices]
+            for i, future in futures:
+                try:
+                    records[i] = future.result()
+                except BrokenProcessPool:
+                    unfinished.append(i)
+                except Exception as e: #task couldn't be sent or returned (e.g. not picklable) - analyze() handles all other errors
+                    records[i] = self.new_record(self.plates[i], 'failed', f'worker: {e}')
+        return unfinished
+
+
+    def summary(self):
+        '''Get per-run summary of timings and failures.'''
+        failed = [record for record in self.records if record['status'] != 'ok']
+        stage_totals = {}
+        for record in self.records:
+            for stage, seconds in record['timings'].items():
+                stage_totals[stage] = stage_totals.get(stage, 0) + seconds
+
+        return {'assay': self.assay,
+                'machine_type': self.machine_type,
+                'plates': len(self.records),
+                'succeeded': len(self.records) - len(failed),
+                'failed': len(failed),
+                'elapsed': self.elapsed,
+                'stage_totals': stage_totals,
+                'records': self.records}
+
+
+worker_runner = None #runner of this worker process
+
+
+def init_worker(runner_class:type, settings:dict):
+    '''Build the runner of a worker process once, when the process starts.'''
+    global worker_runner
+    worker_runner = runner_class(**settings)
+
+
+def analyze_plate(plate):
+    '''Analyze a single plate in a worker process.'''
+    return worker_runner.analyze(plate)
+
+
+def format_summary(summary:dict):
+    '''Format run summary as human-readable text.'''
+    lines = [f"{summary['succeeded']} of {summary['plates']} plates analyzed in {summary['elapsed']:.2f} s "
+             f"({summary['assay']}, {summary['machine_type']})"]
+    for stage, seconds in summary['stage_totals'].items():
+        lines.append(f'  {stage:<8} {seconds:8.2f} s')
+    for record in summary['records']:
+        if record['status'] != 'ok':
+            lines.append(f"FAILED  {record['source']}\n        {record['error']}".replace('\n\n', ' '))
+        elif record.get('archive_error'):
+            lines.append(f"NOT ARCHIVED  {record['source']}\n        {record['archive_error']}".replace('\n\n', ' '))
+    return '\n'.join(lines)
+
+
+##############################################################################################################################
+### Command-line entry point
+##############################################################################################################################
+
+def main(argv=None):
+    '''Parse command-line options, then analyze every plate found.'''
+    parser = argparse.ArgumentParser(description='Analyze many PANDAA qPCR results files without the GUI.')
+    parser.add_argument('paths', nargs='+', help='results files, directories, or glob patterns')
+    parser.add_argument('--config', required=True, help='tool configuration file (hiv/config.toml or vhf/config.toml)')
+    parser.add_argument('--assay', required=True, help='assay name, as defined in shared/assays.toml')
+    parser.add_argument('--machine', required=True, help='qPCR machine used for all plates')
+    parser.add_argument('--pdf', action=argparse.BooleanOptionalAction, default=None, help='create PDF reports (default: create_pdf setting in config)')
+    parser.add_argument('--summary', help='save run summary as JSON to this file')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes (0 = one per CPU; default: 1)')
+    parser.add_argument('--cache', help='folder for cache of parsed plates; repeat analyses of the same files skip parsing')
+    parser.add_argument('--cache-size', type=int, default=500, help='maximum cache size, in MB (default: 500)')
+    parser.add_argument('--archive', help='folder of results archive; every analyzed plate is also added to it')
+    args = parser.parse_args(argv)
+
+    with open(args.config, mode='rb') as f: #get TOML configuration
+        config = tomli.load(f)
+
+    try:
+        runner = BatchRunner(assay=args.assay, machine_type=args.machine, config=config, create_pdf=args.pdf,
+                             workers=args.workers or None,
+                             cache=PlateCache(args.cache, max_bytes=args.cache_size*1024**2) if args.cache else None,
+                             archive=ResultsArchive(args.archive) if args.archive else None)
+    except data_analysis.PandaaError as e: #e.g. assay not in assays.toml
+        parser.error(str(e).replace('\n\n', ' '))
+    runner.collect(args.paths)
+    with instrument.span('batch', plates=len(runner.plates), workers=runner.workers):
+        runner.run()
+    summary = runner.summary()
+
+    print(format_summary(summary))
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    with instrument.profiled('batch'):
+        status = main()
+    sys.exit(status)
@@ -0,0 +1,99 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   This module converts standardized results frames (from DataImporter or DataAnalyzer) to and from a compact form,
+#   for holding many plates in memory at once (batch reports, trending).
+#
+#   Most of a plate's memory goes to object columns - one Python string per well for the well position, sample name and
+#   every call. In compact form:
+#     - QuantStudio well positions are a categorical on a single shared A1-P24 lookup (a 2-byte index per well);
+#       numbered Mic/Rotor-Gene wells are downcast to the smallest integer type
+#     - sample names, results and calls are categoricals, when values repeat (a categorical of all-unique names is
+#       bigger than the names themselves)
+#     - Cq, Cq Conf and dRn values are float32, but only for columns where the exported (rounded) values stay identical;
+#       other columns keep float64
+#
+#   DataExporter expands compact frames before exporting, so summary CSVs are byte-identical either way. Plates should be
+#   compacted after analysis: calls are made on full-precision values.
+#
+#
+
+
+##############################################################################################################################
+### Imports
+##############################################################################################################################
+
+import numpy as np
+import pandas as pd #file and data handling
+
+
+##############################################################################################################################
+
+# shared lookup of every well position on plates of up to 384 wells (A1, A2, ... P24) - one categorical dtype for all plates
+well_positions = [f'{row}{column}' for row in 'ABCDEFGHIJKLMNOP' for column in range(1, 25)]
+well_dtype = pd.CategoricalDtype(well_positions)
+
+# columns stored as float32, by name suffix - with the number of decimals DataExporter.roundvals rounds them to
+float32_decimals = {' CT': 1, ' Cq Conf': 3, ' dRn': 1}
+
+
+def is_label(name:str):
+    '''Check if column holds sample names, results or calls.'''
+    return name in ('Sample Name', 'Result') or name.endswith(' Call')
+
+
+def compact_column(name:str, column:pd.Series):
+    '''Get compact version of one column, or the column itself if it has no compact form.'''
+    if name == 'Well':
+        if column.dtype == object and column.isin(well_positions).all():
+            return column.astype(well_dtype)
+        if pd.api.types.is_integer_dtype(column.dtype):
+            return pd.to_numeric(column, downcast='integer')
+
+    elif is_label(name) and column.dtype == object and column.nunique() <= len(column) // 2:
+        try:
+            return column.astype('category')
+        except TypeError: #values can't be compared (e.g. mix of numbers and text) - keep as objects
+            return column
+
+    elif column.dtype == np.float64:
+        decimals = next((decimals for suffix, decimals in float32_decimals.items() if name.endswith(suffix)), None)
+        if decimals is not None:
+            narrow = column.astype(np.float32)
+            # exported values are rounded - only keep float32 if rounding gives exactly the same numbers
+            if np.array_equal(narrow.astype(np.float64).round(decimals).to_numpy(), column.round(decimals).to_numpy(), equal_nan=True):
+                return narrow
+
+    return column
+
+
+def compact(df:pd.DataFrame):
+    '''Get a compact copy of a standardized results frame.'''
+    result = pd.DataFrame({name: compact_column(name, df[name]) for name in df.columns}, index=df.index)
+    result.attrs = dict(df.attrs)
+    return result
+
+
+def is_compact(dtype):
+    return isinstance(dtype, pd.CategoricalDtype) or dtype in (np.float32, np.int8, np.int16, np.int32)
+
+
+def expand(df:pd.DataFrame):
+    '''Get a frame with standard column types back from a compact one; frames that aren't compact are returned as they are.'''
+    if not any(is_compact(dtype) for dtype in df.dtypes):
+        return df
+
+    columns = {}
+    for name in df.columns:
+        column = df[name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            column = column.astype(object)
+        elif column.dtype == np.float32:
+            column = column.astype(np.float64)
+        elif column.dtype in (np.int8, np.int16, np.int32):
+            column = column.astype(np.int64)
+        columns[name] = column
+    result = pd.DataFrame(columns, index=df.index)
+    result.attrs = dict(df.attrs)
+    return result
@@ -13,6 +13,8 @@
 #   This dataframe - identical, regardless of the qPCR machine the results file originally came from -
 #   is then used to generate a results file.
 #
+#   Nothing here shows a dialog or closes the program: results files are given as paths (or file objects), and problems
+#   are raised as PandaaError subclasses (see errors.py). The GUI tools choose files and show errors through gui.py.
 #
 #
 
@@ -25,18 +27,156 @@ import os, sys
 sys.path.insert(0, os.path.dirname(__file__)) #look for custom dependencies in shared folder
 
 import pandas as pd #file and data handling
-from tkinter import filedialog #prompt user to select results file
-import tkinter as tk #error message GUI
 import csv #text file parsing
-import itertools #for mic csv parsing
+import io #for reading results from in-memory buffers
 import os #for getting file extension
+import locale #header rows are written with the system's default encoding, as with open()
+import uuid #unique names for temporary results files
+import time #for timing results file writes
 import numpy as np #for least squares regression
 import tomli #for assay config
+import functools #assay config and column names are built once per process
+import itertools #Rotor-Gene headers are read from the first lines only
+import re #Rotor-Gene channel file names
+from concurrent.futures import ThreadPoolExecutor #Rotor-Gene channel files are read at the same time
 import linreg #to run this script natively, instead of in package context: remove "from . " from this line
+from errors import PandaaError, SelectionError, FormatError, FileAccessError #typed errors - shown to the user by gui.py
+from workbook import Workbook #reads each Excel file only once
+from sections import SectionIndex #reads each Mic CSV file only once
+from schema import Schema, load_schemas #column types, applied as results tables are read
+import compact #compact in-memory plates - expanded again before export
+import instrument #timing spans and profiling, when switched on (see instrument.py)
 
 pd.set_option('future.no_silent_downcasting', True)
 
 
+@functools.lru_cache(maxsize=None)
+def load_assays(config='assays.toml'):
+    '''Load assay definitions from a TOML file in the shared folder; each file is only read once. Don't modify the result.'''
+    with open(os.path.join(os.path.dirname(__file__), config), mode='rb') as f:
+        return tomli.load(f)
+
+
+class ColumnNames:
+    '''Names of the per-reporter results columns of one assay, on one machine - built once (see `column_names`).'''
+    def __init__(self, reporters:tuple, machine_type:str, division:str):
+        '''`reporters` is the assay's fluorophore -> target pairs, internal control first, as in `DataImporter.reporter_dict`.'''
+        self.reporter_dict = dict(reporters)
+        self.drm_reporters = list(self.reporter_dict)[1:] #first reporter is the internal control
+        self.ct = {fluor: f'{fluor} CT' for fluor in self.reporter_dict}
+        self.quantity = {fluor: f'{fluor} Quantity' for fluor in self.reporter_dict}
+        self.drm_percentage = {fluor: f'{self.reporter_dict[fluor]} DRM Percentage' for fluor in self.drm_reporters}
+        self.call = {fluor: f'{self.reporter_dict[fluor]} Call' for fluor in self.drm_reporters}
+
+        # analysis columns -> exported columns
+        self.export = {}
+        for fluor, target in self.reporter_dict.items():
+            self.export[f'{fluor} CT'] = f'{target} Cq'
+            if 'QuantStudio' in machine_type:
+                self.export[f'{fluor} Cq Conf'] = f'{target} Cq Conf'
+                self.export[f'{fluor} dRn'] = f'{target} dRn'
+            if division == 'hiv':
+                self.export[f'{fluor} Quantity'] = f'{target} Copies'
+
+
+    @functools.lru_cache(maxsize=None)
+    def kept(self, columns:tuple):
+        '''Exported columns kept for the given `export_columns` setting - 'Cq', 'dRn', 'Call' and 'DRM Percentage' stand for
+           that column of every reporter (DRM reporters only, for the last two).'''
+        kept = set()
+        for header in columns:
+            if 'Cq' in header and 'Cq Conf' not in header:
+                kept.update(f'{target} Cq' for target in self.reporter_dict.values())
+            elif 'dRn' in header:
+                kept.update(f'{target} dRn' for target in self.reporter_dict.values())
+            elif 'Call' in header:
+                kept.update(self.call.values())
+            elif 'DRM Percentage' in header:
+                kept.update(self.drm_percentage.values())
+            else:
+                kept.add(header)
+        return frozenset(kept)
+
+
+@functools.lru_cache(maxsize=None)
+def column_names(reporters:tuple, machine_type:str, division:str):
+    '''Get the (shared) column names of an assay - see `ColumnNames`.'''
+    return ColumnNames(reporters, machine_type, division)
+
+
+##############################################################################################################################
+### Rotor-Gene channel files
+##############################################################################################################################
+
+# Rotor-Gene exports one .csv file per channel, named after its fluorophore or target (e.g. `run 1 FAM.csv`, `run 1 VQ.csv`).
+# Files of the same run share the rest of their name (the stem) and their run header, apart from the channel.
+
+rgq_header_lines = 27 #results table starts on the next line
+
+
+@functools.lru_cache(maxsize=None)
+def channel_names(reporters:tuple):
+    '''Get a pattern matching channel file names of an assay, and the fluorophore each channel name (fluorophore or target)
+       stands for - so a file is matched in one search, rather than once per reporter.'''
+    names = {}
+    for fluor, target in reporters:
+        names.setdefault(fluor, fluor)
+        names.setdefault(target, fluor)
+    alternatives = '|'.join(re.escape(name) for name in sorted(names, key=len, reverse=True)) #longest first
+    return re.compile(f'({alternatives})\\.csv$'), names
+
+
+def match_channel(filepath:str, reporter_dict:dict):
+    '''Get the fluorophore of a channel file, and its name without the channel (the run's stem) - or (None, None).'''
+    pattern, names = channel_names(tuple(reporter_dict.items()))
+    match = pattern.search(filepath)
+    if match is None:
+        return None, None
+    return names[match.group(1)], filepath[:match.start()]
+
+
+def rgq_header(lines):
+    '''Get the run header (rows before the results table) from the lines of a channel file.'''
+    head = []
+    for row in csv.reader(itertools.islice(lines, rgq_header_lines)):
+        if 'Quantitative' in str(row):
+            break
+        head.append(row)
+    return head
+
+
+def rgq_run(header:list, reporter_dict:dict):
+    '''Identify the run a channel file belongs to from its header: every header row, without the channel's name.'''
+    channels = set(reporter_dict) | set(reporter_dict.values())
+    return tuple(tuple(cell for cell in row if cell not in channels) for row in header if row and row[0] != 'Channel')
+
+
+def group_rgq_files(filepaths:list, reporter_dict:dict):
+    '''Group Rotor-Gene channel files into runs, by name stem and run header.
+
+       Files with the same stem but different run headers (e.g. one channel exported again after a later run) are kept
+       apart, so they are never analyzed as one plate. A file that can't be read is grouped by its stem alone.
+
+    Returns:
+        groups (list): list of filepath lists, one per run
+        ungrouped (list): files that could not be matched to a channel
+    '''
+    groups = {}
+    ungrouped = []
+    for filepath in filepaths:
+        fluor, stem = match_channel(filepath, reporter_dict)
+        if fluor is None:
+            ungrouped.append(filepath)
+            continue
+        try:
+            with open(filepath, newline = '') as f:
+                run = rgq_run(rgq_header(f), reporter_dict)
+        except (OSError, UnicodeDecodeError, csv.Error): #e.g. still being written, or not a text file - parsing will tell
+            run = None
+        groups.setdefault((stem, run), []).append(filepath)
+    return [sorted(groups[key]) for key in sorted(groups, key=lambda key: (key[0], repr(key[1])))], ungrouped
+
+
 
 ##############################################################################################################################
 
@@ -45,8 +185,13 @@ class DataImporter:
     def __init__(self, cq_cutoff=35,
                  machine_type: str=None, assay: str=None,
                  division='vhf', drm_percentage=0.2,
-                 config='assays.toml'):
-        ''''''
+                 config='assays.toml',
+                 filepath=None, cache=None):
+        '''`filepath` is the results file: a path or file object (with a `name`, for its extension) - or, for Rotor-Gene,
+        a list of per-channel files. It can also be set after init, e.g. once the user has chosen a file (see gui.py).
+
+        If `cache` (a `platecache.PlateCache`) is given, parsed plates are saved to it, and files already in it are not parsed again.
+        '''
         # get user-provided parameters
         self.cq_cutoff = cq_cutoff
         self.machine_type = machine_type
@@ -54,6 +199,7 @@ class DataImporter:
         self.division = division
         self.drm_percentage = drm_percentage
         self.configpath = config
+        self.cache = cache
 
         # prepare for assay initialization
         self.reporter_dict = {}
@@ -61,43 +207,47 @@ class DataImporter:
         self.ic = None #internal control reporter
 
         # set other necessary parameters to None / blank, for now
-        self.filepath = None
+        self.filepath = filepath
         self.ext = None
         self.head = None
         self.results = None
         self.max_dRn_dict = {}
+        self.curves = {} #standard curve for each fluorophore (HIV Mic files only)
 
-        # initialize GUI, hide main window
-        self.root = tk.Tk()
-        self.root.withdraw()
-
-        # get assay config
-        with open(os.path.join(os.path.dirname(__file__), self.configpath), mode='rb') as f: #get TOML configuration
-            self.config = tomli.load(f)
+        # get assay config - read once per process, then shared by every importer
+        self.config = load_assays(self.configpath)
+        self.schemas = load_schemas() #column schemas of each machine's results tables
 
         
     ##############################################################################################################################
     ### Helper functions for data analysis - file to dataframe
     ##############################################################################################################################
 
+    def error(self, message:str, kind:type=FormatError):
+        '''Raise error of the given kind (see errors.py) - files that aren't what they should be, by default.'''
+        raise kind(message)
+
+
     def isblank(self, row:str):
         '''If string is blank, return True; otherwise, return False.'''
         return all(not field.strip() for field in row)
     
 
-    def csv_to_df(self, csv_file:list, csv_delim:str, results_flag:str):
+    @instrument.traced()
+    def csv_to_df(self, csv_file:list, csv_delim:str, results_flag:str=None, schema:Schema=None):
         '''
         Convert a CSV file into a DataFrame by skipping metadata and extracting relevant results.
 
         Args:
             csv_file (str): Path to the CSV file.
             csv_delim (str): Delimiter used in the CSV file.
-            results_flag (str): Flag to identify the start of the results section.
+            results_flag (str): Flag to identify the start of the results section. If None, results start at the first line.
+            schema (Schema): if given, columns are typed and renamed as the table is built.
 
         Returns:
             pd.DataFrame: Extracted results as a pandas DataFrame.
         '''
-        data_bool = False
+        data_bool = results_flag is None
         data_cleaned = []
         results_reader = csv.reader(csv_file, delimiter = csv_delim)
 
@@ -110,11 +260,14 @@ class DataImporter:
                 data_bool = True
 
         header = data_cleaned.pop(0)
+        if schema is not None:
+            return schema.frame(header, data_cleaned)
         results_table = pd.DataFrame(data_cleaned, columns = header) #first line of cleaned data is the header
 
         return results_table
     
 
+    @instrument.traced()
     def summarize(self, df_dict:dict):
         '''Combine multiple pandas dataframes into a single summary dataframe.'''
         first_loop = True
@@ -127,6 +280,8 @@ class DataImporter:
                 columns.append(f'{fluor} dRn')
             if self.division == 'hiv':
                 columns.append(f'{fluor} Quantity')
+                if first_loop and 'Assigned Quantity' in df_dict[fluor]: #standards' copy numbers, so that plates can be re-quantified later
+                    columns.append('Assigned Quantity')
             if not first_loop:
                 columns.pop(1)
 
@@ -134,9 +289,7 @@ class DataImporter:
                 try:
                     summary_table = df_dict[fluor].loc[:, columns]
                 except Exception as e:
-                    tk.messagebox.showerror(message='Incorrect file selected. Please try again.\n\n{}'.format(e))
-                    # close program
-                    raise SystemExit()
+                    self.error('Incorrect file selected. Please try again.\n\n{}'.format(e))
                 first_loop = False
             else:
                 summary_table = pd.merge(summary_table, df_dict[fluor].loc[:, columns], on='Well')
@@ -144,6 +297,45 @@ class DataImporter:
         return summary_table
     
 
+    def widen(self, long_table:pd.DataFrame, fluors:list, metrics:dict, shared:list, reporter='Reporter', key='Well'):
+        '''Reshape a long table (one row per well and reporter) into the standardized wide frame (one row per well) in one pass.
+
+        Columns are `key`, the `shared` columns (taken from the first fluor's rows), then `<fluor> <metric>` for each fluor
+        and metric, e.g. `FAM CT`. As when merging per-fluor tables on `key`, only wells found for every fluor are kept,
+        in the order of the first fluor's rows.
+
+        Args:
+            long_table (pd.DataFrame): long results table
+            fluors (list): reporters to include, in output order
+            metrics (dict): long table column -> name used in wide frame, e.g. `{'Delta Rn (last cycle)': 'dRn'}`
+            shared (list): columns that are the same for every reporter of a well, e.g. `['Sample Name']`
+        Returns:
+            wide (pd.DataFrame): wide frame
+            codes (np.ndarray): index of each long table row's reporter in `fluors` (-1 if not included) - for per-reporter stats
+        '''
+        try:
+            codes = pd.Categorical(long_table[reporter], categories=fluors).codes.astype(int)
+            well_codes, wells = pd.factorize(long_table[key])
+        except Exception as e:
+            self.error('Incorrect file selected. Please try again.\n\n{}'.format(e))
+
+        # rows[w, f] = position in long table of well w's row for fluor f (-1 if missing)
+        rows = np.full((len(wells), len(fluors)), -1)
+        included = codes >= 0
+        rows[well_codes[included], codes[included]] = np.flatnonzero(included)
+        rows = rows[(rows >= 0).all(axis=1)]
+        rows = rows[np.argsort(rows[:, 0], kind='stable')] #order of first fluor's rows
+
+        try:
+            wide = {column: long_table[column].to_numpy()[rows[:, 0]] for column in [key] + shared}
+            for i, fluor in enumerate(fluors):
+                for column, name in metrics.items():
+                    wide[f'{fluor} {name}'] = long_table[column].to_numpy()[rows[:, i]]
+        except Exception as e:
+            self.error('Incorrect file selected. Please try again.\n\n{}'.format(e))
+        return pd.DataFrame(wide), codes
+
+
     def extract_header(self, reader:csv.reader, flag: str=None, stop: str=None):
         '''
         Extract a header from a CSV reader object.
@@ -177,44 +369,29 @@ class DataImporter:
         return head
     
 
-    def select_file(self, filetypes: list, num_files = 1, extension: bool = True):
-        '''Prompt user to select one or more files.
-        
-        Args:
-            filetypes (tuple list): allowable file extensions
-            num_files (int): number of files expected
-            extension (bool): if True, returns file extension as string
+    def files_expected(self):
+        '''Number of results files a plate of this machine comes in - one per channel for Rotor-Gene.'''
+        return len(self.reporter_dict) if self.machine_type == 'Rotor-Gene' else 1
 
-        Returns:
-            selected filepath(s): as string or, if multiple, as a list of strings
-            (optional) file extension: as string
 
-        '''
-        if num_files > 1:
-            
-            title = 'Choose results files'
-            filepaths = filedialog.askopenfilenames(title=title, filetypes=filetypes)
-            ext = os.path.splitext(filepaths[0])[1]
-
-            if len(filepaths) != num_files:
-                tk.messagebox.showerror(message=f'''Incorrect number of files. Expected {num_files} files,
-but {len(filepaths)} were selected. Make sure files are not open in other programs.''')
-                # close program
-                raise SystemExit()
-            
-        else: #num_files <= 1
-            title = 'Choose results file'
-            filepaths = filedialog.askopenfilename(title=title, filetypes=filetypes)
-            ext = os.path.splitext(filepaths)[1]
-        
-        if not filepaths:
-            tk.messagebox.showerror(message='No file selected. Make sure file is not open in another program.')
-            raise SystemExit()
-        
-        if extension:
-             return filepaths, ext
-        else:
-            return filepaths
+    def source_name(self, source):
+        '''Get a filepath, or the name of a file object (if it has one).'''
+        return os.fspath(source) if isinstance(source, (str, os.PathLike)) else getattr(source, 'name', '')
+
+
+    def get_extension(self, source):
+        '''Get file extension of a filepath or, for file objects, of the file's name (if it has one).'''
+        name = source if isinstance(source, (str, os.PathLike)) else getattr(source, 'name', '')
+        return os.path.splitext(name)[1].lower()
+
+
+    def schema(self, table:str='results', ext:str='', machine_type:str=None):
+        '''Get the column schema of one of a machine's tables (see schemas.toml) - by default, of the selected machine.'''
+        machine_type = machine_type or self.machine_type
+        for machine, tables in self.schemas.items():
+            if machine in machine_type:
+                return Schema(tables[table], ext, self.cq_cutoff)
+        raise ValueError(f'No column schema for machine type: {machine_type}')
 
 
     def extract_results(self, df: pd.DataFrame):
@@ -250,9 +427,7 @@ but {len(filepaths)} were selected. Make sure files are not open in other progra
             self.ic = self.config[self.assay]["ic"]
         
         except Exception as e:
-            tk.messagebox.showerror(message='Invalid assay. Check assay input setting.\n\n{}: not defined'.format(e))
-            # close program
-            raise SystemExit()
+            self.error('Invalid assay. Check assay input setting.\n\n{}: not defined'.format(e), PandaaError)
         
         self.reporter_list = [key for key in self.reporter_dict]
 
@@ -261,162 +436,193 @@ but {len(filepaths)} were selected. Make sure files are not open in other progra
     ### QuantStudio - file to dataframe
     ##############################################################################################################################
 
+    def text_lines(self, source):
+        '''Iterate over the lines of a text results file, given a filepath, text file object, or binary buffer.'''
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, newline = '') as csvfile:
+                yield from csvfile
+        elif isinstance(source, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(source, 'mode', ''):
+            wrapper = io.TextIOWrapper(source, newline = '')
+            try:
+                yield from wrapper
+            finally:
+                wrapper.detach() #otherwise the caller's buffer is closed along with the wrapper
+        else: #text file object, e.g. io.StringIO
+            yield from source
+
+
+    def read_qs_txt(self, source, flag='Experiment', results_flag='[Results]'):
+        '''Read a QuantStudio text export in a single pass.
+
+           The comma-delimited header section (from the first line containing `flag` to the next blank line) and the
+           tab-delimited results table (after `results_flag`) are collected from the same read, and columns are built
+           with the types and names of the QuantStudio schema directly (e.g. 'Undetermined' Cq values become `cq_cutoff`).
+
+        Args:
+            source (str or file-like): path to file, text file object, or binary buffer
+
+        Returns:
+            head (list): header rows, as lists of strings
+            results_table (pd.DataFrame): results table
+        '''
+        head = []
+        rows = []
+        in_head = False
+        in_results = False
+
+        for line in self.text_lines(source):
+            # header section - same rules as extract_header(reader, flag)
+            if in_head or flag in line:
+                fields = next(csv.reader([line], delimiter=','), [])
+                if self.isblank(fields):
+                    in_head = False
+                if flag in str(fields):
+                    in_head = True
+                if in_head:
+                    head.append(fields)
+
+            # results section - same rules as csv_to_df(file, '\t', results_flag)
+            if in_results or results_flag in line:
+                fields = next(csv.reader([line], delimiter='\t'), [])
+                if self.isblank(fields):
+                    in_results = False
+                if in_results:
+                    rows.append(fields)
+                if results_flag in fields:
+                    in_results = True
+
+        if not rows:
+            self.error('Incorrect file selected. No results table found.')
+
+        header = rows.pop(0)
+        if any(len(row) > len(header) for row in rows):
+            self.error('Incorrect file selected. Results table has more columns than its header.')
+
+        results_table = self.schema('results', '.txt', 'QuantStudio').frame(header, rows)
+
+        return head, results_table
+
+
     def parse_qs(self):
         '''Parse QuantStudio 3/5 file into a standardized pandas dataframe.'''
-        self.filepath, self.ext = self.select_file(filetypes = [('All Excel Files','*.xlsx'),
-                                                                ('All Excel Files','*.xls'),
-                                                                ('Text Files', '*.txt')])
+        self.ext = self.get_extension(self.filepath)
         
         
         if self.ext == '.txt': #file extension check - special handling for text files
-            with open(self.filepath, newline = '') as csvfile:
-                # text file versions of results contain inconsistent formatting throughout file, so reading these straight to a pandas df doesn't work
-                # need to work line-by-line instead to get rid of header/footer data
-                # get results df:
-                results_table = self.csv_to_df(csvfile, '\t', '[Results]')
-                # get header as list:
-                csvfile.seek(0)
-                sheet_reader = csv.reader(csvfile, delimiter=',')
-                self.head = self.extract_header(sheet_reader, 'Experiment')
-                # text files save values as strings - handle dRn values separated with commas/thousands separator:
-                results_table['Delta Rn (last cycle)'] = results_table['Delta Rn (last cycle)'].str.replace(',', '').astype(float)
-                if self.division == 'hiv':
-                    results_table['Quantity'] = pd.to_numeric(results_table['Quantity'].str.replace(',', ''), errors='coerce')
+            # header and results table are both collected in a single read; columns are typed as they are read
+            self.head, results_table = self.read_qs_txt(self.filepath)
         
-        else: #file is not a text file (so it's an excel file) - excel files cannot be selected if open in another program, so check for this
+        else: #file is not a text file (so it's an excel file) - excel files cannot be read while open in another program
         
             # get results df:
-            file_selected = False
-            while not file_selected:
-                try:
-                    results_table = pd.read_excel(self.filepath, sheet_name = 'Results', skiprows = 43)
-                except Exception as e:
-                    proceed = tk.messagebox.askretrycancel(message='Incorrect file, or file is open in another program. Click Retry to analyze selected file again.\n\n{}'.format(e),
-                                                           icon = tk.messagebox.ERROR)
-                    if not proceed:
-                        raise SystemExit()
-                
-                if 'results_table' in locals():
-                    file_selected = True
-
-            results_table = self.extract_results(results_table) #fix any skiprows issues
+            try:
+                workbook = Workbook(self.filepath)
+                # header row is found even if it isn't at the expected row; columns are typed as the table is built
+                results_table = workbook.read_table('Results', skiprows = 43, schema = self.schema('results', self.ext))
+            except Exception as e:
+                self.error('Incorrect file, or file is open in another program.\n\n{}'.format(e),
+                           FileAccessError if isinstance(e, OSError) else FormatError) #access errors can be retried
 
-            # get header as list:
-            with open(self.filepath, 'rb') as excel_file:
-                sheet_csv = pd.read_excel(excel_file, sheet_name = 'Results', usecols='A:B').to_csv(index=False)
-                sheet_reader = csv.reader(sheet_csv.splitlines(), delimiter=',')
-                self.head = self.extract_header(sheet_reader, 'Experiment')
 
+            # get header as list - from same in-memory workbook:
+            sheet_csv = workbook.read_sheet('Results', usecols='A:B').to_csv(index=False)
+            sheet_reader = csv.reader(sheet_csv.splitlines(), delimiter=',')
+            self.head = self.extract_header(sheet_reader, 'Experiment')
+            workbook.close()
 
-        try:
-            # assign 'Undetermined' wells a CT value - 'CT' column will only exist in correctly formatted results files, so can be used for error checking
-            results_table['CT'] = results_table['CT'].replace(to_replace = 'Undetermined', value = self.cq_cutoff)
-        except Exception as e:
-            tk.messagebox.showerror(message='Unexpected machine type. Check instrument input setting.\n\n{}'.format(e))
-            # close program
-            raise SystemExit()
-        
-        # make sure columns contain number values, not strings
-        for col in ['CT', 'Cq Conf', 'Baseline End']:
-            results_table[col] = results_table[col].apply(pd.to_numeric)
-        # clean up HIV-specific columns in similar manner
-        if self.division == 'hiv':
-            results_table['Quantity'] = results_table['Quantity'].fillna(0)
-            results_table['Quantity'] = results_table['Quantity'].apply(pd.to_numeric)
 
+        # 'CT' column will only exist in correctly formatted results files, so can be used for error checking
+        # ('Undetermined' wells were already assigned a CT value, and numeric columns typed, when the table was read)
+        if 'CT' not in results_table.columns:
+            self.error("Unexpected machine type. Check instrument input setting.\n\n'CT'")
 
         
         # make sure file and fluor_names have the same fluorophores listed
         if sorted(list(results_table['Reporter'].unique())) != sorted(self.reporter_dict):
-            tk.messagebox.showerror(message='''Fluorophores in file do not match expected fluorophores. Check assay assignment.\n
+            self.error('''Fluorophores in file do not match expected fluorophores. Check assay assignment.\n
 Fluors in selected file: {}
 Expected fluors: {}'''.format(sorted(list(results_table["Reporter"].unique())),
                               sorted(self.reporter_dict)))
-            # close program
-            raise SystemExit()
         
-        results_dict = {}
-        for fluor in self.reporter_dict:
-            
-            results_dict[fluor] = results_table.loc[results_table['Reporter'] == fluor]
-            try:
-                results_dict[fluor] = results_dict[fluor].rename(columns={'Well': 'Well No.',
-                                                                          'Well Position': 'Well',
-                                                                          'CT': f'{fluor} CT',
-                                                                          'Cq Conf': f'{fluor} Cq Conf',
-                                                                          'Delta Rn (last cycle)': f'{fluor} dRn'})
-                if self.division == 'hiv':
-                    results_dict[fluor] = results_dict[fluor].rename(columns={'Quantity': f'{fluor} Quantity'})
-        
-            except Exception as e:
-                tk.messagebox.showerror(message='Fluorophores in file do not match those entered by user. Check fluorophore assignment.\n\n{}'.format(e))
-                # close program
-                raise SystemExit()
-            
-            # get max dRn, for use later
-            if self.reporter_dict[fluor] == 'Internal Control':
-                baseline_end = 5
-            else:
-                baseline_end = 10
-            get_max = results_dict[fluor].loc[results_dict[fluor]['Baseline End'] >= baseline_end, [f'{fluor} dRn']]
-            self.max_dRn_dict[fluor] = float(get_max[f'{fluor} dRn'].max())
-        
-        self.results = self.summarize(results_dict)
+        # reshape long table (one row per well and reporter) into one row per well
+        metrics = {'CT': 'CT', 'Cq Conf': 'Cq Conf', 'Delta Rn (last cycle)': 'dRn'}
+        if self.division == 'hiv':
+            metrics['Quantity'] = 'Quantity'
+        fluors = list(self.reporter_dict)
+        self.results, codes = self.widen(results_table, fluors, metrics, shared=['Sample Name'])
+
+        # get max dRn of each reporter, for use later - from the same reporter codes, in one grouped pass
+        baseline_end = np.array([5 if self.reporter_dict[fluor] == 'Internal Control' else 10 for fluor in fluors])
+        used = (codes >= 0) & (results_table['Baseline End'].to_numpy() >= baseline_end[codes])
+        max_dRn = pd.Series(results_table['Delta Rn (last cycle)'].to_numpy()[used]).groupby(codes[used]).max()
+        self.max_dRn_dict = {fluor: float(max_dRn.get(i, np.nan)) for i, fluor in enumerate(fluors)}
 
 
     ##############################################################################################################################
     ### Rotor-Gene - file to dataframe
     ##############################################################################################################################
 
+    def read_rgq_channel(self, source, schema:Schema):
+        '''Read one Rotor-Gene channel file (path or file object) in a single pass; returns its run header and results table.'''
+        try:
+            if isinstance(source, (str, os.PathLike)):
+                with open(source, 'rb') as f:
+                    content = f.read()
+            else:
+                content = source.read()
+                content = content.encode() if isinstance(content, str) else content
+            with io.TextIOWrapper(io.BytesIO(content), newline = '') as lines: #decoded as open() would
+                head = rgq_header(lines)
+            # columns are typed and renamed as the table is read; blank Ct values become `cq_cutoff`
+            results_table = schema.finish(pd.read_csv(io.BytesIO(content), skiprows = rgq_header_lines, **schema.read_options()))
+        except OSError as e:
+            self.error('Incorrect file, or file is open in another program.\n\n{}'.format(e), FileAccessError)
+        except (ValueError, UnicodeDecodeError, csv.Error) as e: #pandas parser errors are ValueErrors
+            self.error('Incorrect files selected. Please try again.\n\n{}'.format(e))
+        return head, results_table
+
+
     def parse_rgq(self):
         '''Parse Rotor-Gene Q results files into a standardized pandas dataframe.'''
-        results_filepaths = self.select_file(filetypes = [('Text Files', '*.csv')],
-                                         num_files=len(self.reporter_dict),
-                                         extension=False)
+        sources = list(self.filepath)
+        if len(sources) != len(self.reporter_dict):
+            self.error(f'Incorrect number of files. Expected {len(self.reporter_dict)} files, but {len(sources)} were given.',
+                       SelectionError)
     
-        self.filepath = os.path.commonprefix(results_filepaths)
-        first_loop = True
-        used_filepaths = []
+        names = [self.source_name(source) for source in sources]
+        self.filepath = os.path.commonprefix(names)
+        schema = self.schema('results', '.csv')
 
+        # match every file to its channel by name before reading any - every fluor must have exactly one file
+        fluors = [match_channel(name, self.reporter_dict)[0] for name in names]
+        if None in fluors or sorted(fluors) != sorted(self.reporter_dict):
+            self.error('Incorrect files selected, or file names have been edited. Please try again.')
 
-        for filepath in results_filepaths:
-
-            results_table = pd.read_csv(filepath, skiprows = 27)
+        # channel files are read at the same time (e.g. from a network share) - header and table from one read of each
+        with ThreadPoolExecutor(max_workers=len(sources)) as pool:
+            channels = list(pool.map(lambda source: self.read_rgq_channel(source, schema), sources))
 
+        channel_tables = [] #one table per channel file, labelled with its fluor - reshaped into one row per well at the end
+        for fluor, (_, results_table) in zip(fluors, channels):
             # see if files chosen are correct - if the file is a valid results file, it will have a column called 'Ct'
-            try:
-                results_table['Ct'] = results_table['Ct'].fillna(self.cq_cutoff)
-            except Exception as e:
-                tk.messagebox.showerror(message='Incorrect files selected. Please try again.\n\n{}'.format(e))
-                # close program
-                raise SystemExit()
+            if 'Ct' not in results_table.columns:
+                self.error("Incorrect files selected. Please try again.\n\n'Ct'")
+            results_table['Reporter'] = fluor
+            channel_tables.append(results_table)
+        self.head = channels[0][0] #run header of first file
 
-            # cycle through all fluors needed for selected assay, match them to names of files selected
-            for fluor in self.reporter_dict:
-                if f'{fluor}.csv' in filepath or f'{self.reporter_dict[fluor]}.csv' in filepath:
-                    used_filepaths.append(filepath)
-                    results_table = results_table.rename(columns={'No.': 'Well',
-                                                                'Name': 'Sample Name',
-                                                                'Ct': f'{fluor} CT',
-                                                                'Ct Comment': 'Comments',
-                                                                'Given Conc (copies/reaction)': 'Copies'})
-                    # first time loop is run:
-                    if first_loop:
-                        # initialize summary table
-                        self.results = results_table.loc[:, ['Well', 'Sample Name', 'Copies', 'Comments', f'{fluor} CT']]
-                        # and get header info
-                        with open(filepath, 'r') as csv_file:        
-                            sheet_reader = csv.reader(csv_file, delimiter=',')
-                            self.head = self.extract_header(sheet_reader, stop='Quantitative')
-                        first_loop = False
-                    else:
-                        self.results = pd.merge(self.results, results_table.loc[:, ['Well', f'{fluor} CT']], on='Well')
-
-        # number of files was determined to be correct, but did every file get used? if not, results are incomplete
-        if sorted(results_filepaths) != sorted(used_filepaths):
-            tk.messagebox.showerror(message='Incorrect files selected, or file names have been edited. Please try again.')
-            # close program
-            raise SystemExit()
+        # summary table - well info from first file, then Ct of each channel, in file order
+        self.results, _ = self.widen(pd.concat(channel_tables, ignore_index=True), fluors, {'Ct': 'CT'},
+                                     shared=['Sample Name', 'Copies', 'Comments'])
+
+
+    def find_run(self, filepath:str):
+        '''Find every channel file of the Rotor-Gene run a file belongs to: files in its folder, with the same name stem
+           and run header (see `group_rgq_files`).'''
+        folder = os.path.dirname(os.path.abspath(filepath))
+        candidates = [os.path.join(folder, name) for name in os.listdir(folder) if name.endswith('.csv')]
+        groups, _ = group_rgq_files(candidates, self.reporter_dict)
+        return next((group for group in groups if os.path.abspath(filepath) in group), [filepath])
 
 
     ##############################################################################################################################
@@ -425,41 +631,40 @@ Expected fluors: {}'''.format(sorted(list(results_table["Reporter"].unique())),
 
     def parse_mic(self):
         '''Parse Mic results file into a standardized pandas dataframe.'''
-        self.filepath, self.ext = self.select_file(filetypes = [('All Excel Files','*.xlsx'),
-                                                                ('All Excel Files','*.xls'),
-                                                                ('Text Files', '*.csv')])
+        self.ext = self.get_extension(self.filepath)
         tabs_to_use = {}
+        results_schema = self.schema('results', self.ext)
+        samples_schema = self.schema('samples', self.ext) #renames 'Type' and standards concentration to 'Task' and 'Assigned Quantity'
 
         if self.ext == '.csv': #file extension check - special handling for text files
             
             # text file versions of results contain inconsistent formatting throughout file, so reading these straight to a pandas df doesn't work
-            # need to work line-by-line instead to get rid of header/footer data
-            with open(self.filepath, newline = '') as csvfile:
-                
-                # make list of lines
-                csv_lines = csvfile.readlines()
-
-                # get header info while we're here
-                csvfile.seek(0)
-                sheet_reader = csv.reader(csvfile, delimiter=',')
-                self.head = self.extract_header(sheet_reader, stop='Log')
+            # instead, index the file's sections (separated by blank lines) by title in a single read, then fetch the ones we need
+            sections = SectionIndex(self.filepath, stop='Log')
+            self.head = sections.header()
 
-            # create 'chunks' list: break csv into groups, separated by blank lines
-            chunks = [list(group) for is_blank, group in itertools.groupby(csv_lines, lambda line: line.strip() == '') if not is_blank]
             results_csvs = {}
-
+            cycling_titles = sections.titles('Start Worksheet - Analysis - Cycling', 'Result')
             for fluor in self.reporter_dict:
-                for chunk in chunks:
-                    title = chunk[0] #first line of chunk
-                    if 'Start Worksheet - Analysis - Cycling' in title and 'Result' in title and (fluor in title or self.reporter_dict[fluor] in title):
-                        results_csvs[fluor] = chunk
+                for title in cycling_titles:
+                    if fluor in title or self.reporter_dict[fluor] in title:
+                        results_csvs[fluor] = sections.lines(title)
                         tabs_to_use[fluor] = title
                         break
-                    elif self.division == 'hiv' and 'Start Worksheet - Samples' in title: #get sample info (control vs unknown, concentration if available) while we're here
-                        info_csv = chunk
+
+            if self.division == 'hiv': #get sample info (control vs unknown, concentration if available)
+                samples_titles = sections.titles('Start Worksheet - Samples')
+                if not samples_titles:
+                    self.error('Incorrect file selected. No sample information found.')
+                info_df = self.csv_to_df(sections.lines(samples_titles[0])[1:], ',', schema=samples_schema) #table starts right after section title
+                info_df = info_df.loc[:, ['Well', 'Task', 'Assigned Quantity']] #unknowns have no concentration (NaN)
 
         else: #file is not a text file - must be Excel
-            sheetnames = pd.ExcelFile(self.filepath).sheet_names #get tabs in file
+            try:
+                workbook = Workbook(self.filepath) #all tabs are read from this single in-memory copy
+            except Exception as e:
+                self.error('Incorrect file selected. Check instrument input.\n\n{}'.format(e))
+            sheetnames = workbook.sheet_names #get tabs in file
             for fluor in self.reporter_dict:
                 for tab in sheetnames: #cycle through fluorophores and tabs, assign tabs to fluorophores
                     if self.reporter_dict[fluor] in tab and 'Result' in tab and 'Absolute' not in tab:
@@ -467,80 +672,126 @@ Expected fluors: {}'''.format(sorted(list(results_table["Reporter"].unique())),
                         break
 
             # get header info
-            with open(self.filepath, 'rb') as excel_file:
-
-                try:
-                    sheet_csv = pd.read_excel(excel_file, sheet_name = 'General Information', usecols='A:B').to_csv(index=False)
-                except Exception as e:
-                    tk.messagebox.showerror(message='Incorrect file selected. Check instrument input.\n\n{}'.format(e))
-                    # close program
-                    raise SystemExit()
-                
-                sheet_reader = csv.reader(sheet_csv.splitlines(), delimiter=',')
-                self.head = self.extract_header(sheet_reader, stop='Log')
+            try:
+                sheet_csv = workbook.read_sheet('General Information', usecols='A:B').to_csv(index=False)
+            except Exception as e:
+                self.error('Incorrect file selected. Check instrument input.\n\n{}'.format(e))
             
-                # get sample task assignment (controls vs unknowns) and assigned copy numbers, if any
-                if self.division == 'hiv':
-                    info_df = pd.read_excel(excel_file, sheet_name = "Samples"
-                                        ).loc[:, ['Well', 'Type', 'Standards Concentration (Copies/µL)']
-                                        ].rename(columns={'Type': 'Task', 'Standards Concentration (Copies/µL)': 'Assigned Quantity'})
+            sheet_reader = csv.reader(sheet_csv.splitlines(), delimiter=',')
+            self.head = self.extract_header(sheet_reader, stop='Log')
+        
+            # get sample task assignment (controls vs unknowns) and assigned copy numbers, if any
+            if self.division == 'hiv':
+                info_df = samples_schema.finish(workbook.read_sheet('Samples', **samples_schema.read_options())
+                                    ).loc[:, ['Well', 'Task', 'Assigned Quantity']]
 
 
         if sorted(tabs_to_use) != sorted(self.reporter_dict): #check to make sure fluorophores with assigned tabs match the list of fluors known to be in assay
-            tk.messagebox.showerror(message='''Fluorophores in file do not match expected fluorophores. Check fluorophore and assay assignment.\n\n
+            self.error('''Fluorophores in file do not match expected fluorophores. Check fluorophore and assay assignment.\n\n
 Expected: {e}\nGot: {g}'''.format(e=sorted(self.reporter_dict), g=sorted(tabs_to_use)))
-            # close program
-            raise SystemExit()
         
         results_dict = {}
-        first_loop = True
         for fluor in self.reporter_dict:
             
+            # wells are read as integers, and Cq values as floats (blanks become `cq_cutoff`)
             if self.ext == '.csv':
-                results_dict[fluor] = self.csv_to_df(results_csvs[fluor], ',', 'Results')
-                if self.division == 'hiv' and first_loop:
-                    info_df = self.csv_to_df(info_csv, ','
-                                            ).loc[:, ['Well', 'Type', 'Standards Concentration (Copies/ÂµL)']
-                                            ].rename(columns={'Type': 'Task', 'Standards Concentration (Copies/ÂµL)': 'Assigned Quantity'})
-                    info_df['Assigned Quantity'] = info_df['Assigned Quantity'].apply(pd.to_numeric)
-                    info_df['Well'] = info_df['Well'].astype(int)
-                    first_loop = False
+                results_dict[fluor] = self.csv_to_df(results_csvs[fluor], ',', 'Results', schema=results_schema)
             
             else:
-                results_dict[fluor] = pd.read_excel(self.filepath, sheet_name = tabs_to_use[fluor], skiprows = 32)
-                # Mic results might not start at expected skiprow - remove any non-numerical data before results table
-                results_dict[fluor] = self.extract_results(results_dict[fluor])
+                # Mic results might not start at expected skiprow - non-numerical rows before results table are dropped
+                results_dict[fluor] = workbook.read_table(tabs_to_use[fluor], skiprows = 32, schema = results_schema)
 
             results_dict[fluor] = results_dict[fluor].rename(columns={'Cq': f'{fluor} CT'})
-            results_dict[fluor]['Well'] = results_dict[fluor]['Well'].astype(int)
-            results_dict[fluor][f'{fluor} CT'] = results_dict[fluor][f'{fluor} CT'].fillna(self.cq_cutoff).apply(pd.to_numeric)
             
             if self.division == 'hiv':
-                info_df['Well'] = info_df['Well'].astype(int)
                 results_dict[fluor] = pd.merge(results_dict[fluor], info_df, on='Well')
 
-                m, b = linreg.linreg(df=results_dict[fluor], fluor=fluor, percent_drm=self.drm_percentage)
-                results_dict[fluor][f'{fluor} Quantity'] = results_dict[fluor][f'{fluor} CT'].apply(linreg.quantify, args=(m,b))
+        if self.ext != '.csv':
+            workbook.close() #all tabs have been read
+
+        if self.division == 'hiv':
+            self.quantify_standards(results_dict)
         
         self.results = self.summarize(results_dict)
 
 
+    def quantify_standards(self, results_dict:dict):
+        '''Fit the standard curves of all fluorophores in one pass, then quantify every well of every fluorophore at once.
+
+           Wells are quantified in place (as `<fluor> Quantity` columns); curve parameters are saved to `self.curves`.
+        '''
+        fluors = list(results_dict)
+        wells = max(len(results_dict[fluor]) for fluor in fluors)
+
+        # stack fluorophores into (fluor, well) arrays - padding with NaN, in case tabs have different numbers of wells
+        quantities = np.full((len(fluors), wells), np.nan)
+        cqs = np.full((len(fluors), wells), np.nan)
+        for i, fluor in enumerate(fluors):
+            quantities[i, :len(results_dict[fluor])] = results_dict[fluor]['Assigned Quantity'].to_numpy(dtype=float)
+            cqs[i, :len(results_dict[fluor])] = results_dict[fluor][f'{fluor} CT'].to_numpy(dtype=float)
+
+        # controls have 20% DRMs - multiply VQ quant by 0.2 to get DRM quant
+        percent_drm = np.array([[1 if fluor == 'CY5' else self.drm_percentage] for fluor in fluors])
+        with np.errstate(divide='ignore'):
+            log_quantities = np.log10(quantities * percent_drm)
+
+        with instrument.span('linreg', fluors=len(fluors), wells=wells):
+            m, b, r2, efficiency = linreg.fit_curves(log_quantities, cqs)
+            copies = linreg.quantify(cqs, m[:, None], b[:, None])
+
+        for i, fluor in enumerate(fluors):
+            results_dict[fluor][f'{fluor} Quantity'] = copies[i, :len(results_dict[fluor])]
+            self.curves[fluor] = {'slope': float(m[i]), 'intercept': float(b[i]), 'r2': float(r2[i]), 'efficiency': float(efficiency[i])}
+
+
     ##############################################################################################################################
     ### Parse function - serves as 'main' function
     ##############################################################################################################################
 
     def parse(self):
-        '''Initialize reporters, then run parsing function.'''
+        '''Initialize reporters, then run parsing function on the results file given as `filepath`.
+        
+           If a plate cache was given and already holds this file, parsing is skipped entirely.
+        '''
         self.init_reporters()
+        if self.filepath is None:
+            self.error('No results file selected.', SelectionError)
+
+        if self.cache is not None:
+            key = self.cache.key(self)
+            with instrument.span('cache_load') as fields:
+                fields['hit'] = self.cache.load(key, self)
+            if fields['hit']:
+                if self.machine_type == 'Rotor-Gene':
+                    self.filepath = os.path.commonprefix([self.source_name(source) for source in self.filepath])
+                else:
+                    self.ext = self.get_extension(self.filepath)
+                return
         
-        if self.machine_type == 'Rotor-Gene':
-            self.parse_rgq()
-        elif self.machine_type == 'Mic':
-            self.parse_mic()
-        elif 'QuantStudio' in self.machine_type:
-            self.parse_qs()
-        else:
-            raise ValueError
+        with instrument.span('read_results', machine=self.machine_type) as fields:
+            if self.machine_type == 'Rotor-Gene':
+                self.parse_rgq()
+            elif self.machine_type == 'Mic':
+                self.parse_mic()
+            elif 'QuantStudio' in self.machine_type:
+                self.parse_qs()
+            else:
+                raise ValueError(f'Unsupported machine type: {self.machine_type}')
+            fields['wells'] = len(self.results)
+
+        if self.cache is not None:
+            with instrument.span('cache_store'):
+                self.cache.store(key, self)
+
+
+def hiv_calls(drm_percent, ic_quantity, min_drm_percent=0.05, max_drm_percent=0.1):
+    '''Get HIV DRM calls for arrays (of any shape) of DRM percentages and VQ copies.'''
+    drm_percent = np.asarray(drm_percent, dtype=float)
+    ic_quantity = np.asarray(ic_quantity, dtype=float)
+    return np.select([(drm_percent < min_drm_percent) | (ic_quantity < 50),
+                      drm_percent >= max_drm_percent],
+                     ['Negative', 'Positive'],
+                     default='Indeterminate').astype(object)
 
 
 class DataAnalyzer:
@@ -608,12 +859,40 @@ class DataAnalyzer:
             return 'Invalid Result'
         
 
+    @instrument.traced()
+    def vhf_calls(self):
+        '''Determine the qualitative result for every well at once.
+        
+           Column-wise equivalent of `vhf_result`: the same rules are applied to whole Cq/dRn columns
+           instead of one row at a time.
+        '''
+        n_wells = len(self.df)
+        cq_vals = np.empty((n_wells, len(self.reporter_list)))
+        cq_vals[:, 0] = 98 #internal control - artificial high value, as in vhf_result
+
+        with np.errstate(divide='ignore', invalid='ignore'): #missing (NaN) or zero max dRn makes the well negative for that fluor
+            for i, fluor in enumerate(self.reporter_list[1:], start=1):
+                cq = self.df[fluor + ' CT'].to_numpy(dtype=float)
+                positive = cq < self.pos_cutoff
+                if self.machine_type == 'QuantStudio 3' or self.machine_type == 'QuantStudio 5':
+                    positive &= self.df[fluor + ' dRn'].to_numpy(dtype=float)/self.max_dRn[fluor] > self.dRn_percent_cutoff
+                cq_vals[:, i] = np.where(positive, cq, 99)
+
+        # lowest Cq wins; argmin returns the first minimum, like list.index(min(...))
+        fluor_min = cq_vals.argmin(axis=1) if n_wells else np.zeros(0, dtype=int)
+        positives = np.array(['IC'] + [f'{self.reporter_dict[fluor]} Positive' for fluor in self.reporter_list[1:]], dtype=object)
+        ic_amplified = self.df[self.ic + ' CT'].to_numpy(dtype=float) < self.pos_cutoff
+
+        return np.where(fluor_min != 0, positives[fluor_min],
+                        np.where(ic_amplified, 'Negative', 'Invalid Result')).astype(object)
+
+
     def vhf_analysis(self):
         '''Perform analysis on all rows in dataframe.
         
-           References `vhf_result`.
+           References `vhf_calls`.
         '''
-        self.df['Result'] = self.df.apply(self.vhf_result, axis=1)
+        self.df['Result'] = self.vhf_calls()
 
 
 
@@ -627,21 +906,38 @@ class DataAnalyzer:
         return call
 
 
+    def hiv_calls(self, drm_percent, ic_quantity):
+        '''Column-wise equivalent of `hiv_result`: get calls for arrays of DRM percentages and VQ copies.'''
+        return hiv_calls(drm_percent, ic_quantity, self.min_drm_percent, self.max_drm_percent)
+
+
+    @instrument.traced()
     def hiv_analysis(self):
         '''Perform analysis on all rows in dataframe.
         
-           References `hiv_result`.
+           DRM percentages and calls for all reporters are computed column-wise; see `hiv_calls`.
         '''
+        if len(self.reporter_list) < 2: #no DRM reporters - nothing to add
+            return
+
+        ic_quantity = self.df[self.ic + ' Quantity']
+        df = self.df.fillna(0) #single copy of frame - blank values are treated as 0, as before
+
         #iterate through all reporters except index 0, which holds the internal control reporter
-        for fluor in self.reporter_list[1:]:
-            
-            # create additional columns containing DRM percentages
-            kwargs = {f'{self.reporter_dict[fluor]} DRM Percentage': 
-                      lambda x: x[fluor + ' Quantity'] / x[self.ic + ' Quantity']}
-            self.df = self.df.assign(**kwargs).fillna(0)
-            
-            # based on DRM percentage columns, determine call for each reporter
-            self.df[f'{self.reporter_dict[fluor]} Call'] = self.df.apply(self.hiv_result, col=f'{self.reporter_dict[fluor]} DRM Percentage', axis=1)
+        for i, fluor in enumerate(self.reporter_list[1:]):
+            target = self.reporter_dict[fluor]
+
+            # DRM percentage = DRM copies / VQ copies
+            # the first reporter is divided before blanks are filled in, the rest after - as when the frame was refilled once per reporter
+            if i == 0:
+                drm_percent = (self.df[fluor + ' Quantity'] / ic_quantity).fillna(0)
+            else:
+                drm_percent = (df[fluor + ' Quantity'] / df[self.ic + ' Quantity']).fillna(0)
+
+            df[f'{target} DRM Percentage'] = drm_percent
+            df[f'{target} Call'] = self.hiv_calls(drm_percent, df[self.ic + ' Quantity'])
+
+        self.df = df
 
     
 
@@ -649,32 +945,44 @@ class DataExporter:
     '''Given an analyzed qPCR dataframe, clean up and export results.'''
     def __init__(self, imported:DataImporter,
                        analyzed:DataAnalyzer,
-                       columns:list):
-        
+                       columns:list,
+                       archive=None,
+                       dest_filepath=None):
+        '''If `archive` (an `archive.ResultsArchive`) is given, the analyzed plate is also added to it when exported.
+
+           The CSV summary is saved as `dest_filepath` - by default, next to the results file, as '<name> - Summary.csv'.
+        '''
         self.header = imported.head
-        self.results = analyzed.df
+        self.results = compact.expand(analyzed.df) #compact frames (see compact.py) are exported exactly like standard ones
         self.division = imported.division
+        self.assay = imported.assay
         self.machine_type = analyzed.machine_type
         self.reporter_list = analyzed.reporter_list
         self.reporter_dict = analyzed.reporter_dict
         self.ic = imported.ic
+        self.names = column_names(tuple(self.reporter_dict.items()), self.machine_type, self.division)
         self.src_filepath = imported.filepath
-        self.dest_filepath = None
+        self.dest_filepath = dest_filepath
         self.columns = columns
+        self.archive = archive
+        self.unrounded = None #analyzed results, before rounding and cleanup - what gets archived
+        self.bytes_written = 0   #size of results file, once written
+        self.archive_error = None #why the plate couldn't be archived, if it couldn't
+        self.write_seconds = 0.0 #time taken to write results file
     
 
-    def prepend(self):
-        '''Add a line or header to the beginning of a file.'''
-        with open(self.dest_filepath, 'r+', newline='', errors='replace') as file:
-            existing = file.read() #save file contents to 'existing'
-            file.seek(0) #move pointer back to start of file
-            if isinstance(self.header, str): #if header is single line
-                file.write(self.header+'\n\n'+existing)
-            else:
-                # header is a list - need to make writer csv object, then write list to file item by item
-                writer = csv.writer(file)
-                writer.writerows(self.header)
-                file.write('\n\n'+existing)
+    def write_csv(self, file):
+        '''Write header, then results table, to a binary file object in a single pass.'''
+        header = io.StringIO(newline='')
+        if isinstance(self.header, str): #if header is single line
+            header.write(self.header+'\n\n')
+        else:
+            # header is a list - need to make writer csv object, then write list to file item by item
+            writer = csv.writer(header)
+            writer.writerows(self.header)
+            header.write('\n\n')
+        file.write(header.getvalue().encode(locale.getpreferredencoding(False), errors='replace'))
+        self.results.to_csv(file, index=False, encoding='utf-8')
 
 
     def roundvals(self):
@@ -692,76 +1000,73 @@ class DataExporter:
 
 
     def get_column_list(self):
-        '''Create list of columns to export.'''
-        for i in range(len(self.reporter_list)):
-            
-            self.results = self.results.rename(columns={f'{self.reporter_list[i]} CT': f'{self.reporter_dict[self.reporter_list[i]]} Cq'})
-            
-            if 'QuantStudio' in self.machine_type:
-                self.results = self.results.rename(columns={f'{self.reporter_list[i]} Cq Conf': f'{self.reporter_dict[self.reporter_list[i]]} Cq Conf',
-                                                              f'{self.reporter_list[i]} dRn': f'{self.reporter_dict[self.reporter_list[i]]} dRn'})
-            if self.division == 'hiv':
-                self.results = self.results.rename(columns={f'{self.reporter_list[i]} Quantity': f'{self.reporter_dict[self.reporter_list[i]]} Copies'})
+        '''Rename analysis columns to their exported names, in one pass (see `ColumnNames.export`).'''
+        self.results = self.results.rename(columns=self.names.export)
 
 
     def cleanup(self):
         '''Get rid of unwanted columns in analyzed qPCR dataframe.'''
-        rm_headers = list(self.results) #get list of headers to remove - begins with all headers in list
-
-        for header in self.columns:
-            if 'Cq' in header and 'Cq Conf' not in header:
-                for key in self.reporter_dict:
-                    rm_headers.remove(f'{self.reporter_dict[key]} Cq')
-            elif 'dRn' in header:
-                for key in self.reporter_dict:
-                    rm_headers.remove(f'{self.reporter_dict[key]} dRn')
-            elif 'Call' in header:
-                for key in self.reporter_list[1:]:
-                    rm_headers.remove(f'{self.reporter_dict[key]} Call')
-            elif 'DRM Percentage' in header:
-                for key in self.reporter_list[1:]:
-                    rm_headers.remove(f'{self.reporter_dict[key]} DRM Percentage')
-            else:
-                try:
-                    rm_headers.remove(header) #for every header in list of columns to export, remove this from our list
-                                          #(leaving behind only the columns to get rid of)
-                except:
-                    pass
-
-        self.results = self.results.drop(columns=rm_headers, axis=1)
+        kept = self.names.kept(tuple(self.columns))
+        self.results = self.results.drop(columns=[header for header in self.results if header not in kept])
 
 
     def to_csv(self):
         '''Export analyzed qPCR dataframe to CSV.'''
-
-        self.dest_filepath = os.path.splitext(self.src_filepath)[0]+' - Summary.csv'
+        if self.dest_filepath is None:
+            name = self.src_filepath if isinstance(self.src_filepath, (str, os.PathLike)) else getattr(self.src_filepath, 'name', None)
+            if not name:
+                raise SelectionError('No destination for results file. Results were not read from a named file.')
+            self.dest_filepath = os.path.splitext(name)[0]+' - Summary.csv'
 
         # results file can't be created/written if the user already has it open - catch possible PermissionErrors
-        file_saved = False
-        while not file_saved:
+        try:
+            start = time.perf_counter()
+            # write to a temporary file next to the destination, then rename it - a failed write never leaves a half-written summary
+            dest_folder, dest_name = os.path.split(os.path.abspath(self.dest_filepath))
+            tmp_filepath = os.path.join(dest_folder, f'.{dest_name}.{uuid.uuid4().hex}.tmp')
             try:
-                self.results.to_csv(
-                    path_or_buf=self.dest_filepath,
-                    index=False
-                    )
-                self.prepend()
-                file_saved = True
-
-            # if file couldn't be saved, let the user know
-            except Exception as e:
-                proceed = tk.messagebox.askretrycancel(message='Unable to write results file. Make sure results file is closed, then click Retry to try again.\n\n{}'.format(e),
-                                                       icon = tk.messagebox.ERROR)
-                if not proceed:
-                    raise SystemExit()
-                
-        tk.messagebox.showinfo(title='Success', message=f'CSV summary saved:\n\n{self.dest_filepath}')
+                with open(tmp_filepath, 'xb', buffering=1024*1024) as tmp_file:
+                    self.write_csv(tmp_file)
+                    self.bytes_written = tmp_file.tell()
+                os.replace(tmp_filepath, self.dest_filepath)
+            except BaseException:
+                if os.path.exists(tmp_filepath):
+                    os.remove(tmp_filepath)
+                raise
+            self.write_seconds = time.perf_counter() - start
+        except OSError as e: #nothing is shown here - gui.py asks the user to close the file and retry `save`
+            raise FileAccessError('Unable to write results file. Make sure results file is closed.\n\n{}'.format(e)) from e
 
     
+    def archive_results(self, results:pd.DataFrame):
+        '''Add analyzed plate (unrounded, with every column) to results archive.
+
+           A failure doesn't fail the export - the CSV summary is already saved. The error is kept in `archive_error`.
+        '''
+        try:
+            self.archive.append(results, self.header, self.assay, self.machine_type, self.reporter_dict,
+                                division=self.division, source=self.src_filepath)
+        except Exception as e:
+            self.archive_error = 'Unable to add results to archive.\n\n{}'.format(e)
+
+
     def export(self):
+        '''Round and clean up results, then save them (see `save`).'''
+        self.unrounded = self.results.copy() if self.archive is not None else None #rounding and cleanup change results in place
         self.roundvals()
         self.get_column_list()
         self.cleanup()
-        self.to_csv()
+        self.save()
+
+
+    def save(self):
+        '''Write CSV summary, then add plate to archive (if any). Safe to call again if writing failed (FileAccessError).'''
+        with instrument.span('write_csv') as fields:
+            self.to_csv()
+            fields['bytes'] = self.bytes_written
+        if self.archive is not None: #only once the summary is saved - a broken archive never costs the user their CSV
+            with instrument.span('archive'):
+                self.archive_results(self.unrounded)
 
 
 if __name__ == '__main__':
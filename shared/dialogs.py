@@ -0,0 +1,71 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   This module holds the single hidden tkinter root window shared by every dialog PANDAA shows (file selection, errors,
+#   retry prompts, success messages).
+#
+#   Only gui.py (and the menu, in userinterface.py) show dialogs - the analysis classes raise errors instead (see errors.py).
+#   tkinter is only imported, and the root only created, the first time a dialog is actually needed. If the main menu
+#   (PandaaMenu) is running, its window is registered with set_root() and reused as the parent of every dialog.
+#
+#
+
+
+##############################################################################################################################
+### Shared root window
+##############################################################################################################################
+
+root = None #shared tkinter root, created on first use
+
+
+def set_root(window):
+    '''Use an existing tkinter window (e.g. the main menu) as the parent of all dialogs.'''
+    global root
+    root = window
+
+
+def get_root():
+    '''Get the shared tkinter root, creating a hidden one if none exists yet (or if it was destroyed).'''
+    global root
+    import tkinter as tk
+    try:
+        if root is not None and root.winfo_exists():
+            return root
+    except tk.TclError: #window was destroyed
+        pass
+    root = tk.Tk()
+    root.withdraw()
+    return root
+
+
+##############################################################################################################################
+### Dialogs
+##############################################################################################################################
+
+# tkinter is imported inside each function (not at module level), so that importing this module stays cheap
+
+def showerror(message:str, **kwargs):
+    from tkinter import messagebox
+    return messagebox.showerror(message=message, parent=get_root(), **kwargs)
+
+
+def showinfo(title:str, message:str, **kwargs):
+    from tkinter import messagebox
+    return messagebox.showinfo(title=title, message=message, parent=get_root(), **kwargs)
+
+
+def askretrycancel(message:str, **kwargs):
+    '''Show retry/cancel prompt with error icon; returns True if user clicks Retry.'''
+    from tkinter import messagebox
+    return messagebox.askretrycancel(message=message, icon=messagebox.ERROR, parent=get_root(), **kwargs)
+
+
+def askopenfilename(**kwargs):
+    from tkinter import filedialog
+    return filedialog.askopenfilename(parent=get_root(), **kwargs)
+
+
+def askopenfilenames(**kwargs):
+    from tkinter import filedialog
+    return filedialog.askopenfilenames(parent=get_root(), **kwargs)
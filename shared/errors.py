@@ -0,0 +1,31 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   This module contains the exceptions raised by the analysis classes (DataImporter, DataAnalyzer, DataExporter, Report).
+#
+#   The analysis classes never show a dialog or close the program - they raise one of these instead, so that one bad results
+#   file does not stop a batch run, a watched folder or the analysis service. The GUI tools (hiv/main.py, vhf/main.py) show
+#   them to the user through gui.py: a FileAccessError can be retried once the file is closed; anything else is shown, and
+#   the program closes.
+#
+
+
+class PandaaError(Exception):
+    '''Raised when a results file cannot be imported, analyzed, or exported.'''
+
+
+class SelectionError(PandaaError):
+    '''No results file was given, or the wrong number of files was (Rotor-Gene).'''
+
+
+class FormatError(PandaaError):
+    '''Results file is not what it should be - wrong machine, wrong assay, missing tables or columns.'''
+
+
+class FileAccessError(PandaaError):
+    '''File could not be read or written, usually because it is open in another program. Worth retrying.'''
+
+
+class ReportError(PandaaError):
+    '''PDF report could not be built from the results.'''
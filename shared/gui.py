@@ -0,0 +1,81 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   This module is the thin Tk layer between the GUI tools (hiv/main.py, vhf/main.py) and the analysis classes.
+#
+#   The analysis classes (data_analysis.py, reportbuilder.py) never show a dialog: they are given results files as paths
+#   and raise the errors in errors.py. Here, the user chooses the results file(s), and errors are shown in message boxes -
+#   a FileAccessError (e.g. summary open in Excel) can be retried; anything else is shown once, and the program closes.
+#
+#   Nothing else (batch.py, watcher.py, service.py) imports this module.
+#
+#
+
+
+import os, sys
+sys.path.insert(0, os.path.dirname(__file__)) #look for custom dependencies in shared folder
+
+from errors import PandaaError, SelectionError, FileAccessError
+import dialogs #file selection and message boxes - tkinter is only loaded when a dialog is first shown
+
+
+# file types offered in the file dialog for each machine - Rotor-Gene exports one .csv file per channel
+filetypes = {'Rotor-Gene': [('Text Files', '*.csv')],
+             'Mic': [('All Excel Files','*.xlsx'), ('All Excel Files','*.xls'), ('Text Files', '*.csv')],
+             'QuantStudio': [('All Excel Files','*.xlsx'), ('All Excel Files','*.xls'), ('Text Files', '*.txt')]}
+
+
+def choose_results(importer):
+    '''Prompt user to select results file(s) for the importer's machine; returns filepath (or, for Rotor-Gene, a list).
+
+       For Rotor-Gene, choosing any one channel file of a run is enough - the other channel files are found in its folder.
+    '''
+    importer.init_reporters() #Rotor-Gene needs one file per reporter
+    num_files = importer.files_expected()
+    machine = 'QuantStudio' if 'QuantStudio' in importer.machine_type else importer.machine_type
+    if machine not in filetypes:
+        raise ValueError(f'Unsupported machine type: {importer.machine_type}')
+
+    if machine == 'Rotor-Gene':
+        filepaths = list(dialogs.askopenfilenames(title='Choose results files', filetypes=filetypes[machine]))
+        if len(filepaths) == 1 and num_files > 1: #one channel file chosen - find the rest of its run
+            filepaths = importer.find_run(filepaths[0])
+        if filepaths and len(filepaths) != num_files:
+            raise SelectionError(f'''Incorrect number of files. Expected {num_files} files,
+but {len(filepaths)} were selected or found. Make sure files are not open in other programs.''')
+    else:
+        filepaths = dialogs.askopenfilename(title='Choose results file', filetypes=filetypes[machine])
+
+    if not filepaths:
+        raise SelectionError('No file selected. Make sure file is not open in another program.')
+    return filepaths
+
+
+def attempt(step, *args, retry=None, **kwargs):
+    '''Run one step of the analysis, showing any error to the user.
+
+       On a FileAccessError, the user can close the file and click Retry - `retry` (by default, the step itself) is then run
+       again. Any other error is shown once, and the program closes.
+    '''
+    try:
+        return step(*args, **kwargs)
+    except FileAccessError as e:
+        if not dialogs.askretrycancel(f'{e}\n\nClick Retry to try again.'):
+            raise SystemExit()
+        return attempt(retry or step, *args, retry=retry, **kwargs)
+    except PandaaError as e:
+        dialogs.showerror(str(e))
+        raise SystemExit()
+
+
+def saved(exporter):
+    '''Let user know the CSV summary was saved - and, if it couldn't be, that the plate wasn't archived.'''
+    if exporter.archive_error is not None:
+        dialogs.showerror(exporter.archive_error+'\n\nThe CSV summary was saved.')
+    dialogs.showinfo('Success', f'CSV summary saved:\n\n{exporter.dest_filepath}')
+
+
+def saved_pdf(pdf_file:str):
+    '''Let user know the PDF summary was saved.'''
+    dialogs.showinfo('Success', f'PDF summary saved:\n\n{pdf_file}')
@@ -0,0 +1,192 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   This module contains the timing and profiling instrumentation used across the pipeline, to find out where time goes
+#   on a lab PC without a debugger. Both are off unless switched on with an environment variable:
+#
+#     PANDAA_TRACE    emit a JSON record for every span (stage or hot spot) as it ends, one per line:
+#                         {"span": "csv_to_df", "parent": "parse", "depth": 1, "ms": 4.21, "status": "ok", ...}
+#                     "1" or "stderr" writes records to stderr; anything else is the path of a file to append them to
+#     PANDAA_PROFILE  capture cProfile and tracemalloc data for the whole run, saved to this folder ("1" = current folder):
+#                         <name>-<date>-<time>-<pid>.prof   cProfile stats, for pstats/snakeviz
+#                         <name>-<date>-<time>-<pid>.txt    top functions by cumulative time, peak memory, largest allocations
+#
+#   e.g. (Windows):  set PANDAA_TRACE=C:\pandaa\trace.jsonl  then run the tool as usual.
+#
+#   Spans nest: each record names its parent span and depth, and every record of a process shares the same "run" id,
+#   so traces appended from several runs can be told apart. When tracing is off, span() costs one attribute check.
+#
+#
+
+
+##############################################################################################################################
+### Imports
+##############################################################################################################################
+
+import os #environment flags
+import sys #stderr output
+import json #trace records
+import time #span timing
+import uuid #run ids
+import functools #decorator
+import threading #per-thread span stacks, serialized writes
+from contextlib import contextmanager
+
+
+##############################################################################################################################
+### Settings
+##############################################################################################################################
+
+class Settings:
+    '''Instrumentation settings, read from the environment.'''
+    def __init__(self, trace=None, profile=None):
+        self.trace = trace
+        self.profile = profile
+        self.run = uuid.uuid4().hex[:12]
+        self.lock = threading.Lock()
+        self.local = threading.local() #stack of open spans, per thread
+
+
+def flag(value):
+    '''Normalize an environment flag: None if off, else its value.'''
+    if value is None or value.strip().lower() in ('', '0', 'false', 'no', 'off'):
+        return None
+    return value.strip()
+
+
+def configure(trace=None, profile=None, environ=os.environ):
+    '''(Re)load settings - from PANDAA_TRACE and PANDAA_PROFILE, unless given.'''
+    global settings
+    settings = Settings(trace=flag(trace if trace is not None else environ.get('PANDAA_TRACE')),
+                        profile=flag(profile if profile is not None else environ.get('PANDAA_PROFILE')))
+    return settings
+
+
+settings = configure()
+
+
+def tracing():
+    return settings.trace is not None
+
+
+##############################################################################################################################
+### Spans
+##############################################################################################################################
+
+def emit(record:dict):
+    '''Write one trace record as a JSON line.'''
+    line = json.dumps(record, default=str)
+    with settings.lock:
+        if settings.trace is None: #switched off by an earlier write error
+            return
+        if settings.trace.lower() in ('1', 'true', 'yes', 'on', 'stderr'):
+            print(line, file=sys.stderr, flush=True)
+            return
+        try:
+            with open(settings.trace, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except OSError as e: #diagnostics must never stop an analysis
+            print(f'PANDAA_TRACE: cannot write to {settings.trace} ({e}) - tracing switched off', file=sys.stderr)
+            settings.trace = None
+
+
+@contextmanager
+def span(name:str, **fields):
+    '''Time a block of code; if tracing is on, a record is emitted when it ends (also if it raises).
+
+       Yields a dict of extra fields, which can be filled in inside the block:
+           with span('parse', machine=machine_type) as fields:
+               ...
+               fields['wells'] = len(results)
+    '''
+    if settings.trace is None:
+        yield fields
+        return
+
+    stack = settings.local.__dict__.setdefault('stack', [])
+    record = {'span': name, 'parent': stack[-1] if stack else None, 'depth': len(stack), 'run': settings.run,
+              'pid': os.getpid(), 'thread': threading.current_thread().name,
+              'start': time.time()}
+    stack.append(name)
+    status, error = 'ok', None
+    start = time.perf_counter()
+    try:
+        yield fields
+    except BaseException as e:
+        status, error = 'error', f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        record['ms'] = round((time.perf_counter() - start)*1000, 3)
+        stack.pop()
+        record['status'] = status
+        if error:
+            record['error'] = error
+        record.update(fields)
+        emit(record)
+
+
+def traced(name:str=None):
+    '''Decorator: run every call of a function in a span (named after the function, unless given).'''
+    def decorate(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if settings.trace is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+##############################################################################################################################
+### Profiling
+##############################################################################################################################
+
+def profile_report(stats, peak:int, snapshot, top=40):
+    '''Text summary: top functions by cumulative time, then peak traced memory and the largest allocations still held.'''
+    import io
+    import pstats
+
+    text = io.StringIO()
+    pstats.Stats(stats, stream=text).sort_stats('cumulative').print_stats(top)
+    text.write(f'\nPeak traced memory: {peak/1024**2:.1f} MB\n\nLargest allocations at end of run:\n')
+    for stat in snapshot.statistics('lineno')[:20]:
+        text.write(f'  {stat}\n')
+    return text.getvalue()
+
+
+@contextmanager
+def profiled(name:str):
+    '''Profile a block of code (usually a whole run) with cProfile and tracemalloc, if PANDAA_PROFILE is set.'''
+    if settings.profile is None:
+        yield None
+        return
+
+    import cProfile
+    import tracemalloc
+
+    folder = '.' if settings.profile.lower() in ('1', 'true', 'yes', 'on') else settings.profile
+    try:
+        os.makedirs(folder, exist_ok=True)
+    except OSError as e: #diagnostics must never stop an analysis
+        print(f'PANDAA_PROFILE: cannot create {folder} ({e}) - not profiling', file=sys.stderr)
+        yield None
+        return
+    stem = os.path.join(folder, f"{name.replace(' ', '_')}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield stem
+    finally:
+        profiler.disable()
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        profiler.dump_stats(stem + '.prof')
+        with open(stem + '.txt', 'w', encoding='utf-8') as f:
+            f.write(profile_report(profiler, peak, snapshot))
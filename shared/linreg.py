@@ -71,15 +71,61 @@ def linreg(df, fluor='CY5', percent_drm=0.2):
     return m, b
 
 
+# Batched version of linreg - fits every standard curve of a plate (one per fluorophore) in one pass.
+#
+# For a straight line, the least squares solution has a closed form, so no matrix needs to be built or decomposed:
+#   m = sum((x - mean(x)) * (y - mean(y))) / sum((x - mean(x))^2)
+#   b = mean(y) - m * mean(x)
+# Each curve only uses its own standards: points where x is NaN (no assigned quantity) are left out of the sums.
+# Centering on the means keeps the result as accurate as np.linalg.lstsq for typical Cq/log10 copy values.
+
+def fit_curves(x, y):
+    '''Fit `y = mx + b` to many standard curves at once, using least squares.
+
+    Args:
+        x (np.ndarray): log10 quantities, shape (curves, points); NaN where a point is not a standard
+        y (np.ndarray): Cq values, same shape as `x`
+    Returns:
+        (m, b, r2, efficiency) (np.ndarray tuple): slope, intercept, coefficient of determination, and
+            amplification efficiency (`10^(-1/m) - 1`) of each curve, each of shape (curves,).
+            Curves with fewer than two distinct standards get NaN.
+    '''
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    used = ~np.isnan(x) #only points with assigned copy numbers - *not* NaN
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n = used.sum(axis=-1)
+        x_mean = np.where(used, x, 0).sum(axis=-1) / n
+        y_mean = np.where(used, y, 0).sum(axis=-1) / n
+        dx = np.where(used, x - x_mean[..., None], 0)
+        dy = np.where(used, y - y_mean[..., None], 0)
+
+        sxx = (dx*dx).sum(axis=-1)
+        m = (dx*dy).sum(axis=-1) / sxx
+        b = y_mean - m*x_mean
+
+        ss_res = ((dy - m[..., None]*dx)**2).sum(axis=-1)
+        ss_tot = (dy*dy).sum(axis=-1)
+        r2 = 1 - ss_res/ss_tot
+        efficiency = 10**(-1/m) - 1
+
+    valid = sxx > 0 #at least two distinct standards
+    return tuple(np.where(valid, values, np.nan) for values in (m, b, r2, efficiency))
+
+
 # helper function - get quantity based on standard curve regression
 # in regression, y=mx+b ==
 # (Cq) = m*(log10 copies) + b
 def quantify(y, m, b):
     '''Given `y = mx + b` --> `(Cq) = m*(log10 copies) + b`, solve for `10^x` (copies) using Cq.
+
+    Works on single values or, with numpy broadcasting, on whole plates: e.g. `y` of shape (curves, wells)
+    with `m` and `b` of shape (curves, 1) quantifies every well of every fluorophore in one operation.
     Args:
-        y (float): Cq value
-        m (float): slope to use
-        b (float): intercept to use
+        y (float or np.ndarray): Cq value(s)
+        m (float or np.ndarray): slope(s) to use
+        b (float or np.ndarray): intercept(s) to use
     Returns:
         x (float): copies, converted from log10 into true copies
     '''
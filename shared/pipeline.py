@@ -0,0 +1,322 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   This script runs PANDAA batch analysis as a pipeline, so that the stages of different plates overlap: while plate N is
+#   analyzed, plate N+1 is read from disk (or a slow network share) and the PDF of plate N-1 is rendered.
+#
+#   Stages, each fed from the one before through a bounded queue:
+#     read     file content (every channel file, for Rotor-Gene) is read into memory, in a thread
+#     parse    importer.parse(), in a pool of `parse_workers` threads
+#     analyze  analyzer, in a thread
+#     export   CSV summary (and archive), in a thread - one plate at a time, in the order plates finish analysis
+#     pdf      PDF report, in a pool of `pdf_workers` processes (ReportLab holds the GIL while it renders)
+#   A stage waits when the queue after it is full, so at most a few plates are held in memory at once, however many
+#   plates there are and however slow the last stage is (back-pressure). Total time approaches that of the slowest stage,
+#   given a CPU core for each busy stage - on a single core, only waiting on files and PDF rendering can overlap.
+#
+#   A plate that fails with a PandaaError (see errors.py - e.g. a file that can't be read or isn't a results export) is
+#   recorded, as in batch.py, and skips its remaining stages - the other plates carry on. Anything else (a bug, a broken
+#   process pool, Ctrl+C) stops every stage, waits for running work to end, and is raised.
+#
+#   After a run, `utilization` has, per stage: plates processed, busy seconds, seconds spent waiting on a full queue, and
+#   the share of the run's wall time its workers were busy - the slowest stage is the one close to 1.
+#
+#   Example (run from the repo folder):
+#       python shared/pipeline.py --config hiv/config.toml --assay "076V 184VI" --machine "QuantStudio 5" exports/*.xlsx
+#
+#
+
+
+##############################################################################################################################
+### Imports
+##############################################################################################################################
+
+import os, sys
+sys.path.insert(0, os.path.dirname(__file__)) #look for custom dependencies in shared folder
+
+import argparse #command-line options
+import asyncio #stage scheduling
+import io #plates read into memory
+import json #summary output
+import time #stage timings
+import tomli #for tool config
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import compact
+import instrument
+from batch import BatchRunner, format_summary
+from errors import PandaaError, FileAccessError
+from platecache import PlateCache
+from archive import ResultsArchive
+
+
+##############################################################################################################################
+### PDF worker processes
+##############################################################################################################################
+
+def init_report_worker(info:dict):
+    '''Set report app info once, when a PDF worker process starts - it is module-level in reportbuilder.'''
+    from reportbuilder import get_app_info
+    get_app_info(info['name'], info['version'], info['use'])
+
+
+def render_report(pdf_filepath:str, header, results, path_as_filename=None):
+    '''Render a PDF report in a worker process.'''
+    from reportbuilder import Report
+    Report(pdf_filepath, header, results, path_as_filename=path_as_filename).create()
+
+
+##############################################################################################################################
+### Pipeline runner
+##############################################################################################################################
+
+done = object() #end of plates, passed down the queues after the last plate
+
+
+async def run_together(coroutines:list):
+    '''Run coroutines as tasks until all have finished - or, as soon as one fails, cancel the rest and raise its error.'''
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True) #wait for them to stop
+        raise
+
+
+class PipelineRunner(BatchRunner):
+    '''Run importer -> analyzer -> exporter -> report for many plates, with the stages of different plates overlapping.'''
+    def __init__(self, assay:str, machine_type:str, config:dict, create_pdf=None, cache=None, keep_results=False, archive=None,
+                       queue_size=2, parse_workers=1, pdf_workers=1):
+        '''
+        Args:
+            assay, machine_type, config, create_pdf, cache, keep_results, archive: as in BatchRunner
+            queue_size (int): plates each queue between two stages can hold
+            parse_workers (int): threads parsing plates at the same time - parsing is mostly Python, so more than one
+                                 only helps while files are still arriving from a slow share
+            pdf_workers (int): processes rendering PDFs at the same time
+        '''
+        super().__init__(assay, machine_type, config, create_pdf=create_pdf, workers=1, cache=cache,
+                         keep_results=keep_results, archive=archive)
+        self.queue_size = queue_size
+        self.workers_per_stage = {'read': 1, 'parse': parse_workers, 'analyze': 1, 'export': 1, 'pdf': pdf_workers}
+        self.utilization = {}
+        self.max_in_flight = 0 #most plates between reading and the end of the pipeline at once
+
+
+    def stages(self):
+        '''Names of the stages plates go through, in order.'''
+        return ['read', 'parse', 'analyze', 'export'] + (['pdf'] if self.create_pdf else [])
+
+
+    def run(self):
+        '''Analyze all collected plates through the pipeline; records are in the same order as `self.plates`.'''
+        start = time.perf_counter()
+        self.records.extend(asyncio.run(self.run_pipeline()))
+        self.elapsed = time.perf_counter() - start
+        return self.records
+
+
+    async def run_pipeline(self):
+        '''Run every stage until all plates have been through them; returns plate records, in plate order.'''
+        names = self.stages()
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in names] #queues[i] feeds stage i
+        finished = []
+        self.utilization = {name: {'plates': 0, 'busy': 0.0, 'blocked': 0.0} for name in names}
+        self.in_flight = self.max_in_flight = 0
+
+        executors = {name: ThreadPoolExecutor(max_workers=self.workers_per_stage[name], thread_name_prefix=f'pipeline-{name}')
+                     for name in names if name != 'pdf'}
+        if self.create_pdf:
+            executors['pdf'] = ProcessPoolExecutor(max_workers=self.workers_per_stage['pdf'],
+                                                   initializer=init_report_worker, initargs=(self.info,))
+        start = time.perf_counter()
+        try:
+            stages = [self.stage(name, queues[i], queues[i+1] if i+1 < len(names) else None, executors[name], finished)
+                      for i, name in enumerate(names)]
+            await run_together([self.feed(queues[0])] + stages)
+        finally:
+            for executor in executors.values(): #running work is waited for; queued work is dropped
+                executor.shutdown(wait=True, cancel_futures=True)
+
+        wall = time.perf_counter() - start
+        for name, usage in self.utilization.items():
+            usage['utilization'] = usage['busy'] / (wall * self.workers_per_stage[name]) if wall else 0.0
+        return [record for _, record in sorted(finished, key=lambda item: item[0])]
+
+
+    async def feed(self, queue:asyncio.Queue):
+        '''Put every plate on the first queue, waiting whenever it is full.'''
+        for i, plate in enumerate(self.plates):
+            await queue.put((i, self.new_record(plate), plate))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await queue.put(done)
+
+
+    async def stage(self, name:str, inbox:asyncio.Queue, outbox, executor, finished:list):
+        '''Run `workers_per_stage[name]` workers taking plates from `inbox`; once all plates are through, pass `done` on.'''
+        loop = asyncio.get_running_loop()
+        work = getattr(self, f'{name}_plate')
+        usage = self.utilization[name]
+        remaining = self.workers_per_stage[name]
+
+        async def worker():
+            nonlocal remaining
+            while True:
+                item = await inbox.get()
+                if item is done:
+                    remaining -= 1
+                    if remaining: #let the other workers of this stage see it
+                        inbox.put_nowait(done)
+                    elif outbox is not None:
+                        await outbox.put(done)
+                    return
+
+                i, record, data = item
+                if record['status'] == 'ok': #failed plates skip their remaining stages
+                    start = time.perf_counter()
+                    try:
+                        data = await work(loop, executor, record, data)
+                    except PandaaError as e: #a problem with this plate - only this plate fails
+                        record['status'] = 'failed'
+                        record['error'] = f'{name}: {e}'
+                    record['timings'][name] = seconds = time.perf_counter() - start
+                    usage['plates'] += 1
+                    usage['busy'] += seconds
+
+                if outbox is None or record['status'] != 'ok':
+                    record['timings']['total'] = sum(record['timings'].values())
+                    finished.append((i, record))
+                    self.in_flight -= 1
+                else:
+                    start = time.perf_counter()
+                    await outbox.put((i, record, data))
+                    usage['blocked'] += time.perf_counter() - start
+
+        await run_together([worker() for _ in range(self.workers_per_stage[name])])
+
+
+    ##############################################################################################################################
+    ### Stage work, for a single plate
+    ##############################################################################################################################
+
+    async def read_plate(self, loop, executor, record:dict, plate):
+        '''Read a results file (or, for Rotor-Gene, every channel file) into memory.'''
+        def read(filepath):
+            try:
+                with open(filepath, 'rb') as f:
+                    source = io.BytesIO(f.read())
+            except OSError as e: #e.g. removed, or locked by the machine's software
+                raise FileAccessError('Unable to read results file. Make sure file is not open in another program.\n\n{}'.format(e)) from e
+            source.name = filepath #extension, channel, and where the summary goes
+            return source
+        if isinstance(plate, str):
+            return await loop.run_in_executor(executor, read, plate)
+        return [await loop.run_in_executor(executor, read, filepath) for filepath in plate]
+
+
+    async def parse_plate(self, loop, executor, record:dict, source):
+        def parse():
+            importer = self.new_importer(source)
+            importer.parse()
+            importer.filepath = record['source'] #report the file, not the copy in memory
+            return importer
+        return await loop.run_in_executor(executor, parse)
+
+
+    async def analyze_plate(self, loop, executor, record:dict, importer):
+        def analyze():
+            analyzer = self.session.analyzer(importer)
+            if self.keep_results: #before export, which rounds values in place
+                record['results'] = compact.compact(analyzer.df)
+            return importer, analyzer
+        return await loop.run_in_executor(executor, analyze)
+
+
+    async def export_plate(self, loop, executor, record:dict, analyzed):
+        def export():
+            exporter = self.session.exporter(*analyzed)
+            exporter.export()
+            record['summary'] = exporter.dest_filepath
+            record['summary_bytes'] = exporter.bytes_written
+            record['archive_error'] = exporter.archive_error #plate is still analyzed - only the archive is missing it
+            return exporter
+        return await loop.run_in_executor(executor, export)
+
+
+    async def pdf_plate(self, loop, executor, record:dict, exporter):
+        pdf_filepath = os.path.splitext(exporter.dest_filepath)[0] + '.pdf'
+        path_as_filename = exporter.dest_filepath if 'QuantStudio' not in self.machine_type else None
+        await loop.run_in_executor(executor, render_report, pdf_filepath, exporter.header, exporter.results, path_as_filename)
+        record['pdf'] = pdf_filepath
+        return exporter
+
+
+    def summary(self):
+        '''Get per-run summary of timings and failures, with per-stage utilization.'''
+        summary = super().summary()
+        summary['utilization'] = self.utilization
+        summary['max_in_flight'] = self.max_in_flight
+        return summary
+
+
+def format_utilization(summary:dict):
+    '''Format per-stage utilization as text, one line per stage.'''
+    lines = [f"{'stage':<8} {'plates':>6} {'busy s':>8} {'blocked s':>9} {'busy %':>7}"]
+    for name, usage in summary['utilization'].items():
+        lines.append(f"{name:<8} {usage['plates']:>6} {usage['busy']:8.2f} {usage['blocked']:9.2f} {usage['utilization']*100:6.0f}%")
+    lines.append(f"at most {summary['max_in_flight']} plates in the pipeline at once")
+    return '\n'.join(lines)
+
+
+##############################################################################################################################
+### Command-line entry point
+##############################################################################################################################
+
+def main(argv=None):
+    '''Parse command-line options, then analyze every plate found through the pipeline.'''
+    parser = argparse.ArgumentParser(description='Analyze many PANDAA qPCR results files, overlapping reading, analysis and PDFs.')
+    parser.add_argument('paths', nargs='+', help='results files, directories, or glob patterns')
+    parser.add_argument('--config', required=True, help='tool configuration file (hiv/config.toml or vhf/config.toml)')
+    parser.add_argument('--assay', required=True, help='assay name, as defined in shared/assays.toml')
+    parser.add_argument('--machine', required=True, help='qPCR machine used for all plates')
+    parser.add_argument('--pdf', action=argparse.BooleanOptionalAction, default=None, help='create PDF reports (default: create_pdf setting in config)')
+    parser.add_argument('--summary', help='save run summary as JSON to this file')
+    parser.add_argument('--queue-size', type=int, default=2, help='plates held between two stages (default: 2)')
+    parser.add_argument('--parse-workers', type=int, default=1, help='threads parsing plates (default: 1)')
+    parser.add_argument('--pdf-workers', type=int, default=1, help='processes rendering PDFs (default: 1)')
+    parser.add_argument('--cache', help='folder for cache of parsed plates; repeat analyses of the same files skip parsing')
+    parser.add_argument('--archive', help='folder of results archive; every analyzed plate is also added to it')
+    args = parser.parse_args(argv)
+
+    with open(args.config, mode='rb') as f: #get TOML configuration
+        config = tomli.load(f)
+
+    try:
+        runner = PipelineRunner(assay=args.assay, machine_type=args.machine, config=config, create_pdf=args.pdf,
+                                cache=PlateCache(args.cache) if args.cache else None,
+                                archive=ResultsArchive(args.archive) if args.archive else None,
+                                queue_size=args.queue_size, parse_workers=args.parse_workers, pdf_workers=args.pdf_workers)
+    except PandaaError as e: #e.g. assay not in assays.toml
+        parser.error(str(e).replace('\n\n', ' '))
+    runner.collect(args.paths)
+    with instrument.span('pipeline', plates=len(runner.plates)):
+        runner.run()
+    summary = runner.summary()
+
+    print(format_summary(summary))
+    print(format_utilization(summary))
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    with instrument.profiled('pipeline'):
+        status = main()
+    sys.exit(status)
@@ -0,0 +1,217 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   This module contains the PlateCache class, an on-disk cache of parsed plates.
+#
+#   Parsing a results file (DataImporter.parse) is the slowest part of an analysis, and the same raw exports are often
+#   analyzed again: to re-issue PDFs, to change export columns, or to re-check cutoffs. PlateCache stores the standardized
+#   results dataframe, header, max dRn values and standard curves of each parsed plate, so that a repeat analysis skips
+#   parsing entirely.
+#
+#   Entries are keyed by everything that affects the parsed result: the content of the results file(s), machine type,
+#   the assay's definition in assays.toml, the machine's column schema in schemas.toml, Cq cutoff, division, and DRM
+#   percentage of the standards. Editing a file, an assay definition or a schema therefore never returns a stale plate.
+#
+#   Results are stored as Parquet (columnar, fast to read). Columns that mix value types, which Parquet can't store as
+#   they are (e.g. sample names that are numbers in some wells and text in others), are stored as text, with each value's
+#   original type recorded in the entry's meta.json - so plates come back exactly as parsed. Nothing is ever unpickled,
+#   so a cache folder on a shared drive can't be used to run code. Plates that can't be stored exactly are not cached.
+#   When the cache grows beyond its size limit, least recently used entries are removed.
+#
+#
+
+
+##############################################################################################################################
+### Imports
+##############################################################################################################################
+
+import hashlib #content hash
+import json #entry metadata
+import os #file handling
+import shutil #removing entries
+import tempfile #atomic entry creation
+import numpy as np
+import pandas as pd #file and data handling
+
+
+##############################################################################################################################
+### Columnar storage of mixed columns
+##############################################################################################################################
+
+# types of values in mixed columns, by the name recorded in meta.json - and how to get each back from its text
+value_types = {'bool': lambda text: text == 'True', 'int': int, 'float': float, 'str': str}
+
+
+def value_type(value):
+    '''Get the name of a value's type, as recorded in meta.json (None for None).'''
+    if value is None:
+        return None
+    for name, types in (('bool', (bool, np.bool_)), ('int', (int, np.integer)), ('float', (float, np.floating)), ('str', str)):
+        if isinstance(value, types): #bool before int - bools are ints too
+            return name
+    raise TypeError(f'Values of type {type(value).__name__} cannot be cached')
+
+
+def encode_results(results:pd.DataFrame):
+    '''Get a copy of results that Parquet can store, plus the value types of every column stored as text.
+
+       Object columns holding anything but text are stored as text; types are recorded per value, so that e.g.
+       sample name 1 (a number) and '1' (text) stay distinct.
+    '''
+    columns, types = {}, {}
+    for name in results.columns:
+        column = results[name]
+        if column.dtype == object and not all(isinstance(value, str) for value in column):
+            types[name] = [value_type(value) for value in column]
+            column = pd.Series([None if value is None else str(value) for value in column], index=column.index, dtype=object)
+        columns[name] = column
+    return pd.DataFrame(columns, index=results.index), types
+
+
+def decode_results(results:pd.DataFrame, types:dict):
+    '''Restore columns stored as text by encode_results() to their original values.'''
+    for name, names in types.items():
+        results[name] = pd.Series([None if kind is None else value_types[kind](text)
+                                   for text, kind in zip(results[name], names)], index=results.index, dtype=object)
+    return results
+
+
+def read_results(entry:str):
+    '''Read the results frame of a cache entry folder.'''
+    with open(os.path.join(entry, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta.get('format') != 'parquet':
+        raise ValueError(f'Unknown cache entry format: {meta.get("format")}')
+    return decode_results(pd.read_parquet(os.path.join(entry, 'results.parquet')), meta.get('types', {})), meta
+
+
+##############################################################################################################################
+
+class PlateCache:
+    '''On-disk cache of parsed plates, with least-recently-used eviction.'''
+
+    version = 5 #increase when the parsed format changes, so that old entries are no longer used
+
+    def __init__(self, directory:str, max_bytes:int=500*1024**2):
+        '''
+        Args:
+            directory (str): folder to store cached plates in; created if it doesn't exist
+            max_bytes (int): maximum total size of cache, in bytes
+        '''
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+
+    def file_hash(self, source):
+        '''Get SHA-256 hash of a file's content, given a filepath or file object.'''
+        digest = hashlib.sha256()
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as f:
+                for block in iter(lambda: f.read(1024*1024), b''):
+                    digest.update(block)
+        else: #file object - hash its content, then rewind it for parsing
+            position = source.tell()
+            content = source.read()
+            source.seek(position)
+            digest.update(content.encode() if isinstance(content, str) else content)
+        return digest.hexdigest()
+
+
+    def key(self, importer):
+        '''Get cache key for the file(s) selected in a DataImporter.'''
+        sources = importer.filepath if isinstance(importer.filepath, (list, tuple)) else [importer.filepath]
+        parts = {'version': self.version,
+                 'files': sorted(self.file_hash(source) for source in sources), #Rotor-Gene channel files can be selected in any order
+                 'machine_type': importer.machine_type,
+                 'assay': importer.config.get(importer.assay),
+                 'schema': {machine: tables for machine, tables in importer.schemas.items() if machine in (importer.machine_type or '')},
+                 'cq_cutoff': importer.cq_cutoff,
+                 'division': importer.division,
+                 'drm_percentage': importer.drm_percentage}
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+    def load(self, key:str, importer):
+        '''If plate is cached, fill in importer's results, header, max dRn values and curves, then return True.'''
+        entry = os.path.join(self.directory, key)
+        try:
+            results, meta = read_results(entry)
+        except (OSError, ValueError, KeyError, TypeError): #not cached, or entry is incomplete/corrupt - parse as usual
+            return False
+
+        importer.results = results
+        importer.head = meta['head']
+        importer.max_dRn_dict = meta['max_dRn_dict']
+        importer.curves = meta.get('curves', {})
+        os.utime(os.path.join(entry, 'meta.json')) #mark as recently used
+        return True
+
+
+    def store(self, key:str, importer):
+        '''Save importer's parsed plate to cache, then remove old entries if cache is too big.'''
+        entry = os.path.join(self.directory, key)
+        if os.path.exists(entry):
+            return
+
+        tmp_entry = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+        try:
+            types = self.write_results(importer.results, tmp_entry)
+            with open(os.path.join(tmp_entry, 'meta.json'), 'w') as f:
+                json.dump({'format': 'parquet',
+                           'types': types,
+                           'head': importer.head,
+                           'max_dRn_dict': importer.max_dRn_dict,
+                           'curves': importer.curves}, f)
+            os.replace(tmp_entry, entry) #entry only appears once it's complete
+        except (OSError, ValueError, TypeError, ImportError): #e.g. another process stored the same plate first, plate can't be
+            shutil.rmtree(tmp_entry, ignore_errors=True)    #stored exactly, or pyarrow is missing - cache is best-effort
+
+        self.evict()
+
+
+    def write_results(self, results:pd.DataFrame, folder:str):
+        '''Write results as Parquet, returning the value types of columns stored as text (see encode_results).
+
+           Raises ValueError (or TypeError) if the plate doesn't come back exactly as it is.
+        '''
+        encoded, types = encode_results(results)
+        path = os.path.join(folder, 'results.parquet')
+        encoded.to_parquet(path)
+        if not decode_results(pd.read_parquet(path), types).equals(results):
+            raise ValueError('Results do not round-trip through Parquet')
+        return types
+
+
+    def entries(self):
+        '''Get (last used, size, path) of every complete cache entry.'''
+        entries = []
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            meta = os.path.join(entry, 'meta.json')
+            if name.startswith('.') or not os.path.exists(meta):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+                entries.append((os.path.getmtime(meta), size, entry))
+            except OSError: #entry was removed by another process while listing
+                continue
+        return entries
+
+
+    def evict(self):
+        '''Remove least recently used entries until cache fits within `max_bytes`.'''
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
+    def clear(self):
+        '''Remove all cache entries.'''
+        for _, _, entry in self.entries():
+            shutil.rmtree(entry, ignore_errors=True)
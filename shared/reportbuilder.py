@@ -9,9 +9,9 @@
 
 from datetime import datetime
 import re, csv, os, sys
+sys.path.insert(0, os.path.dirname(__file__)) #look for custom dependencies in shared folder
+from xml.sax.saxutils import escape
 import pandas as pd
-import tkinter as tk
-from tkinter import messagebox
 
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -19,10 +19,13 @@ from reportlab.lib.enums import TA_LEFT, TA_RIGHT, TA_CENTER, TA_JUSTIFY
 from reportlab.lib.units import inch
 from reportlab.lib import utils, colors
 from reportlab.pdfgen import canvas
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.platypus import Flowable, Table, TableStyle
 from reportlab.pdfbase.pdfmetrics import stringWidth
 
+from errors import FileAccessError, ReportError
+import instrument #timing spans, when switched on
+
 app_name = 'ReFocus Assistant'
 app_ver = '0'
 app_use = '(RUO)'
@@ -36,40 +39,65 @@ def get_app_info(name, ver, use):
     app_info = app_name + ' v' + app_ver + ' ' + app_use
 
 
+sample_styles = None
+
+def get_styles():
+    '''Get ReportLab's sample stylesheet - built once, then shared by every report and page.'''
+    global sample_styles
+    if sample_styles is None:
+        sample_styles = getSampleStyleSheet()
+    return sample_styles
+
+
+logo = None
+
+def get_logo(filepath:str):
+    '''Get the decoded logo image and its aspect ratio - read once, then shared by every report.'''
+    global logo
+    if logo is None or logo[0] != filepath:
+        img = utils.ImageReader(filepath) #ImageReader uses Pillow to get information about image, so that we can grab the image size
+        img_width, img_height = img.getSize()
+        logo = (filepath, img, img_height / float(img_width))
+    return logo[1:]
+
+
 #################################################################################
 ### Make header and footer to be repeated on each page
 #################################################################################
 
 class PageNumCanvas(canvas.Canvas):
-    '''Instances can be passed to the canvasmaker argument of doc.build(), allowing page numbers to be added in the bottom right corner.'''
+    '''Instances can be passed to the canvasmaker argument of doc.build(), allowing page numbers to be added in the bottom right corner.
+
+       Each page refers to a 'Page x of y' form that is only filled in when the document is saved, once the total page count
+       is known - so pages are written out as they are finished, instead of being held in memory until the end.
+    '''
     def __init__(self, *args, **kwargs):
         '''Constructor'''
         canvas.Canvas.__init__(self, *args, **kwargs)
-        self.pages = []
+        self.page_count = 0
 
     def showPage(self): #override
-        '''On a page break, add new page info to list'''
-        self.pages.append(dict(self.__dict__))
-        self._startPage()
+        '''On a page break, place page number form on page, then finish page'''
+        self.page_count += 1
+        self.doForm('pagenum{}'.format(self.page_count))
+        canvas.Canvas.showPage(self)
 
     def save(self): #override
-        '''Get total pages, then draw 'Page x of y' text on each page'''
-        page_count = len(self.pages)
-        for page in self.pages:
-            self.__dict__.update(page)
-            self.draw_page_number(page_count)
-            canvas.Canvas.showPage(self)
+        '''Get total pages, then define the 'Page x of y' form used on each page'''
+        for page in range(1, self.page_count+1):
+            self.beginForm('pagenum{}'.format(page))
+            self.draw_page_number(page, self.page_count)
+            self.endForm()
         
         try:
             canvas.Canvas.save(self)
-        except Exception as e:
-            tk.messagebox.showerror(message="PDF unable to be saved. Make sure file is not open in another program.\n\n{}".format(e))
-            raise SystemExit()
+        except OSError as e:
+            raise FileAccessError("PDF unable to be saved. Make sure file is not open in another program.\n\n{}".format(e)) from e
 
 
-    def draw_page_number(self, page_count):
+    def draw_page_number(self, page_number, page_count):
         '''Format 'Page x of y' text in bottom right corner of each page'''
-        page = 'Page %s of %s' % (self._pageNumber, page_count)
+        page = 'Page %s of %s' % (page_number, page_count)
         self.setFont('Helvetica-Oblique', 9)
         self.drawRightString(7.75*inch-5, 0.5*inch+3, page)
 
@@ -94,19 +122,19 @@ def strip_ascii(text):
 def footer(canvas, doc):
     '''Draw left-aligned footer with version and date info'''
     width, height = doc.pagesize
-    styles = getSampleStyleSheet()
     font_size = 9
     
-    # left aligned part
-    ptext = '''<font size={fsize}><em>
-            Generated by {app} 
-            at {date}
-            </em></font>'''.format(fsize=font_size,
-                                   app=app_info,
-                                   date=datetime.now().strftime('%d-%b-%Y %H:%M:%S'))
-    p = Paragraph(ptext, styles['Normal'])
-    p.wrapOn(canvas, width, height)
-    p.drawOn(canvas, doc.leftMargin+5, 0.5*inch)
+    # left aligned part - laid out on first page, then reused on every later page
+    if getattr(doc, 'footer_paragraph', None) is None:
+        ptext = '''<font size={fsize}><em>
+                Generated by {app} 
+                at {date}
+                </em></font>'''.format(fsize=font_size,
+                                       app=app_info,
+                                       date=datetime.now().strftime('%d-%b-%Y %H:%M:%S'))
+        doc.footer_paragraph = Paragraph(ptext, get_styles()['Normal'])
+        doc.footer_paragraph.wrapOn(canvas, width, height)
+    doc.footer_paragraph.drawOn(canvas, doc.leftMargin+5, 0.5*inch)
 
     # right aligned part - 'Page x of y' - is covered by PageNumCanvas
 
@@ -114,22 +142,27 @@ def footer(canvas, doc):
 def header(canvas, doc):
     '''Draw header with right-aligned experiment name'''
     width, height = doc.pagesize
-    styles = getSampleStyleSheet()
-    font_size = 9
-    regex = re.compile('<.*?>') #lazy - match as few chars as possible between <>
-    
-    # left aligned part of header
-    ptext = '<font size={}><em>Report</em></font>'.format(font_size)
-    p = Paragraph(ptext, styles['Normal'])
-    p.wrapOn(canvas, width, height)
-    p.drawOn(canvas, doc.leftMargin+5, height - doc.topMargin)
 
-    # right aligned part of header
-    ptext = '''<font size={0}><em>{1}</em></font>'''.format(font_size, doc.name)
-    p = Paragraph(ptext, styles['Normal'])
-    p_width = stringWidth(re.sub(regex, '', ptext), styles['Normal'].fontName, font_size)
-    p.wrapOn(canvas, width, height)
-    p.drawOn(canvas, width - doc.rightMargin - p_width - 5, height - doc.topMargin)
+    # header is the same on every page - lay it out once per document
+    if getattr(doc, 'header_paragraphs', None) is None:
+        styles = get_styles()
+        font_size = 9
+        regex = re.compile('<.*?>') #lazy - match as few chars as possible between <>
+        
+        # left aligned part of header
+        ptext = '<font size={}><em>Report</em></font>'.format(font_size)
+        left = Paragraph(ptext, styles['Normal'])
+        left.wrapOn(canvas, width, height)
+
+        # right aligned part of header
+        ptext = '''<font size={0}><em>{1}</em></font>'''.format(font_size, doc.name)
+        right = Paragraph(ptext, styles['Normal'])
+        right_width = stringWidth(re.sub(regex, '', ptext), styles['Normal'].fontName, font_size)
+        right.wrapOn(canvas, width, height)
+        doc.header_paragraphs = [(left, doc.leftMargin+5), (right, width - doc.rightMargin - right_width - 5)]
+
+    for p, x in doc.header_paragraphs:
+        p.drawOn(canvas, x, height - doc.topMargin)
 
 
 def header_and_footer(canvas, doc):
@@ -148,7 +181,7 @@ class Header(Flowable):
         Flowable.__init__(self)
         self.width = width
         self.height = height
-        self.styles = getSampleStyleSheet()
+        self.styles = get_styles()
 
     def coord(self, x, y, unit=1):
         '''Based on (x,y) in inches or mm, get coordinate in points'''
@@ -169,14 +202,11 @@ class Header(Flowable):
         img_filepath = self.get_path(filename='aldatulogo_icon.gif')
         desired_width = 30
 
-        img = utils.ImageReader(img_filepath) #ImageReader uses Pillow to get information about image, so that we can grab the image size
-        img_width, img_height = img.getSize()
-        aspect = img_height / float(img_width) #calculate aspect ratio based on obtained height and width information
-        img = Image(img_filepath,
-                width=desired_width,
-                height=(desired_width * aspect)) #scale height based on aspect ratio
-        img.wrapOn(self.canv, self.width, self.height)
-        img.drawOn(self.canv, *self.coord(0,0,inch))
+        img, aspect = get_logo(img_filepath) #decoded once per process, not once per report
+        self.canv.drawImage(img, *self.coord(0,0,inch),
+                            width=desired_width,
+                            height=(desired_width * aspect), #scale height based on aspect ratio
+                            mask='auto')
 
         ptext = '<font size=18><b>Report</b></font>'
         p = Paragraph(ptext, self.styles['Normal'])
@@ -190,12 +220,12 @@ class Report:
        Experiment name is used in non-first-page headers. Pass the filepath to 'path_as_filename' to use the path as the experiment name.
     '''
     def __init__(self, pdf_file, head, results, pagesize=letter, path_as_filename=None):
-        ''''''
+        '''Errors are raised (see errors.py), never shown - gui.py shows them when run from the GUI tools.'''
         self.doc = SimpleDocTemplate(pdf_file, pagesize=pagesize,
                                      rightMargin=0.75*inch, leftMargin=0.75*inch,
                                      topMargin=0.75*inch, bottomMargin=0.75*inch)
         self.elements = []
-        self.styles = getSampleStyleSheet()
+        self.styles = get_styles()
         self.ralign_style = ParagraphStyle(name='RightAlign', parent=self.styles['Normal'], alignment=TA_RIGHT)
         self.width, self.height = pagesize
 
@@ -205,10 +235,6 @@ class Report:
         self.path_as_filename = path_as_filename
         self.doc.name = ''
 
-        # initialize GUI, hide main window
-        self.root = tk.Tk()
-        self.root.withdraw()
-
 
     def coord(self, x, y, unit=1):
         '''Based on (x,y) in inches or mm, get coordinate in points'''
@@ -329,20 +355,92 @@ class Report:
             
             return data
 
-        # Handle input_data (file or list)
+        return process_data(self.read_rows(input_data), bold)
+
+
+    def read_rows(self, input_data):
+        '''Get rows of CSV file, list, or dataframe (with column headers as first row) as a list of lists.'''
         if isinstance(input_data, list):
-            return process_data(input_data, bold)
+            return input_data
         
         elif isinstance(input_data, pd.DataFrame):
             header = list(input_data) #gets column headers
             data = input_data.values.tolist() #gets dataframe as a list of lists, but lacks column headers
             data.insert(0, header)
-            return process_data(data, bold)
+            return data
         
         else:
             with open(input_data, newline='') as csvfile:
                 reader = csv.reader(csvfile, delimiter=',')
-                return process_data(reader, bold)
+                return list(reader)
+
+
+    def is_number(self, value):
+        '''Check if table cell holds a number (or percentage), i.e. should be right aligned.'''
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return True
+        try:
+            float(str(value).strip('%'))
+            return True
+        except ValueError:
+            return False
+
+
+    def results_to_table(self, input_data, colWidths, size=10):
+        '''Convert results to data for a ReportLab Table object, plus TableStyle commands for the table body.
+
+           Only the column headers are Paragraph objects. Other cells are plain strings, which ReportLab draws much faster;
+           a cell only becomes a (wrapping) Paragraph if its text is wider than its column. Numbers are right aligned
+           using ALIGN commands, one per run of numeric cells in a column.
+        '''
+        font_name = self.styles['Normal'].fontName
+        leading = size * 1.2
+        wrap_styles = {False: ParagraphStyle(name='ResultsCell', parent=self.styles['Normal'], fontSize=size, leading=leading),
+                       True: ParagraphStyle(name='ResultsCellRight', parent=self.styles['Normal'], fontSize=size, leading=leading, alignment=TA_RIGHT)}
+        padding = 12 #default left + right cell padding
+
+        data = []
+        numeric = [] #(column, row) of right aligned cells
+        first = True
+        for row in self.read_rows(input_data):
+            row_data = []
+            row_numeric = [] #columns of right aligned cells in this row - only kept if the row is
+            for item in row:
+                if item == '':
+                    continue
+                plain = strip_ascii(item)
+                if first:
+                    row_data.append(self.create_text(plain, bold=True))
+                    continue
+
+                text = str(plain)
+                right = self.is_number(plain)
+                col = len(row_data)
+                width = colWidths[col] if col < len(colWidths) else colWidths[-1]
+                if stringWidth(text, font_name, size) > width - padding: #too wide for one line - wrap it
+                    row_data.append(Paragraph(escape(text), wrap_styles[right]))
+                else:
+                    row_data.append(text)
+                if right:
+                    row_numeric.append(col)
+            if len(row_data) > 1: #if there's data in this row, add it to list
+                numeric.extend((col, len(data)) for col in row_numeric)
+                data.append(row_data)
+            first = False
+
+        commands = [('FONT', (0,1), (-1,-1), font_name, size, leading)]
+        runs = {} #column -> [first row, last row] of current run of numeric cells
+        for col, row in sorted(numeric):
+            run = runs.get(col)
+            if run and run[1] == row - 1:
+                run[1] = row
+            else:
+                if run:
+                    commands.append(('ALIGN', (col, run[0]), (col, run[1]), 'RIGHT'))
+                runs[col] = [row, row]
+        for col, (start, end) in runs.items():
+            commands.append(('ALIGN', (col, start), (col, end), 'RIGHT'))
+        return data, commands
 
 
     def count_columns(self, input_data):
@@ -388,8 +486,7 @@ class Report:
         try:
             table = Table(data, colWidths=colWidths)
         except Exception as e:
-            tk.messagebox.showerror(message="No header information found. Ensure that run information exists in raw results file.\n\n{}".format(e))
-            raise SystemExit()
+            raise ReportError("No header information found. Ensure that run information exists in raw results file.\n\n{}".format(e)) from e
 
         table.setStyle(table_style)
         table.hAlign = 'LEFT'
@@ -404,16 +501,16 @@ class Report:
         self.elements.append(p)
         self.elements.append(Spacer(1, 0.2*inch))
 
-        data = self.csv_to_table(self.results, bold='top')
-
         numCols = self.count_columns(self.results) #get number of columns in dataset
         dataWidth = 6.375*inch // (numCols-1)      #page width is allocated equally across data (non-index) columns
         colWidths = [dataWidth]*(numCols-1)        #turn column widths into list
         colWidths.insert(0, 0.5*inch)              #add index column width to beginning of list
 
+        data, cell_commands = self.results_to_table(self.results, colWidths)
+
         table_style = TableStyle([('INNERGRID', (0,0), (-1,-1), 0.25, colors.black),
                                   ('BOX', (0,0), (-1,-1), 0.25, colors.black),
-                                  ('VALIGN',(0,0),(-1,-1),'MIDDLE')])
+                                  ('VALIGN',(0,0),(-1,-1),'MIDDLE')] + cell_commands)
 
         table = Table(data,
                       colWidths=colWidths,
@@ -427,9 +524,10 @@ class Report:
         '''Create Report PDF with header, run info table, results table'''
         self.create_header()
         self.create_run_info()
-        self.create_results()
-        self.save()
-        tk.messagebox.showinfo(title="Success", message=f"PDF summary saved:\n\n{self.pdf_file}")
+        with instrument.span('pdf_tables'):
+            self.create_results()
+        with instrument.span('pdf_build'):
+            self.save()
 
 
     def save(self):
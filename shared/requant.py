@@ -0,0 +1,271 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   This script re-quantifies stored HIV plates, e.g. after the DRM standards or `drm_percentage` change.
+#
+#   Input plates are standardized results frames, as produced by DataImporter (Mic files keep each well's
+#   'Assigned Quantity' plus one '<fluor> CT' column per fluorophore). They can be read from .parquet or .csv files,
+#   or straight from a plate cache folder (see platecache.py). Plates without these columns - VHF plates, or HIV plates
+#   from machines that don't export assigned quantities - are skipped and listed, so a mixed archive can be passed as is.
+#
+#   Instead of parsing and fitting plate by plate, plates are stacked into padded (plate, fluorophore, well) arrays, and
+#   every standard curve of every plate is fitted in one batched call to linreg.fit_curves(). Copies, DRM percentages and
+#   calls are then recomputed for the whole stack at once. Plates are processed in chunks, so memory use stays bounded
+#   however large the archive is.
+#
+#   Example (run from the repo folder):
+#       python shared/requant.py --config hiv/config.toml --assay "076V 184VI" --drm-percentage 0.25 --out requantified archive/
+#
+#
+
+
+##############################################################################################################################
+### Imports
+##############################################################################################################################
+
+import os, sys
+sys.path.insert(0, os.path.dirname(__file__)) #look for custom dependencies in shared folder
+
+import argparse #command-line options
+import glob #expand file patterns
+import time #throughput
+import numpy as np
+import pandas as pd
+import tomli #for assay and tool config
+
+import linreg
+from data_analysis import hiv_calls
+from platecache import read_results
+
+
+##############################################################################################################################
+### Reading stored plates
+##############################################################################################################################
+
+plate_extensions = ('.parquet', '.csv')
+
+
+def expand_plate_paths(paths:list):
+    '''Expand files, glob patterns and folders (searched recursively, e.g. a plate cache) into a sorted list of stored plates.'''
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = [os.path.join(folder, name) for folder, _, names in os.walk(path) for name in names]
+        else:
+            candidates = glob.glob(path) or [path]
+        for candidate in candidates:
+            if (os.path.splitext(candidate)[1].lower() in plate_extensions
+                and not os.path.basename(candidate).startswith('.')
+                and candidate not in found):
+                found.append(candidate)
+    return sorted(found)
+
+
+def plate_name(filepath:str):
+    '''Name of a stored plate: its file name or, for plate cache entries, the name of the entry folder.'''
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    if name == 'results':
+        return os.path.basename(os.path.dirname(filepath))
+    return name
+
+
+def load_plate(filepath:str):
+    '''Read a stored standardized results frame.'''
+    ext = os.path.splitext(filepath)[1].lower()
+    folder = os.path.dirname(filepath)
+    if os.path.basename(filepath) == 'results.parquet' and os.path.exists(os.path.join(folder, 'meta.json')): #plate cache entry
+        return read_results(folder)[0]
+    elif ext == '.parquet':
+        return pd.read_parquet(filepath)
+    return pd.read_csv(filepath)
+
+
+##############################################################################################################################
+### Re-quantification
+##############################################################################################################################
+
+class Requantifier:
+    '''Re-quantifies many stored HIV plates at once, fitting all of their standard curves in one batched pass.'''
+    def __init__(self, assay:str, drm_percentage=0.2, min_drm_percent=0.05, max_drm_percent=0.1,
+                       config='assays.toml', chunk_size=2048):
+        '''
+        Args:
+            assay (str): assay name, as defined in assays.toml
+            drm_percentage (float): DRM percentage of the standards (see linreg.linreg)
+            min_drm_percent, max_drm_percent (float): call cutoffs, as in DataAnalyzer
+            config (str): assay configuration file, relative to the shared folder
+            chunk_size (int): number of plates stacked and fitted together
+        '''
+        with open(os.path.join(os.path.dirname(__file__), config), mode='rb') as f: #get TOML configuration
+            assays = tomli.load(f)
+        self.reporter_dict = assays[assay]['assay']
+        self.ic = assays[assay]['ic']
+        self.reporter_list = [key for key in self.reporter_dict]
+
+        self.drm_percentage = drm_percentage
+        self.min_drm_percent = min_drm_percent
+        self.max_drm_percent = max_drm_percent
+        self.chunk_size = chunk_size
+
+        self.stats = {'plates': 0, 'curves': 0, 'seconds': 0.0, 'plates_per_second': 0.0}
+
+
+    def missing_columns(self, plate:pd.DataFrame):
+        '''Get the columns a plate needs for re-quantification but doesn't have.'''
+        required = ['Assigned Quantity'] + [f'{fluor} CT' for fluor in self.reporter_list]
+        return [column for column in required if column not in plate.columns]
+
+
+    def stack(self, plates:list):
+        '''Stack plates into NaN-padded arrays.
+
+        Returns:
+            quantities (np.ndarray): assigned copy numbers, shape (plate, fluor, well) - already scaled by `drm_percentage`
+                                     for DRM fluorophores; NaN for unknowns and padding
+            cqs (np.ndarray): Cq values, shape (plate, fluor, well)
+        '''
+        wells = max(len(plate) for plate in plates)
+        quantities = np.full((len(plates), len(self.reporter_list), wells), np.nan)
+        cqs = np.full((len(plates), len(self.reporter_list), wells), np.nan)
+
+        # controls have 20% DRMs - multiply VQ quant by 0.2 to get DRM quant (as in linreg.linreg)
+        percent_drm = np.array([1 if fluor == 'CY5' else self.drm_percentage for fluor in self.reporter_list])
+
+        for i, plate in enumerate(plates):
+            assigned = plate['Assigned Quantity'].to_numpy(dtype=float)
+            assigned[assigned <= 0] = np.nan #analyzed frames have blanks filled with 0 - these are unknowns, not standards
+            quantities[i, :, :len(plate)] = assigned * percent_drm[:, None]
+            for j, fluor in enumerate(self.reporter_list):
+                cqs[i, j, :len(plate)] = plate[f'{fluor} CT'].to_numpy(dtype=float)
+        return quantities, cqs
+
+
+    def requantify_chunk(self, plates:list):
+        '''Re-fit standard curves and recompute copies, DRM percentages and calls for a list of plates.'''
+        quantities, cqs = self.stack(plates)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            m, b, r2, efficiency = linreg.fit_curves(np.log10(quantities), cqs)
+            copies = linreg.quantify(cqs, m[..., None], b[..., None])
+
+            # DRM percentage = DRM copies / VQ copies, with blank values treated as 0 - see DataAnalyzer.hiv_analysis
+            filled = np.where(np.isnan(copies), 0, copies)
+            ic = self.reporter_list.index(self.ic)
+            drm_percent = {}
+            for i, fluor in enumerate(self.reporter_list[1:]):
+                j = self.reporter_list.index(fluor)
+                if i == 0:
+                    percent = copies[:, j] / copies[:, ic]
+                else:
+                    percent = filled[:, j] / filled[:, ic]
+                drm_percent[fluor] = np.where(np.isnan(percent), 0, percent)
+
+        calls = {fluor: hiv_calls(drm_percent[fluor], filled[:, ic], self.min_drm_percent, self.max_drm_percent)
+                 for fluor in self.reporter_list[1:]}
+
+        requantified = []
+        for p, plate in enumerate(plates):
+            wells = len(plate)
+            new_columns = {}
+            for j, fluor in enumerate(self.reporter_list):
+                new_columns[f'{fluor} Quantity'] = copies[p, j, :wells]
+            for fluor in self.reporter_list[1:]:
+                target = self.reporter_dict[fluor]
+                new_columns[f'{target} DRM Percentage'] = drm_percent[fluor][p, :wells]
+                new_columns[f'{target} Call'] = calls[fluor][p, :wells]
+
+            # build each frame in one go - inserting columns one at a time costs more than the fit itself
+            columns = {column: new_columns.pop(column, plate[column].to_numpy()) for column in plate.columns}
+            df = pd.DataFrame({**columns, **new_columns}, index=plate.index)
+            df.attrs['curves'] = {fluor: {'slope': float(m[p, j]), 'intercept': float(b[p, j]),
+                                          'r2': float(r2[p, j]), 'efficiency': float(efficiency[p, j])}
+                                  for j, fluor in enumerate(self.reporter_list)}
+            requantified.append(df)
+        return requantified
+
+
+    def requantify(self, plates):
+        '''Re-quantify an iterable of standardized results frames, `chunk_size` plates at a time; yields frames in order.'''
+        start = time.perf_counter()
+        chunk = []
+        for plate in plates:
+            missing = self.missing_columns(plate)
+            if missing:
+                raise ValueError(f"Plate cannot be re-quantified, missing columns: {', '.join(missing)}")
+            chunk.append(plate)
+            if len(chunk) == self.chunk_size:
+                yield from self.finish_chunk(chunk, start)
+                chunk = []
+        if chunk:
+            yield from self.finish_chunk(chunk, start)
+
+
+    def finish_chunk(self, chunk:list, start:float):
+        '''Re-quantify one chunk and update throughput stats.'''
+        requantified = self.requantify_chunk(chunk)
+        self.stats['plates'] += len(chunk)
+        self.stats['curves'] += len(chunk) * len(self.reporter_list)
+        self.stats['seconds'] = time.perf_counter() - start
+        self.stats['plates_per_second'] = self.stats['plates'] / self.stats['seconds'] if self.stats['seconds'] else 0.0
+        return requantified
+
+
+##############################################################################################################################
+### Command-line entry point
+##############################################################################################################################
+
+def usable_plates(filepaths:list, requantifier:Requantifier, kept:list, skipped:list):
+    '''Load stored plates one at a time, yielding those that can be re-quantified.
+
+       Paths of yielded plates are appended to `kept`; others go to `skipped`, as (path, reason).
+    '''
+    for filepath in filepaths:
+        try:
+            plate = load_plate(filepath)
+        except (OSError, ValueError) as e: #unreadable or not a results frame
+            skipped.append((filepath, f'cannot be read ({e})'))
+            continue
+        missing = requantifier.missing_columns(plate)
+        if missing:
+            skipped.append((filepath, f"missing columns: {', '.join(missing)}"))
+            continue
+        kept.append(filepath)
+        yield plate
+
+
+def main(argv=None):
+    '''Parse command-line options, then re-quantify every stored plate found.'''
+    parser = argparse.ArgumentParser(description='Re-quantify stored HIV plates with new standards settings.')
+    parser.add_argument('paths', nargs='+', help='stored plates (.parquet, .csv), folders, or glob patterns')
+    parser.add_argument('--config', required=True, help='tool configuration file (hiv/config.toml)')
+    parser.add_argument('--assay', required=True, help='assay name, as defined in shared/assays.toml')
+    parser.add_argument('--drm-percentage', type=float, default=0.2, help='DRM percentage of the standards (default: 0.2)')
+    parser.add_argument('--out', required=True, help='folder to write re-quantified plates to, as .parquet')
+    parser.add_argument('--chunk-size', type=int, default=2048, help='number of plates fitted together (default: 2048)')
+    args = parser.parse_args(argv)
+
+    with open(args.config, mode='rb') as f: #get TOML configuration
+        intc = tomli.load(f)['int']
+
+    requantifier = Requantifier(args.assay, drm_percentage=args.drm_percentage,
+                                min_drm_percent=intc['min_drm_percent'], max_drm_percent=intc['max_drm_percent'],
+                                chunk_size=args.chunk_size)
+    filepaths = expand_plate_paths(args.paths)
+    os.makedirs(args.out, exist_ok=True)
+
+    kept, skipped = [], []
+    plates = usable_plates(filepaths, requantifier, kept, skipped)
+    for i, df in enumerate(requantifier.requantify(plates)): #plate i is always loaded (and kept) before it is yielded
+        df.attrs = {} #curves are not stored in Parquet metadata
+        df.to_parquet(os.path.join(args.out, plate_name(kept[i]) + '.parquet'), index=False)
+
+    for filepath, reason in skipped:
+        print(f'Skipped {filepath}: {reason}')
+    stats = requantifier.stats
+    print(f"{stats['plates']} plates ({stats['curves']} standard curves) re-quantified in {stats['seconds']:.2f} s "
+          f"({stats['plates_per_second']:.0f} plates/s), {len(skipped)} skipped")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
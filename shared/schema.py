@@ -0,0 +1,172 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   This module contains the Schema class: the column types, blank tokens, thousands separators and column renames of
+#   one machine's results table, as declared in schemas.toml.
+#
+#   Results tables used to be read as text, then cleaned up step by step in each parser ('Undetermined' replaced,
+#   pd.to_numeric applied per column, blanks filled, columns renamed, wells cast to int), each step copying the column.
+#   With a schema, the readers build each column with its final type as the table is read:
+#     - pandas readers (pd.read_csv, Workbook.read_sheet/read_table) take read_options() - dtype, na_values, thousands,
+#       and converters for columns with tokens - followed by finish() (renames and blank fills)
+#     - the line-by-line text readers (QuantStudio .txt, Mic .csv) build typed columns with frame()
+#   A cell that isn't a number in a numeric column raises a FormatError naming the column and value, unless the column is
+#   listed in `coerce` - then it is read as blank (and filled).
+#
+#
+
+
+##############################################################################################################################
+### Imports
+##############################################################################################################################
+
+import os, sys
+sys.path.insert(0, os.path.dirname(__file__)) #look for custom dependencies in shared folder
+
+import functools #schemas are only loaded once
+import itertools #for building columns from rows
+import numpy as np
+import pandas as pd #file and data handling
+import tomli #for schema config
+from errors import FormatError
+
+
+##############################################################################################################################
+
+dtypes = {'float': float, 'int': int, 'str': object}
+
+
+@functools.lru_cache(maxsize=None)
+def load_schemas(config='schemas.toml'):
+    '''Load all machine schemas from a TOML file in the shared folder; each file is only read once.'''
+    with open(os.path.join(os.path.dirname(__file__), config), mode='rb') as f:
+        return tomli.load(f)
+
+
+class Schema:
+    '''Column schema of one results table.'''
+
+    settings = ('rename', 'dtype', 'thousands', 'na_values', 'tokens', 'coerce', 'fill')
+
+    def __init__(self, spec:dict, ext:str='', cq_cutoff=35):
+        '''
+        Args:
+            spec (dict): table definition from schemas.toml, e.g. `load_schemas()['QuantStudio']['results']`
+            ext (str): file extension - settings in the table's sub-table for this extension (e.g. `[QuantStudio.results.txt]`) take precedence
+            cq_cutoff (float): value of "cq_cutoff" in tokens and fill
+        '''
+        settings = {key: value for key, value in spec.items() if key in self.settings}
+        settings.update(spec.get(ext.lstrip('.').lower(), {}))
+
+        self.rename = settings.get('rename', {})
+        self.dtype = {column: dtypes[name] for column, name in settings.get('dtype', {}).items()}
+        self.thousands = settings.get('thousands')
+        self.na_values = list(settings.get('na_values', []))
+        self.tokens = {column: {token: self.value(value, cq_cutoff) for token, value in tokens.items()}
+                       for column, tokens in settings.get('tokens', {}).items()}
+        self.coerce = set(settings.get('coerce', []))
+        self.fill = {column: self.value(value, cq_cutoff) for column, value in settings.get('fill', {}).items()}
+
+
+    def value(self, value, cq_cutoff):
+        return cq_cutoff if value == 'cq_cutoff' else value
+
+
+    def sources(self, column:str):
+        '''Get every name a (standardized) column may have in the file.'''
+        names = [source for source, name in self.rename.items() if name == column]
+        if column not in self.rename:
+            names.append(column)
+        return names
+
+
+    def rename_columns(self, columns):
+        return [self.rename.get(column, column) for column in columns]
+
+
+    ##############################################################################################################################
+    ### pandas readers
+    ##############################################################################################################################
+
+    def read_options(self):
+        '''Get keyword arguments for pd.read_csv / TextParser that type columns as they are parsed.
+
+           Columns with tokens, or coerced, get a converter instead of a dtype, since parsers can't tell a token from a blank
+           cell, and can't read a cell that isn't a number as blank.
+        '''
+        converted = set(self.tokens) | self.coerce
+        options = {'dtype': {source: dtype for column, dtype in self.dtype.items() if column not in converted
+                                           for source in self.sources(column)},
+                   'converters': {source: functools.partial(self.convert, column=column) for column in converted
+                                                                                         for source in self.sources(column)}}
+        if self.thousands:
+            options['thousands'] = self.thousands
+        if self.na_values:
+            options['na_values'] = self.na_values
+        return options
+
+
+    def finish(self, df:pd.DataFrame):
+        '''Rename columns and fill blanks of a table read with read_options().'''
+        df.columns = self.rename_columns(df.columns)
+        for column, value in self.fill.items():
+            if column in df.columns and df[column].hasnans:
+                df[column] = df[column].fillna(value)
+        return df
+
+
+    ##############################################################################################################################
+    ### Line-by-line readers
+    ##############################################################################################################################
+
+    def convert(self, value, column:str):
+        '''Convert one raw cell value (string, number or None) of a numeric column.'''
+        if isinstance(value, str):
+            value = value.strip()
+            tokens = self.tokens.get(column)
+            if tokens and value in tokens:
+                return tokens[value]
+            if value == '' or value in self.na_values:
+                value = None
+            elif self.thousands:
+                value = value.replace(self.thousands, '')
+        if value is None or value != value: #blank or NaN
+            return self.fill.get(column, np.nan)
+        try:
+            return float(value)
+        except ValueError:
+            if column in self.coerce:
+                return self.fill.get(column, np.nan)
+            raise self.bad_value(column, value) from None
+
+
+    def integer(self, value, column:str):
+        '''Convert one raw cell value of an int column.'''
+        try:
+            return int(value)
+        except (TypeError, ValueError): #e.g. a well position ('A1') where a well number is expected, or a missing cell
+            raise self.bad_value(column, value) from None
+
+
+    def bad_value(self, column:str, value):
+        return FormatError(f'Incorrect file. Value {value!r} in column {column!r} is not a number - check machine type and file.')
+
+
+    def frame(self, header:list, rows:list):
+        '''Build a typed dataframe from rows of strings - short rows are padded with None, as in pd.DataFrame(rows).'''
+        columns = list(itertools.zip_longest(*rows, fillvalue=None)) if rows else [()]*len(header)
+        columns += [(None,)*len(rows)]*(len(header) - len(columns))
+
+        data = {}
+        for i, column in enumerate(self.rename_columns(header)):
+            dtype = self.dtype.get(column, object)
+            if dtype is object:
+                data[i] = pd.Series(columns[i], dtype=object)
+            elif dtype is int:
+                data[i] = pd.Series([self.integer(value, column) for value in columns[i]], dtype=int)
+            else:
+                data[i] = np.array([self.convert(value, column) for value in columns[i]], dtype=float)
+        df = pd.DataFrame(data)
+        df.columns = self.rename_columns(header)
+        return df
@@ -0,0 +1,108 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   This module contains the SectionIndex class, used to parse Mic .csv exports.
+#
+#   A Mic .csv export is a series of sections (one per worksheet of the equivalent Excel file), separated by blank lines.
+#   The first line of each section is its title, e.g. 'Start Worksheet - Analysis - Cycling A.Green - Results'.
+#
+#   SectionIndex reads the file once and, in the same pass, records where every section starts and ends (as byte offsets
+#   into the in-memory copy) and where the run information header ends. Sections are then fetched directly by title,
+#   so parsing time depends on file size rather than on the number of fluorophores x the number of sections.
+#
+#
+
+
+##############################################################################################################################
+### Imports
+##############################################################################################################################
+
+import csv #text file parsing
+import locale #results files are read with the system's default encoding, as with open()
+import os #for filepath handling
+
+
+##############################################################################################################################
+
+class SectionIndex:
+    '''Index of the blank-line-separated sections in a CSV export.'''
+    def __init__(self, source, stop:str='Log', encoding:str=None):
+        '''
+        Args:
+            source (str or file-like): path to .csv file, or file object (binary or text)
+            stop (str): the run information header ends at the first line containing this text
+            encoding (str): text encoding; defaults to the system's default encoding
+        '''
+        self.encoding = encoding or locale.getpreferredencoding(False)
+
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as f:
+                self.data = f.read()
+        else:
+            self.data = source.read()
+            if isinstance(self.data, str):
+                self.data = self.data.encode(self.encoding)
+
+        self.sections = []  #list of (title, start offset, end offset), in file order
+        self.offsets = {}   #title -> (start offset, end offset) of first section with that title
+        self.head_end = 0   #byte offset where run information header ends
+
+        self.index(stop.encode(self.encoding) if stop else None)
+
+
+    def index(self, stop:bytes):
+        '''Record section and header boundaries in one pass over the file.'''
+        offset = 0
+        start = None
+        head_found = stop is None
+
+        for line in self.data.splitlines(keepends=True):
+            if not head_found and stop in line and stop.decode(self.encoding) in str(self.parse([line])[0]):
+                self.head_end = offset
+                head_found = True
+
+            if line.strip() == b'': #blank line - end of current section
+                if start is not None:
+                    self.add_section(start, offset)
+                    start = None
+            elif start is None: #first line of a new section
+                start = offset
+            offset += len(line)
+
+        if start is not None:
+            self.add_section(start, offset)
+        if not head_found:
+            self.head_end = offset
+
+
+    def add_section(self, start:int, end:int):
+        '''Add section to index, using its first line as its title.'''
+        title = self.decode(self.data[start:end].splitlines()[0]).strip()
+        self.sections.append((title, start, end))
+        self.offsets.setdefault(title, (start, end))
+
+
+    def decode(self, data:bytes):
+        return data.decode(self.encoding)
+
+
+    def parse(self, lines:list):
+        '''Split lines into fields.'''
+        return list(csv.reader([line.decode(self.encoding) if isinstance(line, bytes) else line for line in lines]))
+
+
+    def titles(self, *keywords:str):
+        '''Get titles of all sections containing every keyword, in file order.'''
+        return [title for title, _, _ in self.sections if all(keyword in title for keyword in keywords)]
+
+
+    def lines(self, title:str):
+        '''Get all lines of a section (including its title line), as strings.'''
+        start, end = self.offsets[title]
+        return self.decode(self.data[start:end]).splitlines(keepends=True)
+
+
+    def header(self):
+        '''Get run information header (all rows before the stop line), as lists of fields.'''
+        return self.parse(self.decode(self.data[:self.head_end]).splitlines(keepends=True))
@@ -0,0 +1,364 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   This script runs PANDAA analysis as a local HTTP service, so that other programs (LIMS, instrument PCs, scripts) can
+#   analyze a results file without starting the GUI - and without paying for a cold start (interpreter, pandas,
+#   ReportLab, configuration) on every file.
+#
+#   Tool configurations and assays.toml are read once, at startup, into an assay registry; runners (see batch.py) are
+#   built once per assay and machine and kept. Uploaded files are analyzed in-process by a fixed number of worker threads,
+#   fed from a bounded queue: when the queue is full, requests are turned away at once with 503 (and Retry-After), instead
+#   of piling up.
+#
+#   Endpoints:
+#     GET  /health                          status, queued and running requests
+#     GET  /assays                          assays that can be analyzed, with their division, reporters and machines
+#     POST /analyze?assay=...&machine=...&filename=...[&pdf=1][&format=json|csv|pdf]
+#          body: the results file, as exported by the machine (`filename` gives its extension)
+#          json (default): {"status", "summary_csv", "wells": [one object per well, unrounded], "pdf": base64 or null, "timings"}
+#          csv / pdf:      the summary CSV or PDF report itself
+#     Errors are JSON, {"error": ...}: 400/404 for bad parameters, 413 for files over the upload limit, 422 for files
+#     that can't be analyzed, 503 when the queue is full, 504 if analysis takes longer than the request timeout.
+#
+#   Rotor-Gene runs (one file per channel) can't be sent as a single upload; analyze them with batch.py or watcher.py.
+#   The service only listens on this computer (127.0.0.1) unless another --host is given.
+#
+#   Example (run from the repo folder):
+#       python shared/service.py --config hiv/config.toml --config vhf/config.toml --workers 2
+#       curl --data-binary @plate.xlsx "http://127.0.0.1:8765/analyze?assay=PANDAA%20LASV&machine=QuantStudio%205&filename=plate.xlsx"
+#
+#
+
+
+##############################################################################################################################
+### Imports
+##############################################################################################################################
+
+import os, sys
+sys.path.insert(0, os.path.dirname(__file__)) #look for custom dependencies in shared folder
+
+import argparse #command-line options
+import base64 #PDFs in JSON responses
+import json #responses
+import queue #bounded request queue
+import shutil #removing uploads
+import tempfile #uploads
+import threading #workers
+import time #request timings
+import tomli #for assay and tool config
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import compact
+import data_analysis
+import instrument
+from batch import BatchRunner, get_extensions
+
+
+##############################################################################################################################
+### Assay registry
+##############################################################################################################################
+
+class RequestError(Exception):
+    '''Request that can't be served, with the HTTP status to answer it with.'''
+    def __init__(self, status:int, message:str):
+        super().__init__(message)
+        self.status = status
+
+
+class ServiceRunner(BatchRunner):
+    '''BatchRunner shared by the service's worker threads.'''
+    pdf_lock = threading.Lock() #report app info is module-level in reportbuilder - one report at a time
+
+    def create_report(self, exporter):
+        with self.pdf_lock:
+            return super().create_report(exporter)
+
+
+class AssayRegistry:
+    '''Assays the service can analyze, and the tool configuration (HIV or VHF) each belongs to - read once, at startup.'''
+    def __init__(self, tool_configs:list, config='assays.toml', cache=None):
+        '''
+        Args:
+            tool_configs (list): tool configurations, as found in hiv/config.toml and vhf/config.toml
+            config (str): assay configuration file, relative to the shared folder
+            cache (PlateCache): if given, passed on to every runner
+        '''
+        self.assays = data_analysis.load_assays(config) #shared with every importer
+        self.tools = {} #assay -> tool configuration
+        for tool in tool_configs:
+            for assay in tool['ext']['assay_choices']:
+                if assay in self.assays:
+                    self.tools.setdefault(assay, tool)
+        self.cache = cache
+        self.runners = {} #(assay, machine type, create_pdf) -> runner
+        self.lock = threading.Lock()
+
+
+    def describe(self):
+        return {assay: {'division': tool['int']['division'],
+                        'reporters': self.assays[assay]['assay'],
+                        'machines': [machine for machine in tool['ext']['machine_choices'] if machine != 'Rotor-Gene']}
+                for assay, tool in self.tools.items()}
+
+
+    def runner(self, assay:str, machine_type:str, create_pdf:bool):
+        '''Get the runner for an assay and machine, building it on first use.'''
+        if assay not in self.tools:
+            raise RequestError(404, f'Unknown assay: {assay}')
+        if machine_type == 'Rotor-Gene':
+            raise RequestError(400, 'Rotor-Gene runs have one file per channel - analyze them with batch.py or watcher.py.')
+        if machine_type not in self.tools[assay]['ext']['machine_choices']:
+            raise RequestError(400, f'Unsupported machine type: {machine_type}')
+        key = (assay, machine_type, create_pdf)
+        with self.lock:
+            if key not in self.runners:
+                self.runners[key] = ServiceRunner(assay, machine_type, self.tools[assay], create_pdf=create_pdf,
+                                                  keep_results=True, cache=self.cache)
+            return self.runners[key]
+
+
+##############################################################################################################################
+### Analysis
+##############################################################################################################################
+
+class Job:
+    '''One uploaded file, waiting for (or going through) analysis.'''
+    def __init__(self, runner:BatchRunner, filename:str, data:bytes, output:str):
+        self.runner = runner
+        self.filename = filename
+        self.data = data
+        self.output = output
+        self.done = threading.Event()
+        self.status, self.content_type, self.body = 500, 'application/json', b''
+
+
+class AnalysisService:
+    '''Analyzes uploaded results files in worker threads, fed from a bounded queue.'''
+    def __init__(self, registry:AssayRegistry, workers=2, queue_size=8, timeout=300.0, max_upload=50*1024**2, log=print):
+        '''
+        Args:
+            registry (AssayRegistry): assays that can be analyzed
+            workers (int): number of plates analyzed at the same time
+            queue_size (int): number of requests that can wait for a worker; more are turned away with 503
+            timeout (float): seconds a request waits for its analysis before 504
+            max_upload (int): largest accepted upload, in bytes
+            log (callable): called with a line of text for every request
+        '''
+        self.registry = registry
+        self.workers = workers
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.timeout = timeout
+        self.max_upload = max_upload
+        self.log = log
+        self.running = 0 #plates being analyzed
+        self.lock = threading.Lock()
+        self.threads = []
+        self.server = None
+
+
+    def submit(self, job:Job):
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            raise RequestError(503, 'Service is busy - try again shortly.')
+
+
+    def work(self):
+        '''Worker thread: analyze queued jobs until told to stop (None).'''
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            with self.lock:
+                self.running += 1
+            try:
+                job.status, job.content_type, job.body = self.analyze(job)
+            except Exception as e: #unexpected - analyze() turns analysis errors into responses
+                job.status, job.content_type, job.body = 500, 'application/json', json.dumps({'error': str(e)}).encode()
+            finally:
+                with self.lock:
+                    self.running -= 1
+                job.done.set()
+
+
+    def analyze(self, job:Job):
+        '''Analyze an uploaded file in a temporary folder; returns status, content type and body of the response.'''
+        folder = tempfile.mkdtemp(prefix='pandaa-service-')
+        try:
+            filepath = os.path.join(folder, job.filename)
+            with open(filepath, 'wb') as f:
+                f.write(job.data)
+            with instrument.span('service_analyze', assay=job.runner.assay, machine=job.runner.machine_type) as fields:
+                record = job.runner.analyze(filepath)
+                fields['status'] = record['status']
+            if record['status'] != 'ok':
+                return 422, 'application/json', json.dumps({'status': 'failed', 'error': record['error']}).encode()
+
+            with open(record['summary'], 'rb') as f:
+                summary = f.read()
+            pdf = None
+            if record['pdf']:
+                with open(record['pdf'], 'rb') as f:
+                    pdf = f.read()
+
+            if job.output == 'csv':
+                return 200, 'text/csv', summary
+            if job.output == 'pdf':
+                return 200, 'application/pdf', pdf
+            wells = json.loads(compact.expand(record['results']).to_json(orient='records')) #NaN becomes null
+            return 200, 'application/json', json.dumps({'status': 'ok',
+                                                        'summary_csv': summary.decode('utf-8', errors='replace'),
+                                                        'wells': wells,
+                                                        'pdf': base64.b64encode(pdf).decode() if pdf else None,
+                                                        'timings': record['timings']}).encode()
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+    def new_job(self, query:dict, data:bytes):
+        '''Check an /analyze request, and get its job.'''
+        def param(name, default=None):
+            return query.get(name, [default])[0]
+
+        assay, machine_type, filename = param('assay'), param('machine'), os.path.basename(param('filename') or '')
+        output = param('format', 'json')
+        create_pdf = param('pdf', '0').lower() in ('1', 'true', 'yes') or output == 'pdf'
+        if not assay or not machine_type or not filename:
+            raise RequestError(400, 'assay, machine and filename are required.')
+        if output not in ('json', 'csv', 'pdf'):
+            raise RequestError(400, f'Unknown format: {output}')
+        runner = self.registry.runner(assay, machine_type, create_pdf)
+        if os.path.splitext(filename)[1].lower() not in get_extensions(machine_type):
+            raise RequestError(400, f'{machine_type} results files must be one of: {", ".join(get_extensions(machine_type))}')
+        if not data:
+            raise RequestError(400, 'No file was sent.')
+        return Job(runner, filename, data, output)
+
+
+    def start(self, host='127.0.0.1', port=8765):
+        '''Start worker threads and the HTTP server (in a background thread); returns the address served.'''
+        self.threads = [threading.Thread(target=self.work, name=f'analysis-{i}', daemon=True) for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+        self.server = ThreadingHTTPServer((host, port), RequestHandler)
+        self.server.daemon_threads = True
+        self.server.service = self
+        threading.Thread(target=self.server.serve_forever, name='http', daemon=True).start()
+        return self.server.server_address[:2]
+
+
+    def shutdown(self):
+        '''Stop taking requests, let workers finish the plates they are analyzing, then stop them.'''
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        for _ in self.threads:
+            self.jobs.put(None) #after any jobs already queued
+        for thread in self.threads:
+            thread.join()
+
+
+##############################################################################################################################
+### HTTP
+##############################################################################################################################
+
+class RequestHandler(BaseHTTPRequestHandler):
+    '''Routes requests to the AnalysisService serving them.'''
+    protocol_version = 'HTTP/1.1' #keep-alive, so load tests and clients can reuse connections
+
+    def do_GET(self):
+        service = self.server.service
+        path = urlsplit(self.path).path
+        if path == '/health':
+            self.send(200, 'application/json', json.dumps({'status': 'ok', 'queued': service.jobs.qsize(),
+                                                           'running': service.running, 'workers': service.workers}).encode())
+        elif path == '/assays':
+            self.send(200, 'application/json', json.dumps(service.registry.describe()).encode())
+        else:
+            self.send_error_json(RequestError(404, f'Not found: {path}'))
+
+
+    def do_POST(self):
+        service = self.server.service
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            if url.path != '/analyze':
+                raise RequestError(404, f'Not found: {url.path}')
+            if length > service.max_upload:
+                self.close_connection = True #body is not read
+                raise RequestError(413, f'File is larger than {service.max_upload // 1024**2} MB.')
+            job = service.new_job(parse_qs(url.query), self.rfile.read(length))
+            service.submit(job)
+        except RequestError as e:
+            self.send_error_json(e)
+            return
+        if not job.done.wait(service.timeout):
+            self.send_error_json(RequestError(504, 'Analysis took too long.'))
+            return
+        self.send(job.status, job.content_type, job.body)
+
+
+    def send(self, status:int, content_type:str, body:bytes, headers:dict=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def send_error_json(self, error:RequestError):
+        self.send(error.status, 'application/json', json.dumps({'error': str(error)}).encode(),
+                  headers={'Retry-After': '1'} if error.status == 503 else {})
+
+
+    def log_message(self, format, *args):
+        self.server.service.log(f'{self.address_string()} - {format % args}')
+
+
+##############################################################################################################################
+### Command-line entry point
+##############################################################################################################################
+
+def main(argv=None):
+    '''Parse command-line options, then serve until interrupted.'''
+    from platecache import PlateCache
+
+    parser = argparse.ArgumentParser(description='Serve PANDAA analysis over HTTP, on this computer.')
+    parser.add_argument('--config', required=True, action='append', help='tool configuration file (hiv/config.toml, vhf/config.toml); repeatable')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1, this computer only)')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on (default: 8765)')
+    parser.add_argument('--workers', type=int, default=2, help='plates analyzed at the same time (default: 2)')
+    parser.add_argument('--queue-size', type=int, default=8, help='requests that can wait for a worker (default: 8)')
+    parser.add_argument('--timeout', type=float, default=300, help='seconds a request waits for its analysis (default: 300)')
+    parser.add_argument('--max-upload', type=int, default=50, help='largest accepted upload, in MB (default: 50)')
+    parser.add_argument('--cache', help='folder for cache of parsed plates; repeat analyses of the same files skip parsing')
+    args = parser.parse_args(argv)
+
+    tool_configs = []
+    for path in args.config:
+        with open(path, mode='rb') as f: #get TOML configuration
+            tool_configs.append(tomli.load(f))
+
+    registry = AssayRegistry(tool_configs, cache=PlateCache(args.cache) if args.cache else None)
+    service = AnalysisService(registry, workers=args.workers, queue_size=args.queue_size, timeout=args.timeout,
+                              max_upload=args.max_upload*1024**2, log=lambda line: print(line, flush=True))
+    host, port = service.start(args.host, args.port)
+    print(f"Serving {', '.join(registry.tools)} on http://{host}:{port} - press Ctrl+C to stop", flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print('Stopping - finishing plates being analyzed...', flush=True)
+    service.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    with instrument.profiled('service'):
+        status = main()
+    sys.exit(status)
@@ -0,0 +1,104 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   This module holds the analysis session: everything about analyzing plates of one assay, on one machine, with one
+#   tool configuration (hiv/config.toml or vhf/config.toml), that is the same for every plate.
+#
+#   The session is set up once: assays.toml and schemas.toml are read (both are shared by every later importer), the
+#   assay's column names are built (see data_analysis.ColumnNames), and - when the first report is made - ReportLab's
+#   stylesheet and the decoded logo are kept for every later report. It then hands out the per-plate objects (importer,
+#   analyzer, exporter, report), which only hold that plate's data.
+#
+#   batch.py (and so watcher.py and service.py) analyze every plate through a session.
+#
+#   Example:
+#       session = AnalysisSession('PANDAA LASV', 'QuantStudio 5', config)
+#       for filepath in filepaths:
+#           importer = session.importer(filepath)
+#           importer.parse()
+#           exporter = session.exporter(importer, session.analyzer(importer))
+#           exporter.export()
+#
+#
+
+
+import os, sys
+sys.path.insert(0, os.path.dirname(__file__)) #look for custom dependencies in shared folder
+
+import data_analysis
+from errors import PandaaError
+from schema import load_schemas
+
+
+class AnalysisSession:
+    '''Setup shared by every plate of one assay and machine - see About this code.'''
+    def __init__(self, assay:str, machine_type:str, config:dict, cache=None, archive=None, assays='assays.toml'):
+        '''
+        Args:
+            assay (str): assay name, as defined in assays.toml
+            machine_type (str): qPCR machine used for all plates
+            config (dict): tool configuration, as found in hiv/config.toml or vhf/config.toml
+            cache (PlateCache): if given, parsed plates are cached, and plates already in cache are not parsed again
+            archive (ResultsArchive): if given, every exported plate is also added to this results archive
+            assays (str): assay configuration file, relative to the shared folder
+        '''
+        self.assay = assay
+        self.machine_type = machine_type
+        self.config = config
+        self.info, self.intc, self.extc = config['info'], config['int'], config['ext']
+        self.division = self.intc['division']
+        self.cache = cache
+        self.archive = archive
+        self.assays_path = assays
+
+        self.assays = data_analysis.load_assays(assays)
+        load_schemas() #read now, rather than by the first plate
+        if assay not in self.assays:
+            raise PandaaError(f'Invalid assay. Check assay input setting.\n\n{assay!r}: not defined')
+        self.reporter_dict = self.assays[assay]['assay']
+        self.ic = self.assays[assay]['ic']
+        self.export_columns = tuple(self.extc['export_columns'])
+        self.names = data_analysis.column_names(tuple(self.reporter_dict.items()), machine_type, self.division)
+        self.names.kept(self.export_columns) #columns kept on export - built now, then looked up by every exporter
+
+
+    def importer(self, filepath=None):
+        '''Get an importer for a single plate (call `parse` to read it).'''
+        return data_analysis.DataImporter(assay=self.assay, machine_type=self.machine_type,
+                                          cq_cutoff=self.intc['cq_cutoff'], division=self.division,
+                                          config=self.assays_path, filepath=filepath, cache=self.cache)
+
+
+    def analyzer(self, importer:data_analysis.DataImporter):
+        '''Analyze a parsed plate with the tool configuration's settings; returns the analyzer.'''
+        if self.division == 'hiv':
+            analyzer = data_analysis.DataAnalyzer(data=importer,
+                                                  min_drm_percent=self.intc['min_drm_percent'], max_drm_percent=self.intc['max_drm_percent'])
+            analyzer.hiv_analysis()
+        else:
+            analyzer = data_analysis.DataAnalyzer(data=importer,
+                                                  pos_cutoff=self.intc['pos_cutoff'], dRn_percent_cutoff=self.intc['dRn_percent_cutoff'])
+            analyzer.vhf_analysis()
+        return analyzer
+
+
+    def exporter(self, importer:data_analysis.DataImporter, analyzer:data_analysis.DataAnalyzer, dest_filepath=None):
+        '''Get an exporter for an analyzed plate (call `export` to save it).'''
+        return data_analysis.DataExporter(importer, analyzer, columns=list(self.export_columns), archive=self.archive,
+                                          dest_filepath=dest_filepath)
+
+
+    def report(self, exporter:data_analysis.DataExporter, pdf_filepath=None):
+        '''Make an exported plate into a PDF, as in main() - by default, next to its CSV summary. Returns the PDF's path.'''
+        from reportbuilder import Report, get_app_info #only needed when PDFs are requested
+
+        if pdf_filepath is None:
+            pdf_filepath = os.path.splitext(exporter.dest_filepath)[0] + '.pdf'
+        get_app_info(self.info['name'], self.info['version'], self.info['use'])
+        if 'QuantStudio' not in self.machine_type:
+            pdf = Report(pdf_filepath, exporter.header, exporter.results, path_as_filename=exporter.dest_filepath)
+        else:
+            pdf = Report(pdf_filepath, exporter.header, exporter.results)
+        pdf.create()
+        return pdf_filepath
@@ -0,0 +1,387 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   This script writes realistic synthetic results exports, for testing and benchmarking without real runs.
+#
+#   SyntheticPlate simulates a plate for any assay in assays.toml: sample layout, then copies, Cq, dRn, Cq Conf and
+#   baseline values for every well and reporter. HIV plates have a dilution series of standards on a known standard curve
+#   (with DRM reporters at `drm_percentage` of the VQ copies, as in real control material) and unknowns with a spread of
+#   DRM percentages; VHF plates have positive/negative controls and unknowns with occasional positives and failed
+#   internal controls.
+#
+#   The plate can then be written in every format DataImporter reads, laid out as the machines' own exports:
+#     - QuantStudio 3/5 .xlsx ('Results' sheet: run information block, results table from row 44) and .txt
+#       ('* key = value' run information, then a tab-separated [Results] section)
+#     - Mic .xlsx ('General Information', 'Samples', and one results tab per target with its table from row 33)
+#       and .csv (the same worksheets as 'Start Worksheet - ...' sections)
+#     - Rotor-Gene .csv (one file per channel, named after the target, with the results table from line 28)
+#
+#   Example (run from the repo folder):
+#       python shared/synthetic.py --assay "076V 184VI" --machine "QuantStudio 5" --format .xlsx --wells 384 --plates 10 --out synthetic/
+#
+#
+
+
+##############################################################################################################################
+### Imports
+##############################################################################################################################
+
+import os, sys
+sys.path.insert(0, os.path.dirname(__file__)) #look for custom dependencies in shared folder
+
+import argparse #command-line options
+import csv #text exports
+import datetime #run dates
+import numpy as np
+import tomli #for assay config
+
+
+##############################################################################################################################
+
+# export formats DataImporter can read, for each machine
+formats = {'QuantStudio': ('.xlsx', '.txt'),
+           'Mic': ('.xlsx', '.csv'),
+           'Rotor-Gene': ('.csv',)}
+
+row_letters = 'ABCDEFGHIJKLMNOP'
+
+
+def machine_family(machine_type:str):
+    '''Get the key of `formats` for a machine type, e.g. 'QuantStudio' for 'QuantStudio 5'.'''
+    for machine in formats:
+        if machine in machine_type:
+            return machine
+    raise ValueError(f'Unsupported machine type: {machine_type}')
+
+
+class SyntheticPlate:
+    '''Simulated qPCR plate for one assay, which can be written as any supported results export.'''
+    def __init__(self, assay:str, wells:int=96,
+                       standards=(1e6, 1e5, 1e4, 1e3, 1e2), slope=-3.32, intercept=38.0, drm_percentage=0.2,
+                       seed=0, run_date=None, config='assays.toml'):
+        '''
+        Args:
+            assay (str): assay name, as defined in assays.toml
+            wells (int): number of wells - 96 and 384 are laid out as 8x12 and 16x24 plates
+            standards (tuple): copies of each HIV standard (VQ); DRM reporters get `drm_percentage` of these
+            slope, intercept (float): standard curve, Cq = intercept + slope*log10(copies)
+            drm_percentage (float): DRM percentage of the standards
+            seed (int): random seed - the same arguments always give the same plate
+            run_date (datetime.date): date shown in run information; defaults to a fixed date
+        '''
+        with open(os.path.join(os.path.dirname(__file__), config), mode='rb') as f: #get TOML configuration
+            assays = tomli.load(f)
+        self.assay = assay
+        self.reporter_dict = assays[assay]['assay']
+        self.ic = assays[assay]['ic']
+        self.reporter_list = list(self.reporter_dict)
+        self.division = 'hiv' if self.reporter_dict[self.ic] == 'VQ' else 'vhf'
+
+        self.wells = wells
+        self.standards = list(standards)
+        self.slope = slope
+        self.intercept = intercept
+        self.drm_percentage = drm_percentage
+        self.seed = seed
+        self.run_date = run_date or datetime.date(2026, 1, 15)
+        self.name = f'{assay} synthetic {seed}'
+
+        columns = 24 if wells > 96 else 12
+        self.positions = [f'{row_letters[i // columns]}{i % columns + 1}' for i in range(wells)]
+        self.simulate(np.random.default_rng(seed))
+
+
+    ##############################################################################################################################
+    ### Simulation
+    ##############################################################################################################################
+
+    def simulate(self, rng:np.random.Generator):
+        '''Lay out samples, then simulate copies and amplification values for every well and reporter.'''
+        n = self.wells
+        self.tasks = np.full(n, 'UNKNOWN', dtype=object)
+        self.sample_names = np.array([f'Sample {i+1}' for i in range(n)], dtype=object)
+        self.assigned = np.full(n, np.nan) #standards' copy numbers
+        copies = {fluor: np.zeros(n) for fluor in self.reporter_list}
+
+        if self.division == 'hiv':
+            n_standards = min(len(self.standards), n - 1)
+            self.tasks[:n_standards] = 'STANDARD'
+            self.assigned[:n_standards] = self.standards[:n_standards]
+            self.sample_names[:n_standards] = [f'Standard {i+1}' for i in range(n_standards)]
+            self.tasks[n_standards] = 'NTC'
+            self.sample_names[n_standards] = 'NTC'
+
+            unknown = self.tasks == 'UNKNOWN'
+            vq = 10**rng.uniform(2, 6, size=n)
+            copies[self.ic] = np.where(unknown, vq, np.nan_to_num(self.assigned))
+            for fluor in self.reporter_list[1:]:
+                # mostly wild type; some minority, low-level and majority DRM populations
+                fraction = rng.choice([0, 0.02, 0.07, 0.5], size=n, p=[0.55, 0.15, 0.15, 0.15]) * rng.uniform(0.8, 1.2, size=n)
+                copies[fluor] = np.where(unknown, vq * fraction, np.nan_to_num(self.assigned) * self.drm_percentage)
+        else:
+            self.tasks[0] = 'STANDARD'
+            self.sample_names[0] = 'Positive Control'
+            self.tasks[1] = 'NTC'
+            self.sample_names[1] = 'NTC'
+
+            copies[self.ic] = np.where(rng.random(n) < 0.02, 0, 10**rng.uniform(3, 4, size=n)) #occasional failed extraction
+            for fluor in self.reporter_list[1:]:
+                copies[fluor] = np.where(rng.random(n) < 0.15, 10**rng.uniform(1, 6, size=n), 0)
+                copies[fluor][0] = 1e4 #positive control
+            for fluor in self.reporter_list:
+                copies[fluor][1] = 0 #no template control
+
+        self.copies = copies
+        self.cq, self.drn, self.cq_conf, self.baseline_end, self.quantity = {}, {}, {}, {}, {}
+        for fluor in self.reporter_list:
+            with np.errstate(divide='ignore'):
+                cq = self.intercept + self.slope*np.log10(copies[fluor]) + rng.normal(0, 0.15, size=n)
+            cq[(copies[fluor] < 1) | (cq > 40)] = np.nan #Undetermined
+            amplified = ~np.isnan(cq)
+            self.cq[fluor] = cq
+            self.drn[fluor] = np.where(amplified, rng.uniform(3e4, 1.2e5, size=n), rng.uniform(0, 2e3, size=n))
+            self.cq_conf[fluor] = np.where(amplified, rng.uniform(0.85, 0.99, size=n), 0)
+            self.baseline_end[fluor] = np.where(amplified, np.maximum(3, np.nan_to_num(cq) - 4).astype(int), 39)
+            # quantity as reported by the instrument: standards show their assigned value, other wells are read off the curve
+            quantity = np.where(amplified, 10**((np.nan_to_num(cq) - self.intercept)/self.slope), np.nan)
+            if self.division == 'hiv':
+                assigned = self.assigned if fluor == self.ic else self.assigned * self.drm_percentage
+                quantity = np.where(self.tasks == 'STANDARD', assigned, quantity)
+            self.quantity[fluor] = quantity
+
+
+    ##############################################################################################################################
+    ### Writers
+    ##############################################################################################################################
+
+    def write(self, folder:str, machine_type:str, ext:str, name:str=None):
+        '''Write plate as a results export; returns the filepath (a list of filepaths for Rotor-Gene), ready for DataImporter.'''
+        machine = machine_family(machine_type)
+        ext = ext.lower()
+        if ext not in formats[machine]:
+            raise ValueError(f'{machine} results cannot be exported as {ext} files')
+        os.makedirs(folder, exist_ok=True)
+        stem = os.path.join(folder, name or self.name)
+
+        if machine == 'Rotor-Gene':
+            return self.write_rotorgene(stem)
+        writer = {('QuantStudio', '.xlsx'): self.write_quantstudio_xlsx, ('QuantStudio', '.txt'): self.write_quantstudio_txt,
+                  ('Mic', '.xlsx'): self.write_mic_xlsx, ('Mic', '.csv'): self.write_mic_csv}[(machine, ext)]
+        writer(stem + ext, machine_type)
+        return stem + ext
+
+
+    def cell(self, value, blank=''):
+        '''Cell value for text exports.'''
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            return blank
+        return value
+
+
+    # QuantStudio ------------------------------------------------------------------------------------------------------------
+
+    qs_columns = ['Well', 'Well Position', 'Omit', 'Sample Name', 'Target Name', 'Task', 'Reporter', 'Quencher',
+                  'CT', 'Ct Mean', 'Ct SD', 'Quantity', 'Quantity Mean', 'Quantity SD', 'Automatic Ct Threshold', 'Ct Threshold',
+                  'Automatic Baseline', 'Baseline Start', 'Baseline End', 'Amp Status', 'Cq Conf', 'Delta Rn (last cycle)']
+
+    def quantstudio_info(self, machine_type:str):
+        return [('Block Type', '384-Well Block' if self.wells > 96 else '96-Well Block (0.2mL)'),
+                ('Calibration Background is expired ', 'No'),
+                ('Chemistry', 'TAQMAN'),
+                ('Experiment Barcode', ''),
+                ('Experiment Comment', ''),
+                ('Experiment File Name', f'C:\\Users\\lab\\{self.name}.eds'),
+                ('Experiment Name', self.name),
+                ('Experiment Run End Time', f'{self.run_date:%Y-%m-%d} 14:33:09 PM EST'),
+                ('Experiment Type', 'Standard Curve' if self.division == 'hiv' else 'Presence/Absence'),
+                ('Instrument Name', f'{machine_type} synthetic'),
+                ('Instrument Serial Number', '272300000'),
+                ('Instrument Type', f'{machine_type} System'),
+                ('Passive Reference', 'ROX'),
+                ('Quantification Cycle Method', 'Ct'),
+                ('Signal Smoothing On', 'true'),
+                ('Stage/ Cycle where Analysis is performed', 'Stage 2, Step 2'),
+                ('User Name', 'synthetic')]
+
+
+    def quantstudio_rows(self):
+        '''Rows of the results table - one per well and reporter, as numbers/strings (None for blank cells).'''
+        rows = []
+        for i, position in enumerate(self.positions):
+            for fluor in self.reporter_list:
+                cq = self.cq[fluor][i]
+                quantity = self.quantity[fluor][i] if self.division == 'hiv' else np.nan
+                rows.append([i+1, position, 'false', self.sample_names[i], self.reporter_dict[fluor], self.tasks[i], fluor, 'NFQ-MGB',
+                             'Undetermined' if np.isnan(cq) else round(float(cq), 3), None, None,
+                             None if np.isnan(quantity) else round(float(quantity), 3), None, None,
+                             'true', 0.2, 'true', 3, int(self.baseline_end[fluor][i]),
+                             'Amp' if not np.isnan(cq) else 'No Amp', round(float(self.cq_conf[fluor][i]), 3), round(float(self.drn[fluor][i]), 3)])
+        return rows
+
+
+    def write_quantstudio_xlsx(self, path:str, machine_type:str):
+        from openpyxl import Workbook
+
+        wb = Workbook() #not write-only - instruments write text to a shared strings table, which write-only workbooks don't use
+        ws = wb.active
+        ws.title = 'Results'
+        info = self.quantstudio_info(machine_type)
+        for key, value in info:
+            ws.append([key, value])
+        for _ in range(43 - len(info)): #results table starts on row 44
+            ws.append([])
+        ws.append(self.qs_columns)
+        for row in self.quantstudio_rows():
+            ws.append(row)
+        wb.create_sheet('Amplification Data').append(['Well', 'Well Position', 'Cycle', 'Target Name', 'Rn', 'Delta Rn'])
+        wb.save(path)
+
+
+    def write_quantstudio_txt(self, path:str, machine_type:str):
+        with open(path, 'w', newline='') as f:
+            for key, value in self.quantstudio_info(machine_type):
+                f.write(f'* {key} = {value}\r\n')
+            f.write('\r\n[Results]\r\n')
+            writer = csv.writer(f, delimiter='\t', lineterminator='\r\n')
+            writer.writerow(self.qs_columns)
+            for row in self.quantstudio_rows():
+                # text exports use thousands separators in large numbers
+                writer.writerow([f'{value:,}' if isinstance(value, float) and value >= 1000 else self.cell(value) for value in row])
+            f.write('\r\n')
+
+
+    # Mic --------------------------------------------------------------------------------------------------------------------
+
+    def mic_info(self):
+        return [('Experiment Information', ''),
+                ('Experiment Name', self.name),
+                ('Run Started', f'{self.run_date:%d/%m/%Y} 09:12:44'),
+                ('Run Finished', f'{self.run_date:%d/%m/%Y} 10:31:02'),
+                ('Operator', 'synthetic'),
+                ('Instrument Serial Number', 'MIC-000000'),
+                ('Software Version', '2.8.13'),
+                ('Log', 'Run completed successfully')]
+
+
+    def mic_type(self, i:int):
+        return {'STANDARD': 'Standard', 'NTC': 'NTC', 'UNKNOWN': 'Unknown'}[self.tasks[i]]
+
+
+    def mic_samples(self):
+        rows = [['Well', 'Colour', 'Name', 'Type', 'Standards Concentration (Copies/µL)']]
+        for i in range(self.wells):
+            task = self.mic_type(i)
+            concentration = self.assigned[i] if self.division == 'hiv' else np.nan
+            rows.append([i+1, None, self.sample_names[i], task, None if np.isnan(concentration) else float(concentration)])
+        return rows
+
+
+    def mic_settings(self, fluor:str):
+        '''Analysis settings shown above each results table.'''
+        settings = [('Analysis', f'Cycling {fluor} ({self.reporter_dict[fluor]})'), ('Threshold', 0.1), ('Fluorescence Cutoff Level', 0.05),
+                    ('Dynamic Tube Normalisation', 'Yes'), ('Ignore Cycles Before', 5), ('Reaction Efficiency Threshold', 'Disabled')]
+        return settings + [(f'Setting {i}', '') for i in range(len(settings), 31)]
+
+
+    def mic_results(self, fluor:str):
+        rows = [['Well', 'Colour', 'Sample Name', 'Type', 'Cq', 'Given Conc (Copies/µL)', 'Calc Conc (Copies/µL)']]
+        for i in range(self.wells):
+            cq = self.cq[fluor][i]
+            given = self.assigned[i] if self.division == 'hiv' else np.nan
+            rows.append([i+1, None, self.sample_names[i], self.mic_type(i),
+                         None if np.isnan(cq) else round(float(cq), 2),
+                         None if np.isnan(given) else float(given),
+                         None if np.isnan(self.quantity[fluor][i]) else round(float(self.quantity[fluor][i]), 2)])
+        return rows
+
+
+    def write_mic_xlsx(self, path:str, machine_type:str=None):
+        from openpyxl import Workbook
+
+        wb = Workbook() #shared strings, as in instrument exports
+        ws = wb.active
+        ws.title = 'General Information'
+        for row in self.mic_info():
+            ws.append(list(row))
+        ws = wb.create_sheet('Samples')
+        for row in self.mic_samples():
+            ws.append(row)
+        for fluor in self.reporter_list:
+            ws = wb.create_sheet(f'{self.reporter_dict[fluor]} Results')
+            ws.append([f'Cycling {fluor} Results'])
+            for row in self.mic_settings(fluor): #results table starts on row 33
+                ws.append(list(row))
+            for row in self.mic_results(fluor):
+                ws.append(row)
+        wb.create_sheet('Absolute Quantification Results').append(['Well', 'Sample Name']) #never used for Cq values
+        wb.save(path)
+
+
+    def write_mic_csv(self, path:str, machine_type:str=None):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f, lineterminator='\r\n')
+            writer.writerow(['Start Worksheet - General Information'])
+            writer.writerows(self.mic_info())
+            writer.writerow([])
+            writer.writerow(['Start Worksheet - Samples'])
+            writer.writerows([[self.cell(value) for value in row] for row in self.mic_samples()])
+            writer.writerow([])
+            for fluor in self.reporter_list:
+                writer.writerow([f'Start Worksheet - Analysis - Cycling {fluor} ({self.reporter_dict[fluor]}) - Results'])
+                writer.writerows(self.mic_settings(fluor)[:6])
+                writer.writerow(['Results'])
+                writer.writerows([[self.cell(value) for value in row] for row in self.mic_results(fluor)])
+                writer.writerow([])
+
+
+    # Rotor-Gene -------------------------------------------------------------------------------------------------------------
+
+    def write_rotorgene(self, stem:str):
+        '''Write one .csv per channel, named after its target (e.g. `<stem> VQ.csv`); returns their filepaths.'''
+        filepaths = []
+        info = [('Experiment Information', ''), ('Date', f'{self.run_date:%d/%m/%Y}'), ('Time', '11:02:15'),
+                ('Operator', 'synthetic'), ('Run Name', self.name), ('Machine Serial No.', '0000000'),
+                ('Rotor Type', '72-Well Rotor'), ('Gain', '7'), ('Software Version', '2.3.5')]
+        for fluor in self.reporter_list:
+            filepath = f'{stem} {self.reporter_dict[fluor]}.csv'
+            with open(filepath, 'w', newline='') as f:
+                writer = csv.writer(f, lineterminator='\r\n')
+                writer.writerows(info + [('Channel', fluor)])
+                writer.writerows([(f'Setting {i}', '') for i in range(len(info) + 1, 25)])
+                writer.writerow([f'Quantitative analysis of Cycling.{fluor}'])
+                writer.writerow([])
+                writer.writerow(['No.', 'Colour', 'Name', 'Type', 'Ct', 'Ct Comment', 'Given Conc (copies/reaction)', 'Calc Conc (copies/reaction)'])
+                for i in range(self.wells):
+                    cq = self.cq[fluor][i]
+                    writer.writerow([i+1, '', self.sample_names[i], self.tasks[i].title(),
+                                     '' if np.isnan(cq) else f'{cq:.2f}', 'NEG (NTC)' if self.tasks[i] == 'NTC' else '',
+                                     self.cell(self.assigned[i]), self.cell(round(float(self.quantity[fluor][i]), 2))])
+            filepaths.append(filepath)
+        return filepaths
+
+
+##############################################################################################################################
+### Command-line entry point
+##############################################################################################################################
+
+def main(argv=None):
+    '''Parse command-line options, then write synthetic plates.'''
+    parser = argparse.ArgumentParser(description='Write synthetic qPCR results exports.')
+    parser.add_argument('--assay', required=True, help='assay name, as defined in shared/assays.toml')
+    parser.add_argument('--machine', required=True, help='qPCR machine, e.g. "QuantStudio 5", "Mic", "Rotor-Gene"')
+    parser.add_argument('--format', required=True, help='file extension, e.g. .xlsx')
+    parser.add_argument('--wells', type=int, default=96, help='wells per plate (default: 96)')
+    parser.add_argument('--plates', type=int, default=1, help='number of plates (default: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the first plate (default: 0)')
+    parser.add_argument('--out', required=True, help='folder to write plates to')
+    args = parser.parse_args(argv)
+
+    for seed in range(args.seed, args.seed + args.plates):
+        written = SyntheticPlate(args.assay, wells=args.wells, seed=seed).write(args.out, args.machine, args.format)
+        print(*(written if isinstance(written, list) else [written]), sep='\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -15,6 +15,7 @@ import tkinter as tk #GUI handling
 from PIL import Image, ImageTk #image handling - allows for rescaling of Aldatu logo in main menu
 import os #filepath handling - allows for saving of results file in same directory location as user's original file is uploaded from
 import sys #finds absolute image location - important for exe packaging
+import dialogs #menu window is reused as the parent of all later dialogs
 
 
 ##############################################################################################################################
@@ -104,6 +105,7 @@ class PandaaMenu:
         '''Initialize root tkinter window.'''
 
         self.root = tk.Tk()
+        dialogs.set_root(self.root)
         self.root.title(self.window_title)
         self.root.geometry('500x360')
         self.root.resizable(False, False)
@@ -0,0 +1,395 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   This script watches folders that qPCR machines export to, and analyzes every new results file as soon as it is
+#   complete - no one has to open the Assistant and select each file by hand.
+#
+#   Folders are polled every few seconds. A file is only analyzed once its size and modification time have stayed the
+#   same for `settle` seconds and it can be opened (exports are written in pieces, and Windows keeps them locked while
+#   they're written). The machine is taken from the folder's rule (`--watch "exports/mic=Mic"`) or, for folders without
+#   one, sniffed from the file itself: QuantStudio and Mic workbooks by their sheets, text exports by their first lines.
+#   Rotor-Gene channel files are held until every channel of the run has arrived, then analyzed together.
+#
+#   Each plate goes through BatchRunner.analyze(), so its summary CSV (and PDF, if configured) is written next to the
+#   source file, exactly as in the GUI. Runners are built once and kept, so the interpreter, pandas and configuration stay
+#   loaded between plates. With --workers above 1, plates are analyzed in a pool of worker processes; at most two plates
+#   per worker are handed to the pool at a time, and the rest wait in the watcher. If a worker process dies, the plates that
+#   were in its pool are each analyzed again alone, in a pool of their own (as in batch.py), so only the plate that killed the
+#   worker is failed. Files that already have a summary newer
+#   than themselves are skipped, so restarting the watcher doesn't analyze a whole folder again.
+#
+#   Example (run from the repo folder):
+#       python shared/watcher.py --config hiv/config.toml --assay "076V 184VI" --watch "exports/qs5=QuantStudio 5" --watch exports/shared
+#
+#
+
+
+##############################################################################################################################
+### Imports
+##############################################################################################################################
+
+import os, sys
+sys.path.insert(0, os.path.dirname(__file__)) #look for custom dependencies in shared folder
+
+import argparse #command-line options
+import collections #waiting plates
+import json #plate log
+import re #machine sniffing
+import time #polling
+import tomli #for tool config
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import instrument
+from data_analysis import load_assays
+from batch import BatchRunner, get_extensions, group_rgq_files, is_output, machine_extensions
+from platecache import PlateCache
+from archive import ResultsArchive
+
+
+##############################################################################################################################
+### Machine sniffing
+##############################################################################################################################
+
+def sniff_machine(filepath:str):
+    '''Guess which machine exported a results file from its contents; None if it can't be told.'''
+    ext = os.path.splitext(filepath)[1].lower()
+    try:
+        if ext == '.xlsx':
+            return sniff_workbook(filepath)
+        if ext in ('.csv', '.txt'):
+            with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
+                lines = [f.readline() for _ in range(40)]
+            return sniff_text(lines)
+    except Exception: #unreadable or not a results file - left to the user
+        return None
+    return None #e.g. old .xls workbooks - need a folder rule
+
+
+def sniff_text(lines:list):
+    '''Guess machine from the first lines of a text export.'''
+    for line in lines:
+        if line.startswith('Start Worksheet'):
+            return 'Mic'
+        if line.startswith('Quantitative analysis of Cycling'):
+            return 'Rotor-Gene'
+        if 'Instrument Type' in line:
+            return quantstudio_model(line)
+    return None
+
+
+def sniff_workbook(filepath:str):
+    '''Guess machine from an Excel export's sheets.'''
+    from openpyxl import load_workbook
+
+    wb = load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        if 'General Information' in wb.sheetnames and 'Samples' in wb.sheetnames:
+            return 'Mic'
+        if 'Results' in wb.sheetnames:
+            for row in wb['Results'].iter_rows(max_row=43, max_col=2, values_only=True):
+                if row and row[0] == 'Instrument Type':
+                    return quantstudio_model(str(row[1]))
+    finally:
+        wb.close()
+    return None
+
+
+def quantstudio_model(instrument_type:str):
+    '''Machine type from a QuantStudio 'Instrument Type' value, e.g. 'QuantStudio™ 5 System' -> 'QuantStudio 5'.'''
+    match = re.search(r'QuantStudio\D{0,3}(\d+)', instrument_type)
+    return f'QuantStudio {match.group(1)}' if match else None
+
+
+##############################################################################################################################
+### Worker processes
+##############################################################################################################################
+
+worker_settings = None #BatchRunner settings shared by every machine, in this worker process
+worker_runners = {} #machine type -> runner, built on first use
+
+
+def init_worker(settings:dict):
+    global worker_settings
+    worker_settings = settings
+
+
+def analyze_plate(machine_type:str, plate):
+    '''Analyze a single plate in a worker process.'''
+    if machine_type not in worker_runners:
+        worker_runners[machine_type] = BatchRunner(machine_type=machine_type, **worker_settings)
+    return worker_runners[machine_type].analyze(plate)
+
+
+##############################################################################################################################
+### Watcher
+##############################################################################################################################
+
+def has_summary(plate):
+    '''Check if a plate (results file, or list of Rotor-Gene channel files) already has a summary CSV newer than itself.'''
+    filepaths = [plate] if isinstance(plate, str) else plate
+    summary = os.path.splitext(os.path.commonprefix(filepaths))[0] + ' - Summary.csv' #as named by DataExporter
+    try:
+        return os.path.getmtime(summary) >= max(os.path.getmtime(filepath) for filepath in filepaths)
+    except OSError:
+        return False
+
+
+def readable(filepath:str):
+    '''Check that a file can be opened - exports being written are locked on Windows.'''
+    try:
+        with open(filepath, 'rb'):
+            return True
+    except OSError:
+        return False
+
+
+def format_record(record:dict):
+    '''One log line for an analyzed plate.'''
+    line = f"{record['status'].upper():<6} {record['source']}  ({record['timings'].get('total', 0):.2f} s)"
+    if record['error']:
+        line += '\n       ' + record['error'].replace('\n\n', ' ')
+    return line
+
+
+class Watcher:
+    '''Polls export folders, and analyzes each results file once it has finished being written.'''
+    def __init__(self, folders:dict, assay:str, config:dict, create_pdf=None, workers=1, settle=5.0, interval=2.0,
+                       cache=None, archive=None, log=print, log_file=None, clock=time.monotonic):
+        '''
+        Args:
+            folders (dict): folder -> machine type of its exports, or None to sniff each file
+            assay (str): assay name, as defined in assays.toml
+            config (dict): tool configuration, as found in hiv/config.toml or vhf/config.toml
+            create_pdf (bool): if given, overrides `create_pdf` setting in tool configuration
+            workers (int): number of worker processes; 1 analyzes plates in this process, between polls
+            settle (float): seconds a file's size and modification time must stay unchanged before it is analyzed
+            interval (float): seconds between polls
+            cache, archive: as in BatchRunner
+            log (callable): called with a line of text for every plate analyzed or skipped
+            log_file (str): if given, a JSON record of every analyzed plate is appended to this file
+            clock (callable): time source for settling, in seconds
+        '''
+        self.folders = folders
+        self.settings = {'assay': assay, 'config': config, 'create_pdf': create_pdf, 'workers': 1,
+                         'cache': cache, 'archive': archive}
+        self.workers = workers
+        self.settle = settle
+        self.interval = interval
+        self.log = log
+        self.log_file = log_file
+        self.clock = clock
+
+        self.extensions = tuple({ext for exts in machine_extensions.values() for ext in exts})
+        self.changing = {} #path -> (size, modification time), time first seen like that
+        self.done = {} #path -> (size, modification time) when analyzed or skipped
+        self.channels = {} #folder -> settled Rotor-Gene channel files, waiting for the rest of their run
+        self.waiting = collections.deque() #(machine type, plate), ready but not yet handed to a worker
+        self.suspects = collections.deque() #(machine type, plate) in a pool when a worker died - each analyzed again alone
+        self.running = {} #future -> (machine type, plate, pool it was submitted to, whether it has that pool to itself)
+        self.runners = {} #machine type -> runner, for workers=1
+        self.pool = None
+        self.records = []
+
+
+    def runner(self, machine_type:str):
+        if machine_type not in self.runners:
+            self.runners[machine_type] = BatchRunner(machine_type=machine_type, **self.settings)
+        return self.runners[machine_type]
+
+
+    def scan(self):
+        '''Look for new or changed results files; returns (machine type, plate) of plates ready to analyze.'''
+        now = self.clock()
+        ready = []
+        for folder, machine_type in self.folders.items():
+            try:
+                names = sorted(os.listdir(folder))
+            except OSError as e: #e.g. share not mounted (yet)
+                self.log(f'WARN   cannot read {folder} ({e})')
+                continue
+            for name in names:
+                filepath = os.path.join(folder, name)
+                if (name.startswith(('.', '~$')) #hidden and Office lock files
+                    or os.path.splitext(name)[1].lower() not in self.extensions
+                    or is_output(filepath)):
+                    continue
+                try:
+                    stat = os.stat(filepath)
+                except OSError: #removed since listing
+                    continue
+                signature = (stat.st_size, stat.st_mtime_ns)
+                if self.done.get(filepath) == signature:
+                    continue
+                seen = self.changing.get(filepath)
+                if seen is None or seen[0] != signature: #new, or still being written
+                    self.changing[filepath] = (signature, now)
+                    continue
+                if stat.st_size == 0 or now - seen[1] < self.settle or not readable(filepath):
+                    continue
+
+                del self.changing[filepath]
+                self.done[filepath] = signature
+                plate_machine = machine_type or sniff_machine(filepath)
+                if plate_machine is None:
+                    self.log(f'SKIP   {filepath}\n       machine could not be recognized - add a folder rule')
+                elif plate_machine == 'Rotor-Gene':
+                    self.channels.setdefault(folder, []).append(filepath)
+                elif os.path.splitext(name)[1].lower() in get_extensions(plate_machine) and not has_summary(filepath):
+                    ready.append((plate_machine, filepath)) #files with a summary were analyzed before, e.g. before a restart
+            ready.extend(self.complete_runs(folder))
+        return ready
+
+
+    def complete_runs(self, folder:str):
+        '''Take every Rotor-Gene run of a folder whose channel files have all arrived.'''
+        files = self.channels.get(folder)
+        if not files:
+            return []
+        reporter_dict = self.runner('Rotor-Gene').reporter_dict()
+        groups, _ = group_rgq_files(files, reporter_dict) #files not matching any channel just wait - e.g. another assay
+        complete = [group for group in groups if len(group) == len(reporter_dict)]
+        for group in complete:
+            for filepath in group:
+                files.remove(filepath)
+        return [('Rotor-Gene', group) for group in complete if not has_summary(group)]
+
+
+    def dispatch(self):
+        '''Hand waiting plates to the workers - at most two per worker at a time, so a backlog stays in the watcher.'''
+        if self.workers == 1:
+            while self.waiting:
+                machine_type, plate = self.waiting.popleft()
+                self.finish(self.runner(machine_type).analyze(plate))
+            return
+        self.isolate()
+        if self.pool is None:
+            self.pool = self.new_pool(self.workers)
+        while self.waiting and len(self.running) < 2*self.workers:
+            machine_type, plate = self.waiting.popleft()
+            self.running[self.pool.submit(analyze_plate, machine_type, plate)] = (machine_type, plate, self.pool, False)
+
+
+    def new_pool(self, workers:int):
+        return ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(self.settings,))
+
+
+    def isolate(self):
+        '''Analyze the next suspect plate alone, in a new single-worker pool - one at a time, next to the main pool.'''
+        if self.suspects and not any(alone for *_, alone in self.running.values()):
+            machine_type, plate = self.suspects.popleft()
+            pool = self.new_pool(1)
+            self.running[pool.submit(analyze_plate, machine_type, plate)] = (machine_type, plate, pool, True)
+
+
+    def collect(self, timeout=0):
+        '''Record plates finished by the workers.'''
+        if not self.running:
+            return
+        finished, _ = wait(list(self.running), timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in finished:
+            machine_type, plate, pool, alone = self.running.pop(future)
+            try:
+                self.finish(future.result())
+            except BrokenProcessPool: #a worker died - any plate in its pool may have killed it
+                if alone: #broke again, on its own
+                    self.finish(self.runner(machine_type).new_record(plate, 'failed', 'worker: process terminated abruptly while analyzing this plate'))
+                else:
+                    self.suspects.append((machine_type, plate))
+                    if pool is self.pool: #later plates go to a new pool; futures of an older, broken pool leave this one be
+                        self.pool = None
+                    pool.shutdown(wait=False)
+            except Exception as e: #task couldn't be sent or returned - analyze() handles all other errors
+                self.finish(self.runner(machine_type).new_record(plate, 'failed', f'worker: {e}'))
+            if alone:
+                pool.shutdown(wait=False)
+
+
+    def finish(self, record:dict):
+        record['timings'].setdefault('total', sum(record['timings'].values()))
+        self.records.append(record)
+        self.log(format_record(record))
+        if self.log_file:
+            with open(self.log_file, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+
+    def poll(self):
+        '''Run one polling cycle: find ready files, analyze or queue them, and record finished plates.'''
+        self.waiting.extend(self.scan())
+        self.dispatch()
+        self.collect()
+        self.dispatch() #slots freed by finished plates
+
+
+    def run(self, stop=None):
+        '''Poll until `stop()` returns True, or until interrupted (Ctrl+C); then wait for plates being analyzed.'''
+        try:
+            while not (stop and stop()):
+                with instrument.span('watch_poll'):
+                    self.poll()
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            self.log('Stopping - waiting for plates being analyzed...')
+        finally:
+            self.close()
+
+
+    def close(self):
+        '''Wait for plates already handed to workers (including suspects still to be analyzed alone), then shut the pool down.'''
+        while self.running or self.suspects:
+            self.isolate()
+            self.collect(timeout=None)
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+##############################################################################################################################
+### Command-line entry point
+##############################################################################################################################
+
+def parse_rule(rule:str):
+    '''Split a `folder=machine` watch rule; the machine is optional.'''
+    folder, _, machine_type = rule.rpartition('=') if '=' in rule else (rule, '', '')
+    machine_type = machine_type.strip() or None
+    if machine_type is not None and machine_type.split()[0] not in machine_extensions:
+        raise argparse.ArgumentTypeError(f'Unsupported machine type: {machine_type}')
+    return folder, machine_type
+
+
+def main(argv=None):
+    '''Parse command-line options, then watch folders until interrupted.'''
+    parser = argparse.ArgumentParser(description='Analyze PANDAA results files as soon as machines export them.')
+    parser.add_argument('--config', required=True, help='tool configuration file (hiv/config.toml or vhf/config.toml)')
+    parser.add_argument('--assay', required=True, help='assay name, as defined in shared/assays.toml')
+    parser.add_argument('--watch', required=True, action='append', type=parse_rule, metavar='FOLDER[=MACHINE]',
+                        help='folder to watch, optionally with the machine that exports to it (otherwise detected per file); repeatable')
+    parser.add_argument('--pdf', action=argparse.BooleanOptionalAction, default=None, help='create PDF reports (default: create_pdf setting in config)')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes (0 = one per CPU; default: 1)')
+    parser.add_argument('--settle', type=float, default=5.0, help='seconds a file must stay unchanged before it is analyzed (default: 5)')
+    parser.add_argument('--interval', type=float, default=2.0, help='seconds between folder polls (default: 2)')
+    parser.add_argument('--log', help='append a JSON record of every analyzed plate to this file')
+    parser.add_argument('--cache', help='folder for cache of parsed plates; repeat analyses of the same files skip parsing')
+    parser.add_argument('--archive', help='folder of results archive; every analyzed plate is also added to it')
+    args = parser.parse_args(argv)
+
+    with open(args.config, mode='rb') as f: #get TOML configuration
+        config = tomli.load(f)
+    if args.assay not in load_assays(): #runners are only built once the first plate arrives - check now
+        parser.error(f'assay {args.assay!r} is not defined in shared/assays.toml')
+
+    watcher = Watcher(dict(args.watch), args.assay, config, create_pdf=args.pdf, workers=args.workers or os.cpu_count() or 1,
+                      settle=args.settle, interval=args.interval, log=lambda line: print(line, flush=True), log_file=args.log,
+                      cache=PlateCache(args.cache) if args.cache else None,
+                      archive=ResultsArchive(args.archive) if args.archive else None)
+    print(f"Watching {', '.join(folder for folder, _ in args.watch)} - press Ctrl+C to stop", flush=True)
+    watcher.run()
+    return 0
+
+
+if __name__ == '__main__':
+    with instrument.profiled('watcher'):
+        status = main()
+    sys.exit(status)
@@ -0,0 +1,186 @@
+##############################################################################################################################
+### About this code
+##############################################################################################################################
+#
+#   This module contains the Workbook class, which loads an Excel results file once and serves every sheet and range
+#   that the parsers in data_analysis need from that single in-memory copy.
+#
+#   pd.read_excel() re-opens, re-unzips and re-parses the workbook every time it is called. QuantStudio files were read
+#   twice (results table + header), and Mic files 2+N times (sheet names, header, samples, one per fluorophore tab).
+#   Workbook reads the file's bytes once, opens it with openpyxl in read-only (streaming) mode, and converts each sheet
+#   to rows at most once; read_sheet() then builds DataFrames from those rows exactly as pd.read_excel() would.
+#
+#
+
+
+##############################################################################################################################
+### Imports
+##############################################################################################################################
+
+import os, sys
+sys.path.insert(0, os.path.dirname(__file__)) #look for custom dependencies in shared folder
+
+import io #in-memory copy of file
+import numpy as np #error cells are read as NaN, as in pandas
+import pandas as pd #file and data handling
+from pandas.io.parsers import TextParser #same parser pd.read_excel uses to turn rows into a dataframe
+from pandas.errors import EmptyDataError
+import instrument #timing spans, when switched on
+
+
+##############################################################################################################################
+
+def column_indices(usecols:str):
+    '''Convert Excel column letters (e.g. `'A:B'` or `'A,C:E'`) to a list of column indices.'''
+    def letter_index(letters:str):
+        index = 0
+        for char in letters.strip().upper():
+            index = index*26 + ord(char) - ord('A') + 1
+        return index - 1
+
+    indices = []
+    for part in usecols.split(','):
+        if ':' in part:
+            first, last = part.split(':')
+            indices.extend(range(letter_index(first), letter_index(last)+1))
+        else:
+            indices.append(letter_index(part))
+    return indices
+
+
+class Workbook:
+    '''Excel workbook, loaded once and kept in memory.'''
+    def __init__(self, source):
+        '''
+        Args:
+            source (str or file-like): path to .xlsx/.xls file, or binary file object
+        '''
+        if isinstance(source, (str, os.PathLike)):
+            self.ext = os.path.splitext(source)[1].lower()
+            with open(source, 'rb') as f:
+                self.data = f.read()
+        else:
+            self.ext = os.path.splitext(getattr(source, 'name', ''))[1].lower()
+            self.data = source.read()
+
+        self.rows = {} #sheet name -> list of converted rows, filled as sheets are requested
+
+        with instrument.span('excel_load', ext=self.ext, bytes=len(self.data)):
+            self.load()
+
+
+    def load(self):
+        '''Open the in-memory copy - with openpyxl, or with pandas for legacy .xls files.'''
+        if self.ext == '.xls': #legacy format - openpyxl can't read these, so let pandas pick an engine
+            self.book = None
+            self.excel_file = pd.ExcelFile(io.BytesIO(self.data))
+            self.sheet_names = self.excel_file.sheet_names
+        else:
+            from openpyxl import load_workbook
+            self.book = load_workbook(io.BytesIO(self.data), read_only=True, data_only=True, keep_links=False)
+            self.excel_file = None
+            self.sheet_names = self.book.sheetnames
+
+
+    def convert_cell(self, cell):
+        '''Convert openpyxl cell to value, matching pandas' openpyxl reader.'''
+        from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+        if cell.value is None:
+            return ''
+        elif cell.data_type == TYPE_ERROR:
+            return np.nan
+        elif cell.data_type == TYPE_NUMERIC:
+            val = int(cell.value)
+            if val == cell.value:
+                return val
+            return float(cell.value)
+        return cell.value
+
+
+    def sheet_rows(self, sheet_name:str):
+        '''Get all rows in a sheet as lists of values; each sheet is only read from the workbook once.'''
+        if sheet_name not in self.rows:
+            if sheet_name not in self.sheet_names:
+                raise ValueError(f"Worksheet named '{sheet_name}' not found")
+
+            sheet = self.book[sheet_name]
+            sheet.reset_dimensions() #read-only sheets can report incorrect dimensions
+
+            data = []
+            last_row_with_data = -1
+            for row_number, row in enumerate(sheet.rows):
+                converted_row = [self.convert_cell(cell) for cell in row]
+                while converted_row and converted_row[-1] == '': #trim trailing empty cells
+                    converted_row.pop()
+                if converted_row:
+                    last_row_with_data = row_number
+                data.append(converted_row)
+            data = data[:last_row_with_data+1] #trim trailing empty rows
+
+            if data: #extend rows to max width
+                max_width = max(len(row) for row in data)
+                data = [row + ['']*(max_width - len(row)) for row in data]
+
+            self.rows[sheet_name] = data
+        return self.rows[sheet_name]
+
+
+    @instrument.traced('excel_read_sheet')
+    def read_sheet(self, sheet_name:str, skiprows:int=None, usecols:str=None, **kwargs):
+        '''Get sheet as a dataframe - equivalent to `pd.read_excel(file, sheet_name, skiprows=skiprows, usecols=usecols)`.
+
+           Additional keyword arguments (e.g. `dtype`, `na_values`, `thousands`) are passed to the parser.
+        '''
+        if self.book is None:
+            return pd.read_excel(self.excel_file, sheet_name=sheet_name, skiprows=skiprows, usecols=usecols, **kwargs)
+
+        data = self.sheet_rows(sheet_name)
+        if not data:
+            return pd.DataFrame()
+        if isinstance(usecols, str):
+            usecols = column_indices(usecols)
+
+        try:
+            parser = TextParser(list(data), header=0, skiprows=skiprows, usecols=usecols,
+                                skip_blank_lines=False, **kwargs)
+            return parser.read()
+        except EmptyDataError:
+            return pd.DataFrame()
+
+
+    @instrument.traced('excel_read_table')
+    def read_table(self, sheet_name:str, skiprows:int=None, schema=None):
+        '''Get a results table whose header may not be at the expected row - equivalent to `read_sheet()` followed by
+           `DataImporter.extract_results()`, but the header is found in the raw rows, so that `schema` (a `schema.Schema`)
+           can type columns as the table is built.
+
+           Every row whose first cell ('Well') is not an integer is dropped; the last of these is used as the header.
+        '''
+        if self.book is None:
+            df = self.read_sheet(sheet_name, skiprows=skiprows, dtype=object)
+            data = [list(df.columns)] + df.values.tolist()
+        else:
+            data = self.sheet_rows(sheet_name)[skiprows or 0:]
+        if not data:
+            return pd.DataFrame()
+
+        header = data[0]
+        rows = []
+        for row in data[1:]:
+            try:
+                int(row[0])
+            except ValueError: #text - must be a header row
+                header = row
+                continue
+            rows.append(row)
+
+        options = schema.read_options() if schema is not None else {}
+        df = TextParser([header] + rows, header=0, skip_blank_lines=False, **options).read()
+        return schema.finish(df) if schema is not None else df
+
+
+    def close(self):
+        '''Release workbook resources; rows already read are kept.'''
+        if self.book is not None:
+            self.book.close()
@@ -0,0 +1,80 @@
+import os
+import numpy as np
+import pytest
+import tomli
+from openpyxl import Workbook
+from shared.batch import BatchRunner
+
+# tests/conftest.py - results files and configuration used by tests in several modules, as fixtures
+
+
+def read_config(tool):
+    with open(os.path.join(os.path.dirname(__file__), '..', tool, 'config.toml'), mode='rb') as f:
+        return tomli.load(f)
+
+
+def write_qs_workbook(path, wells=4):
+    '''Write a minimal QuantStudio results workbook for "PANDAA LASV" (CY5 = IC, FAM = LASV).'''
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Results'
+    ws.append(['Block Type', '96-Well Block (0.2mL)'])
+    ws.append(['Experiment Name', os.path.basename(path)])
+    ws.append(['Instrument Type', 'QuantStudio 5 System'])
+    columns = ['Well', 'Well Position', 'Sample Name', 'Reporter', 'CT', 'Cq Conf', 'Baseline End', 'Delta Rn (last cycle)']
+    for i, name in enumerate(columns, start=1):
+        ws.cell(row=44, column=i, value=name)
+    row = 45
+    for well in range(1, wells+1):
+        for reporter in ['CY5', 'FAM']:
+            ct = 25.0 if reporter == 'CY5' or well % 2 else 'Undetermined'
+            values = [well, f'A{well}', f'Sample {well}', reporter, ct, 0.95, 15, 50000.0]
+            for i, value in enumerate(values, start=1):
+                ws.cell(row=row, column=i, value=value)
+            row += 1
+    wb.save(path)
+
+
+def write_mic_export(path, fluors, standards={1: 1e6, 2: 1e4, 3: 1e2}, wells=6):
+    """Mic .csv export: general information, samples, and one 'Cycling ... Results' section per fluor."""
+    lines = ['Start Worksheet - General Information', 'Experiment Name,Mic run', 'Run Started,2024-01-01 10:00', 'Log,Run log', '',
+             'Start Worksheet - Samples', 'Well,Colour,Name,Type,Standards Concentration (Copies/\u00b5L)']
+    for well in range(1, wells+1):
+        lines.append(f"{well},,S{well},{'Standard' if well in standards else 'Unknown'},{standards.get(well, '')}")
+    lines.append('')
+    for fluor in fluors:
+        lines += [f'Start Worksheet - Analysis - Cycling {fluor} - Results', 'Threshold,0.1', 'Results', 'Well,Sample Name,Cq']
+        for well in range(1, wells+1):
+            cq = 40 - 3.3*np.log10(standards[well]) if well in standards else 25.0
+            lines.append(f'{well},S{well},{cq:.2f}')
+        lines += ['', f'Start Worksheet - Analysis - Cycling {fluor} - Melt', 'Results', 'Well,Tm', '1,80', '']
+    path.write_text('\r\n'.join(lines), encoding='utf-8')
+
+
+class DyingRunner(BatchRunner):
+    '''Runner whose worker process dies outright on one plate, as on a crash in a native library.'''
+    def analyze(self, plate):
+        if plate.endswith('plate2.xlsx'):
+            os._exit(1)
+        return super().analyze(plate)
+
+
+@pytest.fixture(scope='session')
+def load_config():
+    '''Get a tool configuration by tool name ('hiv' or 'vhf').'''
+    return read_config
+
+
+@pytest.fixture(scope='session')
+def write_qs_xlsx():
+    return write_qs_workbook
+
+
+@pytest.fixture(scope='session')
+def write_mic_csv():
+    return write_mic_export
+
+
+@pytest.fixture(scope='session')
+def dying_runner():
+    return DyingRunner
@@ -0,0 +1,126 @@
+import os
+import datetime
+import pickle
+import pandas as pd
+import pytest
+from shared.archive import ResultsArchive, run_date
+from shared.data_analysis import DataImporter, DataAnalyzer, DataExporter
+from shared.synthetic import SyntheticPlate
+
+# tests/test_archive.py
+
+
+def export_mic(write_mic_csv, tmp_path, archive, name='mic.csv', run_started='2026-07-14 10:00'):
+    path = tmp_path / name
+    write_mic_csv(path, ['CY5', 'FAM', 'NED'])
+    path.write_text(path.read_text(encoding='utf-8').replace('2024-01-01 10:00', run_started), encoding='utf-8')
+    importer = DataImporter(assay='076V 184VI', machine_type='Mic', division='hiv', filepath=str(path))
+    importer.parse()
+    analyzer = DataAnalyzer(data=importer)
+    analyzer.hiv_analysis()
+    analyzed = analyzer.df.copy() #export rounds values in place
+    exporter = DataExporter(importer, analyzer, columns=['Well', 'Sample Name', 'Call'], archive=archive)
+    exporter.export()
+    return analyzed
+
+
+def test_run_date():
+    assert run_date([['Experiment Name', 'x'], ['Run Started', '2026-07-14 10:00']]) == '2026-07-14'
+    assert run_date([['Date', 'not a date'], ['Experiment Run End Time', '2026-01-17 02:33:09 PM EST']]) == '2026-01-17'
+    assert run_date('single line header', source=None) == pd.Timestamp.today().date().isoformat()
+
+
+def test_run_date_quantstudio_txt(tmp_path):
+    '''QuantStudio .txt headers are single-field '* name = value' rows, as read by DataImporter.'''
+    assert run_date([['* Experiment Name = x'], ['* Experiment Run End Time = 2026-01-17 02:33:09 PM EST']]) == '2026-01-17'
+    assert run_date([['* Date = Jan 17', ' 2026']]) == '2026-01-17' #value split at its comma
+
+    filepath = SyntheticPlate('PANDAA LASV', run_date=datetime.date(2026, 3, 9)).write(str(tmp_path), 'QuantStudio 3', '.txt')
+    importer = DataImporter(assay='PANDAA LASV', machine_type='QuantStudio 3', division='vhf', filepath=filepath)
+    importer.parse()
+    assert run_date(importer.head, filepath) == '2026-03-09'
+
+
+def test_archive_and_query(tmp_path, write_mic_csv):
+    archive = ResultsArchive(str(tmp_path / 'archive'))
+    analyzed = export_mic(write_mic_csv, tmp_path, archive)
+    export_mic(write_mic_csv, tmp_path, archive, name='mic2.csv', run_started='2026-02-01 09:00')
+
+    rows = archive.query()
+    assert len(rows) == 2 * 6 * 3 #plates x wells x targets
+    assert sorted(rows['run_date'].unique()) == ['2026-02-01', '2026-07-14']
+
+    july = archive.query(['well', 'target', 'copies', 'drm_percentage', 'call'], assay='076V 184VI', machine='Mic',
+                         target='076V', since='2026-07-01')
+    assert list(july['well']) == [str(well) for well in analyzed['Well']]
+    assert list(july['copies']) == pytest.approx(list(analyzed['FAM Quantity'])) #stored unrounded
+    assert list(july['call']) == list(analyzed['076V Call'])
+
+    assert archive.query(target=['076V', '184VI'], until='2026-06-30')['target'].nunique() == 2
+    assert archive.query(assay='PANDAA LASV').empty
+    with pytest.raises(ValueError):
+        archive.query(colour='red')
+
+    plates = archive.plates()
+    assert len(plates) == 2 and plates['header'].str.contains('Run Started').all()
+
+
+def test_export_again_replaces_plate(tmp_path, write_mic_csv):
+    archive = ResultsArchive(str(tmp_path / 'archive'))
+    export_mic(write_mic_csv, tmp_path, archive)
+    export_mic(write_mic_csv, tmp_path, archive, run_started='2026-07-15 10:00') #same file, run date read differently
+    assert len(archive.plates()) == 1
+    assert list(archive.query()['run_date'].unique()) == ['2026-07-15']
+
+
+def test_append_only_looks_in_plate_partitions(tmp_path, monkeypatch, write_mic_csv):
+    import glob
+    archive = ResultsArchive(str(tmp_path / 'archive'))
+    for i, date in enumerate(['2026-01-05', '2026-02-05', '2026-03-05']): #other plates, in other partitions
+        export_mic(write_mic_csv, tmp_path, archive, name=f'other{i}.csv', run_started=f'{date} 10:00')
+    export_mic(write_mic_csv, tmp_path, archive, run_started='2026-07-14 10:00')
+
+    patterns = []
+    find = glob.glob
+    monkeypatch.setattr(glob, 'glob', lambda pattern, **kwargs: patterns.append(pattern) or find(pattern, **kwargs))
+    export_mic(write_mic_csv, tmp_path, archive, run_started='2026-07-15 10:00')
+    partitions = sorted(os.path.basename(os.path.dirname(pattern)) for pattern in patterns)
+    assert partitions == ['run_date=2026-07-14', 'run_date=2026-07-15'] #where the plate was, and where it goes
+    assert archive.plates()['run_date'].tolist().count('2026-07-15') == 1 and len(archive.plates()) == 4
+
+
+def test_batch_archive(tmp_path, load_config, write_qs_xlsx):
+    from shared.batch import BatchRunner
+    write_qs_xlsx(tmp_path / 'plate.xlsx', wells=4)
+    archive = ResultsArchive(str(tmp_path / 'archive'))
+    runner = BatchRunner(assay='PANDAA LASV', machine_type='QuantStudio 5', config=load_config('vhf'), create_pdf=False,
+                         archive=pickle.loads(pickle.dumps(archive))) #archive must reach worker processes
+    runner.collect([str(tmp_path / 'plate.xlsx')])
+    runner.run()
+
+    rows = archive.query(['well', 'target', 'cq', 'drn', 'result'], machine='QuantStudio 5', target='LASV')
+    assert list(rows['well']) == ['A1', 'A2', 'A3', 'A4']
+    assert list(rows['result'][:2]) == ['LASV Positive', 'Negative']
+    assert os.path.exists(tmp_path / 'plate - Summary.csv')
+
+
+def test_archive_failure_keeps_csv(tmp_path, monkeypatch, load_config, write_qs_xlsx):
+    '''The CSV summary is written before archiving; an archive error is recorded, not raised.'''
+    from shared.batch import BatchRunner, format_summary
+
+    def fail(self, *args, **kwargs):
+        raise OSError('archive drive not found')
+    archive = ResultsArchive(str(tmp_path / 'archive'))
+    monkeypatch.setattr(ResultsArchive, 'append', fail)
+
+    write_qs_xlsx(tmp_path / 'plate.xlsx', wells=4)
+    runner = BatchRunner(assay='PANDAA LASV', machine_type='QuantStudio 5', config=load_config('vhf'), create_pdf=False,
+                         archive=archive)
+    record = runner.analyze(str(tmp_path / 'plate.xlsx'))
+
+    assert record['status'] == 'ok'
+    assert os.path.exists(tmp_path / 'plate - Summary.csv')
+    assert 'archive drive not found' in record['archive_error']
+    summary = {'plates': 1, 'succeeded': 1, 'elapsed': 0.0, 'assay': 'PANDAA LASV', 'machine_type': 'QuantStudio 5',
+               'stage_totals': {}, 'records': [record]}
+    assert 'NOT ARCHIVED' in format_summary(summary)
@@ -0,0 +1,108 @@
+import os
+import json
+import pandas as pd
+from shared.batch import BatchRunner, expand_paths, group_rgq_files
+
+# tests/test_batch.py
+
+
+def test_expand_paths_skips_outputs(tmp_path):
+    for name in ['a.xlsx', 'b.txt', 'a - Summary.csv', 'a - Summary.pdf', 'notes.docx']:
+        (tmp_path / name).write_text('')
+    found = expand_paths([str(tmp_path)], ('.xlsx', '.txt'))
+    assert [os.path.basename(f) for f in found] == ['a.xlsx', 'b.txt']
+    assert expand_paths([str(tmp_path / '*.xlsx')], ('.xlsx',)) == [str(tmp_path / 'a.xlsx')]
+
+
+def test_group_rgq_files():
+    reporter_dict = {'CY5': 'VQ', 'FAM': '076V', 'NED': '184VI'}
+    groups, ungrouped = group_rgq_files(['run1 CY5.csv', 'run1 076V.csv', 'run1 NED.csv',
+                                         'run2 CY5.csv', 'other.csv'], reporter_dict)
+    assert groups == [['run1 076V.csv', 'run1 CY5.csv', 'run1 NED.csv'], ['run2 CY5.csv']]
+    assert ungrouped == ['other.csv']
+
+
+def test_batch_run(tmp_path, load_config, write_qs_xlsx):
+    write_qs_xlsx(tmp_path / 'plate1.xlsx')
+    write_qs_xlsx(tmp_path / 'plate2.xlsx', wells=8)
+    (tmp_path / 'broken.xlsx').write_bytes(b'not a workbook')
+
+    runner = BatchRunner(assay='PANDAA LASV', machine_type='QuantStudio 5', config=load_config('vhf'), create_pdf=False)
+    runner.collect([str(tmp_path)])
+    runner.run()
+    summary = runner.summary()
+
+    assert summary['plates'] == 3
+    assert summary['failed'] == 1
+    statuses = {os.path.basename(record['source']): record['status'] for record in summary['records']}
+    assert statuses == {'broken.xlsx': 'failed', 'plate1.xlsx': 'ok', 'plate2.xlsx': 'ok'}
+
+    results = pd.read_csv(tmp_path / 'plate2 - Summary.csv', skiprows=4)
+    assert list(results['Result'][:2]) == ['LASV Positive', 'Negative']
+    assert set(summary['stage_totals']) == {'parse', 'analyze', 'export', 'total'}
+    record = next(record for record in summary['records'] if record['source'].endswith('plate2.xlsx'))
+    assert record['summary_bytes'] == os.path.getsize(tmp_path / 'plate2 - Summary.csv')
+
+
+def test_batch_run_pool(tmp_path, load_config, write_qs_xlsx):
+    for i in range(4):
+        write_qs_xlsx(tmp_path / f'plate{i}.xlsx', wells=2+i)
+    (tmp_path / 'plate1.xlsx').write_bytes(b'not a workbook')
+
+    runner = BatchRunner(assay='PANDAA LASV', machine_type='QuantStudio 5', config=load_config('vhf'), create_pdf=False, workers=2)
+    plates = runner.collect([str(tmp_path)])
+    records = runner.run()
+
+    assert [record['source'] for record in records] == plates
+    assert [record['status'] for record in records] == ['ok', 'failed', 'ok', 'ok']
+
+
+def test_batch_run_pool_worker_dies(tmp_path, load_config, write_qs_xlsx, dying_runner):
+    for i in range(5):
+        write_qs_xlsx(tmp_path / f'plate{i}.xlsx', wells=2)
+
+    runner = dying_runner(assay='PANDAA LASV', machine_type='QuantStudio 5', config=load_config('vhf'), create_pdf=False, workers=2)
+    plates = runner.collect([str(tmp_path)])
+    records = runner.run()
+
+    assert [record['source'] for record in records] == plates
+    assert [record['status'] for record in records] == ['ok', 'ok', 'failed', 'ok', 'ok']
+    assert 'terminated abruptly' in records[2]['error']
+
+
+def test_batch_keep_results(tmp_path, load_config, write_qs_xlsx):
+    write_qs_xlsx(tmp_path / 'plate.xlsx', wells=6)
+    runner = BatchRunner(assay='PANDAA LASV', machine_type='QuantStudio 5', config=load_config('vhf'), create_pdf=False, keep_results=True)
+    runner.collect([str(tmp_path)])
+    records = runner.run()
+
+    results = runner.results[str(tmp_path / 'plate.xlsx')]
+    assert len(results) == 6 and isinstance(results['Result'].dtype, pd.CategoricalDtype)
+    assert 'results' not in records[0]
+    json.dumps(runner.summary())
+
+
+def test_group_rgq_files_by_run_header(tmp_path):
+    from shared.synthetic import SyntheticPlate
+    from shared.data_analysis import load_assays
+    reporter_dict = load_assays()['PANDAA LASV']['assay']
+    day = [SyntheticPlate('PANDAA LASV', wells=4, seed=i).write(str(tmp_path), 'Rotor-Gene', '.csv') for i in range(3)]
+    groups, ungrouped = group_rgq_files(sorted(str(path) for path in tmp_path.iterdir()), reporter_dict)
+    assert groups == [sorted(run) for run in day] and ungrouped == []
+
+    # one channel of a run exported again, under the same name, after a later run - not part of the earlier run
+    earlier = SyntheticPlate('PANDAA LASV', wells=4, seed=8).write(str(tmp_path / 'rerun'), 'Rotor-Gene', '.csv', name='run')
+    later = SyntheticPlate('PANDAA LASV', wells=4, seed=9).write(str(tmp_path / 'later'), 'Rotor-Gene', '.csv', name='run')
+    os.replace(later[0], earlier[0])
+    groups, _ = group_rgq_files(sorted(earlier), reporter_dict)
+    assert sorted(map(len, groups)) == [1, 1]
+
+
+def test_batch_rgq_day(tmp_path, load_config):
+    from shared.synthetic import SyntheticPlate
+    for i in range(3):
+        SyntheticPlate('PANDAA LASV', wells=4, seed=i).write(str(tmp_path), 'Rotor-Gene', '.csv')
+    runner = BatchRunner(assay='PANDAA LASV', machine_type='Rotor-Gene', config=load_config('vhf'), create_pdf=False)
+    runner.collect([str(tmp_path)])
+    runner.run()
+    assert len(runner.records) == 3 and all(record['status'] == 'ok' for record in runner.records)
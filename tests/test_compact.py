@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+from shared.compact import compact, expand, well_dtype
+from shared.data_analysis import DataImporter, DataAnalyzer, DataExporter
+
+# tests/test_compact.py
+
+
+def analyzed_plate(write_qs_xlsx, write_mic_csv, tmp_path, machine_type):
+    if machine_type == 'Mic':
+        path = tmp_path / 'plate.csv'
+        write_mic_csv(path, ['CY5', 'FAM', 'NED'])
+        importer = DataImporter(assay='076V 184VI', machine_type='Mic', division='hiv', filepath=str(path))
+        importer.parse()
+        analyzer = DataAnalyzer(data=importer)
+        analyzer.hiv_analysis()
+        columns = ['Well', 'Sample Name', 'Cq', 'Call', 'DRM Percentage', 'VQ Copies']
+    else:
+        path = tmp_path / 'plate.xlsx'
+        write_qs_xlsx(path, wells=24)
+        importer = DataImporter(assay='PANDAA LASV', machine_type='QuantStudio 5', division='vhf', filepath=str(path))
+        importer.parse()
+        importer.results['CY5 CT'] += np.linspace(0, 1, len(importer.results)) #values that float32 stores inexactly
+        importer.results['Sample Name'] = [f'Sample {i//3}' for i in range(len(importer.results))] #triplicates
+        analyzer = DataAnalyzer(data=importer, pos_cutoff=30, dRn_percent_cutoff=0.05)
+        analyzer.vhf_analysis()
+        columns = ['Well', 'Sample Name', 'Result', 'Cq', 'Cq Conf', 'dRn']
+    return importer, analyzer, columns
+
+
+@pytest.mark.parametrize('machine_type', ['QuantStudio 5', 'Mic'])
+def test_export_is_byte_identical(tmp_path, machine_type, write_qs_xlsx, write_mic_csv):
+    importer, analyzer, columns = analyzed_plate(write_qs_xlsx, write_mic_csv, tmp_path, machine_type)
+    compact_df = compact(analyzer.df)
+
+    exporter = DataExporter(importer, analyzer, columns=columns)
+    exporter.export()
+    expected = open(exporter.dest_filepath, 'rb').read()
+
+    analyzer.df = compact_df
+    exporter = DataExporter(importer, analyzer, columns=columns)
+    exporter.export()
+    assert open(exporter.dest_filepath, 'rb').read() == expected
+
+
+def test_compact_types_and_round_trip(tmp_path, write_qs_xlsx, write_mic_csv):
+    _, analyzer, _ = analyzed_plate(write_qs_xlsx, write_mic_csv, tmp_path, 'QuantStudio 5')
+    df = analyzer.df
+    compact_df = compact(df)
+
+    assert compact_df['Well'].cat.categories is well_dtype.categories #one lookup shared by all plates
+    assert compact_df['Well'].cat.codes.dtype == np.int16
+    assert isinstance(compact_df['Sample Name'].dtype, pd.CategoricalDtype)
+    assert isinstance(compact_df['Result'].dtype, pd.CategoricalDtype)
+    assert compact_df['FAM CT'].dtype == np.float32
+    shared_lookup = well_dtype.categories.memory_usage(deep=True) #stored once, however many plates use it
+    assert compact_df.memory_usage(deep=True).sum() - shared_lookup < df.memory_usage(deep=True).sum() / 2
+
+    expanded = expand(compact_df)
+    pd.testing.assert_frame_equal(expanded, df, check_exact=False, rtol=1e-6)
+    assert expand(df) is df #nothing to expand
+
+
+def test_float32_only_when_rounding_is_unchanged():
+    df = pd.DataFrame({'Well': [1, 2], 'FAM CT': [15.05, 30.0], 'FAM dRn': [1000.5, 2000.0], 'FAM Quantity': [1.5, 2.5]})
+    compact_df = compact(df)
+    assert compact_df['FAM CT'].dtype == np.float64 #float32(15.05) rounds differently from 15.05
+    assert compact_df['FAM dRn'].dtype == np.float32
+    assert compact_df['FAM Quantity'].dtype == np.float64
+    assert compact_df['Well'].dtype == np.int8
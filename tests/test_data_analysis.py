@@ -1,18 +1,19 @@
 import pytest
+import numpy as np
 import pandas as pd
-from io import StringIO
-from shared.data_analysis import DataImporter, DataAnalyzer
+import csv
+import gc
+from io import StringIO, BytesIO
+from shared.data_analysis import DataImporter, DataAnalyzer, DataExporter, PandaaError, load_schemas
+from shared.data_analysis import SelectionError, FormatError, FileAccessError
 
 # tests/test_data_analysis.py
 
 
-class DummyTk:
-    def withdraw(self): pass
-
 @pytest.fixture
 def importer(monkeypatch):
-    # Patch tkinter and tomli
-    monkeypatch.setattr("tkinter.Tk", lambda: DummyTk())
+    # Patch tomli
+    load_schemas() #column schemas are read (and cached) before tomli.load is patched
     monkeypatch.setattr("tomli.load", lambda f: {
         "testassay": {
             "assay": {"FAM": "Target1", "HEX": "Internal Control"},
@@ -93,8 +94,7 @@ def test_hiv_result():
     assert call in ["Negative", "Positive", "Indeterminate"]
 
 def test_init_reporters_valid(monkeypatch):
-    monkeypatch.setattr("tkinter.Tk", lambda: DummyTk())
-    monkeypatch.setattr("tomli.load", lambda f: {'assayX': {'assay': {'FAM': 'Target1', 'VIC': 'IC'}, 'ic': 'VIC'}})
+    monkeypatch.setattr("shared.data_analysis.load_assays", lambda config: {'assayX': {'assay': {'FAM': 'Target1', 'VIC': 'IC'}, 'ic': 'VIC'}})
     importer = DataImporter(assay="assayX", machine_type="Mic", division="vhf")
     importer.init_reporters()
     assert importer.reporter_dict == {'FAM': 'Target1', 'VIC': 'IC'}
@@ -130,4 +130,309 @@ def test_hiv_result_all():
     df = analyzer.df
     assert analyzer.hiv_result(df.iloc[0], "Target1 DRM Percentage") == "Negative"
     assert analyzer.hiv_result(df.iloc[1], "Target1 DRM Percentage") == "Indeterminate"
-    assert analyzer.hiv_result(df.iloc[2], "Target1 DRM Percentage") == "Positive"
\ No newline at end of file
+    assert analyzer.hiv_result(df.iloc[2], "Target1 DRM Percentage") == "Positive"
+
+
+@pytest.mark.parametrize("machine_type", ["QuantStudio 3", "QuantStudio 5", "Mic", "Rotor-Gene"])
+def test_vhf_calls_match_vhf_result(machine_type):
+    rng = np.random.default_rng(0)
+    n = 384
+    cts = {fluor: rng.choice([15.0, 22.5, 29.9, 30.0, 34.0, 35.0, np.nan], size=n) for fluor in ["CY5", "FAM", "VIC"]}
+    cts["VIC"][:10] = cts["FAM"][:10] #ties - first fluor wins
+
+    class DummyData:
+        results = pd.DataFrame({"Well": [f"W{i}" for i in range(n)],
+                                "CY5 CT": cts["CY5"], "FAM CT": cts["FAM"], "VIC CT": cts["VIC"],
+                                "FAM dRn": rng.uniform(0, 100000, size=n), "VIC dRn": rng.uniform(0, 100000, size=n)})
+        reporter_dict = {"CY5": "Internal Control", "FAM": "EBOV", "VIC": "MARV"}
+        reporter_list = ["CY5", "FAM", "VIC"]
+        ic = "CY5"
+        max_dRn_dict = {"FAM": 100000.0, "VIC": float("nan")}
+        cq_cutoff = 35
+    DummyData.machine_type = machine_type
+
+    analyzer = DataAnalyzer(DummyData())
+    expected = analyzer.df.apply(analyzer.vhf_result, axis=1)
+    analyzer.vhf_analysis()
+    assert analyzer.df['Result'].tolist() == expected.tolist()
+
+
+def legacy_hiv_analysis(analyzer):
+    for fluor in analyzer.reporter_list[1:]:
+        kwargs = {f'{analyzer.reporter_dict[fluor]} DRM Percentage':
+                  lambda x: x[fluor + ' Quantity'] / x[analyzer.ic + ' Quantity']}
+        analyzer.df = analyzer.df.assign(**kwargs).fillna(0)
+        analyzer.df[f'{analyzer.reporter_dict[fluor]} Call'] = analyzer.df.apply(analyzer.hiv_result, col=f'{analyzer.reporter_dict[fluor]} DRM Percentage', axis=1)
+
+
+def test_hiv_analysis_matches_row_wise():
+    rng = np.random.default_rng(1)
+    n = 96
+    vq = rng.choice([0.0, 10.0, 49.9, 50.0, 1000.0, 1e5, np.nan], size=n)
+
+    class DummyData:
+        results = pd.DataFrame({"Well": range(n),
+                                "Sample Name": rng.choice(["A", "B", None], size=n),
+                                "CY5 Quantity": vq,
+                                "FAM Quantity": vq * rng.choice([0, 0.01, 0.05, 0.07, 0.1, 0.5, np.nan], size=n),
+                                "NED Quantity": rng.choice([0.0, 5.0, 100.0, np.nan], size=n)})
+        machine_type = "Mic"
+        reporter_dict = {"CY5": "VQ", "FAM": "076V", "NED": "184VI"}
+        reporter_list = ["CY5", "FAM", "NED"]
+        ic = "CY5"
+        max_dRn_dict = {}
+        cq_cutoff = 35
+
+    expected = DataAnalyzer(DummyData())
+    legacy_hiv_analysis(expected)
+    analyzer = DataAnalyzer(DummyData())
+    analyzer.hiv_analysis()
+    pd.testing.assert_frame_equal(analyzer.df, expected.df)
+
+
+QS_TXT = """* Block Type = 96-Well Block (0.2mL)
+* Experiment Barcode = 
+* Experiment Name = 2024-01-17 - LASV Training Kit QC
+* Instrument Type = QuantStudio™ 3 System
+
+[Results]
+Well\tWell Position\tSample Name\tReporter\tCT\tCq Conf\tBaseline End\tDelta Rn (last cycle)\tQuantity
+1\tA1\tNTC\tFAM\tUndetermined\t0.000\t39\t1,234.5\t
+1\tA1\tNTC\tCY5\t25.123\t0.987\t15\t45,678.9\t1,000
+2\tA2\tPos\tFAM\t22.5\t0.950\t12\t123,456.7\t12.5
+
+"""
+
+
+def legacy_read_qs_txt(importer, path):
+    with open(path, newline='') as csvfile:
+        results_table = importer.csv_to_df(csvfile, '\t', '[Results]')
+        csvfile.seek(0)
+        head = importer.extract_header(csv.reader(csvfile, delimiter=','), 'Experiment')
+    results_table['Delta Rn (last cycle)'] = results_table['Delta Rn (last cycle)'].str.replace(',', '').astype(float)
+    results_table['Quantity'] = pd.to_numeric(results_table['Quantity'].str.replace(',', ''), errors='coerce')
+    results_table['CT'] = results_table['CT'].replace(to_replace='Undetermined', value=importer.cq_cutoff)
+    for col in ['CT', 'Cq Conf', 'Baseline End']:
+        results_table[col] = results_table[col].apply(pd.to_numeric)
+    results_table['Quantity'] = results_table['Quantity'].fillna(0)
+    return head, results_table.rename(columns={'Well': 'Well No.', 'Well Position': 'Well'})
+
+
+def test_read_qs_txt_matches_legacy(importer, tmp_path):
+    path = tmp_path / 'plate.txt'
+    path.write_text(QS_TXT)
+    expected_head, expected = legacy_read_qs_txt(importer, path)
+
+    for source in [str(path), StringIO(QS_TXT), BytesIO(path.read_bytes())]:
+        head, results_table = importer.read_qs_txt(source)
+        assert head == expected_head
+        pd.testing.assert_frame_equal(results_table, expected, check_dtype=False)
+        assert results_table['CT'].dtype == float
+
+    # caller's buffer is left open, so it can be rewound and read again
+    buffer = BytesIO(path.read_bytes())
+    importer.read_qs_txt(buffer)
+    gc.collect()
+    assert not buffer.closed
+    buffer.seek(0)
+    assert importer.read_qs_txt(buffer)[0] == expected_head
+
+
+def test_parse_mic_csv(tmp_path, write_mic_csv):
+    path = tmp_path / 'mic.csv'
+    write_mic_csv(path, ['CY5', 'FAM', 'NED'])
+    importer = DataImporter(assay="076V 184VI", machine_type="Mic", division="hiv", filepath=str(path))
+    importer.parse()
+
+    assert importer.head[:2] == [['Start Worksheet - General Information'], ['Experiment Name', 'Mic run']]
+    assert list(importer.results.columns) == ['Well', 'Sample Name', 'CY5 CT', 'CY5 Quantity', 'Assigned Quantity', 'FAM CT', 'FAM Quantity', 'NED CT', 'NED Quantity']
+    assert importer.results['CY5 Quantity'][:3].round(-1).tolist() == [1e6, 1e4, 1e2]
+    assert importer.results['FAM Quantity'][:3].round(-1).tolist() == [2e5, 2e3, 2e1] #standards are 20% DRM
+    assert importer.curves['CY5']['slope'] == pytest.approx(-3.3, abs=0.01)
+    assert importer.curves['CY5']['r2'] == pytest.approx(1)
+    assert importer.curves['CY5']['efficiency'] == pytest.approx(10**(1/3.3) - 1, abs=0.01)
+
+
+def legacy_write_csv(exporter, path):
+    '''Write results, then prepend header by re-reading and rewriting the file, as before.'''
+    exporter.results.to_csv(path_or_buf=path, index=False)
+    with open(path, 'r+', newline='', errors='replace') as file:
+        existing = file.read()
+        file.seek(0)
+        writer = csv.writer(file)
+        writer.writerows(exporter.header)
+        file.write('\n\n'+existing)
+
+
+def mic_exporter(write_mic_csv, tmp_path):
+    path = tmp_path / 'mic.csv'
+    write_mic_csv(path, ['CY5', 'FAM', 'NED'])
+    importer = DataImporter(assay="076V 184VI", machine_type="Mic", division="hiv", filepath=str(path))
+    importer.parse()
+    importer.results.loc[0, 'Sample Name'] = 'Échantillon, "1"' #needs quoting and non-ASCII encoding
+    analyzer = DataAnalyzer(data=importer)
+    analyzer.hiv_analysis()
+    return DataExporter(importer, analyzer, columns=['Well', 'Sample Name', 'Cq', 'Call', 'DRM Percentage'])
+
+
+def test_export_matches_legacy(tmp_path, write_mic_csv):
+    exporter = mic_exporter(write_mic_csv, tmp_path)
+    exporter.export()
+
+    legacy_path = tmp_path / 'legacy.csv'
+    legacy_write_csv(exporter, legacy_path)
+    summary = open(exporter.dest_filepath, 'rb').read()
+    assert summary == legacy_path.read_bytes()
+    assert exporter.bytes_written == len(summary)
+    assert exporter.write_seconds > 0
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['legacy.csv', 'mic - Summary.csv', 'mic.csv'] #no temporary files left
+
+
+def test_export_failure_keeps_previous_file(tmp_path, monkeypatch, write_mic_csv):
+    exporter = mic_exporter(write_mic_csv, tmp_path)
+    summary_path = tmp_path / 'mic - Summary.csv'
+    summary_path.write_text('previous summary')
+
+    def fail(self, file):
+        file.write(b'partial')
+        raise OSError('disk full')
+    monkeypatch.setattr(DataExporter, 'write_csv', fail)
+
+    with pytest.raises(FileAccessError):
+        exporter.export()
+    assert summary_path.read_text() == 'previous summary'
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['mic - Summary.csv', 'mic.csv']
+
+    monkeypatch.undo() #e.g. user closed the file - saving again is enough
+    exporter.save()
+    assert summary_path.read_text() != 'previous summary'
+
+
+def test_typed_errors(tmp_path, write_qs_xlsx):
+    write_qs_xlsx(tmp_path / 'plate.xlsx', wells=6)
+    with pytest.raises(SelectionError):
+        DataImporter(assay='PANDAA LASV', machine_type='QuantStudio 5', division='vhf').parse()
+    with pytest.raises(FormatError): #file is from another assay
+        DataImporter(assay='076V 184VI', machine_type='QuantStudio 5', division='hiv', filepath=str(tmp_path / 'plate.xlsx')).parse()
+    with pytest.raises(PandaaError):
+        DataImporter(assay='No such assay', machine_type='QuantStudio 5', division='vhf', filepath=str(tmp_path / 'plate.xlsx')).parse()
+
+
+def test_file_object_in_and_out(tmp_path, write_qs_xlsx):
+    write_qs_xlsx(tmp_path / 'plate.xlsx', wells=6)
+    source = BytesIO((tmp_path / 'plate.xlsx').read_bytes())
+    source.name = 'upload.xlsx'
+    importer = DataImporter(assay='PANDAA LASV', machine_type='QuantStudio 5', division='vhf', filepath=source)
+    importer.parse()
+    analyzer = DataAnalyzer(data=importer, pos_cutoff=importer.cq_cutoff, dRn_percent_cutoff=0.1)
+    analyzer.vhf_analysis()
+    exporter = DataExporter(importer, analyzer, columns=['Well', 'Sample Name'], dest_filepath=str(tmp_path / 'out.csv'))
+    exporter.export()
+    assert (tmp_path / 'out.csv').exists() and not (tmp_path / 'upload - Summary.csv').exists()
+
+
+def legacy_qs_reshape(importer, results_table):
+    '''Split long QuantStudio table with one mask per fluor, then merge, as before.'''
+    results_dict, max_dRn = {}, {}
+    for fluor in importer.reporter_dict:
+        results_dict[fluor] = results_table.loc[results_table['Reporter'] == fluor].rename(
+            columns={'Well': 'Well No.', 'Well Position': 'Well', 'CT': f'{fluor} CT', 'Cq Conf': f'{fluor} Cq Conf',
+                     'Delta Rn (last cycle)': f'{fluor} dRn', 'Quantity': f'{fluor} Quantity'})
+        baseline_end = 5 if importer.reporter_dict[fluor] == 'Internal Control' else 10
+        get_max = results_dict[fluor].loc[results_dict[fluor]['Baseline End'] >= baseline_end, [f'{fluor} dRn']]
+        max_dRn[fluor] = float(get_max[f'{fluor} dRn'].max())
+    return importer.summarize(results_dict), max_dRn
+
+
+def qs_long_table(reporters, wells=12, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = [{'Well': w, 'Well Position': f'{chr(65 + w//12)}{w%12 + 1}', 'Sample Name': f'S{w}', 'Reporter': reporter,
+             'CT': rng.uniform(15, 35), 'Cq Conf': rng.uniform(0, 1), 'Baseline End': int(rng.integers(3, 15)),
+             'Delta Rn (last cycle)': rng.uniform(0, 1e5), 'Quantity': rng.uniform(0, 1e6)}
+            for w in range(wells) for reporter in reporters]
+    table = pd.DataFrame(rows).sample(frac=1, random_state=seed).reset_index(drop=True) #rows in any order
+    return table.drop(index=table.index[(table['Well'] == 3) & (table['Reporter'] == reporters[-1])]) #well missing one fluor
+
+
+@pytest.mark.parametrize('assay,division', [('PANDAA LASV', 'vhf'), ('076V 184VI', 'hiv')])
+def test_qs_reshape_matches_legacy(assay, division):
+    importer = DataImporter(assay=assay, machine_type='QuantStudio 5', division=division)
+    importer.init_reporters()
+    table = qs_long_table(list(importer.reporter_dict))
+
+    expected, expected_max = legacy_qs_reshape(importer, table.copy())
+    metrics = {'CT': 'CT', 'Cq Conf': 'Cq Conf', 'Delta Rn (last cycle)': 'dRn'}
+    if division == 'hiv':
+        metrics['Quantity'] = 'Quantity'
+    wide, codes = importer.widen(table.rename(columns={'Well': 'Well No.', 'Well Position': 'Well'}),
+                                 list(importer.reporter_dict), metrics, shared=['Sample Name'])
+    pd.testing.assert_frame_equal(wide, expected)
+    assert len(wide) == 11
+
+
+def test_parse_qs_max_dRn(tmp_path, write_qs_xlsx):
+    write_qs_xlsx(tmp_path / 'plate.xlsx', wells=6)
+    importer = DataImporter(assay='PANDAA LASV', machine_type='QuantStudio 5', division='vhf', filepath=str(tmp_path / 'plate.xlsx'))
+    importer.parse()
+    assert list(importer.results.columns) == ['Well', 'Sample Name', 'CY5 CT', 'CY5 Cq Conf', 'CY5 dRn', 'FAM CT', 'FAM Cq Conf', 'FAM dRn']
+    assert importer.max_dRn_dict == {'CY5': 50000.0, 'FAM': 50000.0}
+
+
+def write_rgq_csv(path, channel, wells=8, seed=0):
+    rng = np.random.default_rng(seed)
+    lines = [f'Experiment Information,{channel}'] + [f'Info {i},value {i}' for i in range(24)] + ['Quantitative analysis,Cycling', '']
+    lines.append('No.,Colour,Name,Type,Ct,Ct Comment,Given Conc (copies/reaction),Calc Conc (copies/reaction)')
+    for well in range(1, wells+1):
+        ct = '' if well % 4 == 0 else f'{rng.uniform(15, 35):.2f}'
+        lines.append(f'{well},,Sample {well},Unknown,{ct},,,')
+    path.write_text('\n'.join(lines) + '\n')
+
+
+def legacy_rgq_results(importer, filepaths):
+    '''Merge one Rotor-Gene table per channel file into the summary table, as before.'''
+    results, first_loop = None, True
+    for filepath in filepaths:
+        table = pd.read_csv(filepath, skiprows=27)
+        table['Ct'] = table['Ct'].fillna(importer.cq_cutoff)
+        for fluor in importer.reporter_dict:
+            if f'{fluor}.csv' in filepath or f'{importer.reporter_dict[fluor]}.csv' in filepath:
+                table = table.rename(columns={'No.': 'Well', 'Name': 'Sample Name', 'Ct': f'{fluor} CT',
+                                              'Ct Comment': 'Comments', 'Given Conc (copies/reaction)': 'Copies'})
+                if first_loop:
+                    results = table.loc[:, ['Well', 'Sample Name', 'Copies', 'Comments', f'{fluor} CT']]
+                    first_loop = False
+                else:
+                    results = pd.merge(results, table.loc[:, ['Well', f'{fluor} CT']], on='Well')
+    return results
+
+
+def test_parse_rgq_matches_legacy(tmp_path):
+    filepaths = []
+    for i, channel in enumerate(['076V', 'CY5', 'NED']): #files named by target or fluor, in any order
+        filepaths.append(str(tmp_path / f'run {channel}.csv'))
+        write_rgq_csv(tmp_path / f'run {channel}.csv', channel, seed=i)
+
+    importer = DataImporter(assay='076V 184VI', machine_type='Rotor-Gene', division='hiv', filepath=filepaths)
+    importer.parse()
+    pd.testing.assert_frame_equal(importer.results, legacy_rgq_results(importer, filepaths))
+    assert importer.head[0] == ['Experiment Information', '076V']
+
+    sources = [] #channel files as file objects, e.g. uploads or files read ahead by the pipeline
+    for filepath in filepaths:
+        sources.append(BytesIO(open(filepath, 'rb').read()))
+        sources[-1].name = filepath
+    from_memory = DataImporter(assay='076V 184VI', machine_type='Rotor-Gene', division='hiv', filepath=sources)
+    from_memory.parse()
+    pd.testing.assert_frame_equal(from_memory.results, importer.results)
+    assert from_memory.head == importer.head and from_memory.filepath == str(tmp_path / 'run ')
+
+
+def test_parse_rgq_wrong_files(tmp_path):
+    for i, channel in enumerate(['076V', 'CY5', 'NED', 'FAM']):
+        write_rgq_csv(tmp_path / f'run {channel}.csv', channel, seed=i)
+    (tmp_path / 'run notes.csv').write_text('not a channel')
+    for names in (['076V', 'CY5', 'notes'], ['076V', 'CY5', 'FAM']): #FAM is 076V's fluor - 076V twice, no 184VI
+        importer = DataImporter(assay='076V 184VI', machine_type='Rotor-Gene', division='hiv',
+                                filepath=[str(tmp_path / f'run {name}.csv') for name in names])
+        with pytest.raises(FormatError):
+            importer.parse()
@@ -0,0 +1,75 @@
+import pytest
+from shared import gui
+from shared.data_analysis import DataImporter, FormatError, FileAccessError, SelectionError
+
+# tests/test_gui.py - dialogs are replaced, so no window is shown
+
+
+class Dialogs:
+    '''Records dialogs shown, and answers them.'''
+    def __init__(self, monkeypatch, retry=True, files=()):
+        self.shown = []
+        self.retry = retry
+        monkeypatch.setattr(gui.dialogs, 'showerror', lambda message: self.shown.append(('error', message)))
+        monkeypatch.setattr(gui.dialogs, 'askretrycancel', self.askretrycancel)
+        monkeypatch.setattr(gui.dialogs, 'askopenfilename', lambda **kwargs: files[0] if files else '')
+        monkeypatch.setattr(gui.dialogs, 'askopenfilenames', lambda **kwargs: tuple(files))
+
+    def askretrycancel(self, message):
+        self.shown.append(('retry', message))
+        return self.retry
+
+
+def test_attempt_retries_file_access(monkeypatch):
+    dialogs = Dialogs(monkeypatch)
+    calls = []
+
+    def save():
+        calls.append('save')
+        if len(calls) < 4:
+            raise FileAccessError('Unable to write results file.')
+        return 'saved'
+
+    def export():
+        calls.append('export')
+        save()
+
+    gui.attempt(export, retry=save) #only saving is retried
+    assert calls == ['export', 'save', 'save', 'save']
+    assert [kind for kind, _ in dialogs.shown] == ['retry', 'retry']
+
+
+def test_attempt_cancel_and_errors_close(monkeypatch):
+    dialogs = Dialogs(monkeypatch, retry=False)
+
+    def fail(error):
+        raise error
+    with pytest.raises(SystemExit):
+        gui.attempt(fail, FileAccessError('open in another program'))
+    with pytest.raises(SystemExit):
+        gui.attempt(fail, FormatError('Fluorophores in file do not match'))
+    assert dialogs.shown[-1] == ('error', 'Fluorophores in file do not match')
+    with pytest.raises(ValueError): #bugs are not hidden behind a message box
+        gui.attempt(fail, ValueError('bug'))
+
+
+def test_choose_results(monkeypatch):
+    Dialogs(monkeypatch, files=['a.csv', 'b.csv'])
+    importer = DataImporter(assay='076V 184VI', machine_type='Rotor-Gene', division='hiv')
+    with pytest.raises(SelectionError): #076V 184VI has three channels
+        gui.choose_results(importer)
+
+    Dialogs(monkeypatch, files=['plate.xlsx'])
+    assert gui.choose_results(DataImporter(assay='PANDAA LASV', machine_type='QuantStudio 5', division='vhf')) == 'plate.xlsx'
+    Dialogs(monkeypatch)
+    with pytest.raises(SelectionError):
+        gui.choose_results(DataImporter(assay='PANDAA LASV', machine_type='Mic', division='vhf'))
+
+
+def test_choose_one_rgq_channel(monkeypatch, tmp_path):
+    from shared.synthetic import SyntheticPlate
+    run = SyntheticPlate('PANDAA LASV', wells=4).write(str(tmp_path), 'Rotor-Gene', '.csv', name='run')
+    SyntheticPlate('PANDAA LASV', wells=4, seed=1).write(str(tmp_path), 'Rotor-Gene', '.csv', name='other')
+    Dialogs(monkeypatch, files=[run[0]])
+    importer = DataImporter(assay='PANDAA LASV', machine_type='Rotor-Gene', division='vhf')
+    assert sorted(gui.choose_results(importer)) == sorted(run) #the other run's files are left out
@@ -0,0 +1,116 @@
+import os
+import json
+import pytest
+from shared.data_analysis import DataImporter, instrument #the instrument module used by the pipeline itself
+from shared.synthetic import SyntheticPlate
+
+# tests/test_instrument.py
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    path = tmp_path / 'trace.jsonl'
+    instrument.configure(trace=str(path), environ={})
+    yield path
+    instrument.configure(environ={}) #off again for other tests
+
+
+def records(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+@pytest.mark.parametrize('value, expected', [(None, None), ('', None), ('0', None), ('off', None), ('False', None),
+                                             ('1', '1'), ('stderr', 'stderr'), (' trace.jsonl ', 'trace.jsonl')])
+def test_flags(value, expected):
+    environ = {} if value is None else {'PANDAA_TRACE': value, 'PANDAA_PROFILE': value}
+    settings = instrument.configure(environ=environ)
+    try:
+        assert settings.trace == expected
+        assert settings.profile == expected
+        assert instrument.tracing() == (expected is not None)
+    finally:
+        instrument.configure(environ={})
+
+
+def test_off_by_default(tmp_path):
+    instrument.configure(environ={})
+    with instrument.span('parse', machine='Mic') as fields:
+        fields['wells'] = 48
+    assert fields == {'machine': 'Mic', 'wells': 48}
+    with instrument.profiled('hiv') as stem:
+        assert stem is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_nested_spans(trace_file):
+    with instrument.span('parse', machine='Mic') as fields:
+        with instrument.span('csv_to_df'):
+            pass
+        fields['wells'] = 48
+
+    inner, outer = records(trace_file) #records are emitted as spans end
+    assert inner['span'] == 'csv_to_df' and inner['parent'] == 'parse' and inner['depth'] == 1
+    assert outer['span'] == 'parse' and outer['parent'] is None and outer['depth'] == 0
+    assert outer['machine'] == 'Mic' and outer['wells'] == 48
+    assert outer['status'] == 'ok' and outer['ms'] >= inner['ms'] >= 0
+    assert inner['run'] == outer['run'] and inner['pid'] == os.getpid()
+
+
+def test_error_span(trace_file):
+    with pytest.raises(ValueError):
+        with instrument.span('export'):
+            raise ValueError('no columns')
+
+    [record] = records(trace_file)
+    assert record['status'] == 'error'
+    assert record['error'] == 'ValueError: no columns'
+
+
+def test_traced(trace_file):
+    @instrument.traced()
+    def summarize(x):
+        return x + 1
+
+    assert summarize(1) == 2
+    assert summarize.__name__ == 'summarize'
+    assert [record['span'] for record in records(trace_file)] == ['summarize']
+
+
+def test_pipeline_spans(tmp_path, trace_file):
+    '''Parsing an Excel export emits spans for the workbook load and table reads, nested in the parse.'''
+    filepath = SyntheticPlate('PANDAA LASV').write(str(tmp_path), 'QuantStudio 5', '.xlsx')
+    DataImporter(assay='PANDAA LASV', machine_type='QuantStudio 5', filepath=filepath).parse()
+
+    spans = {record['span']: record for record in records(trace_file)}
+    assert spans['read_results']['wells'] == 96
+    assert spans['excel_load']['parent'] == 'read_results'
+    assert spans['excel_read_table']['parent'] == 'read_results'
+
+
+def test_profiled(tmp_path):
+    instrument.configure(profile=str(tmp_path / 'profiles'), environ={})
+    try:
+        with instrument.profiled('vhf') as stem:
+            sorted(range(10000), key=lambda x: -x)
+    finally:
+        instrument.configure(environ={})
+
+    assert os.path.exists(stem + '.prof')
+    with open(stem + '.txt') as f:
+        report = f.read()
+    assert 'cumulative' in report and 'Peak traced memory' in report
+
+
+def test_unwritable_targets(tmp_path):
+    '''A bad trace file or profile folder only switches instrumentation off.'''
+    blocker = tmp_path / 'file'
+    blocker.write_text('')
+    instrument.configure(trace=str(blocker / 'trace.jsonl'), profile=str(blocker), environ={})
+    try:
+        with instrument.profiled('hiv') as stem:
+            with instrument.span('parse'):
+                pass
+        assert stem is None
+        assert not instrument.tracing()
+    finally:
+        instrument.configure(environ={})
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from shared import linreg
+
+# tests/test_linreg.py
+
+
+def standards_frame(rng, fluor, wells=24, standards=5):
+    quantity = np.full(wells, np.nan)
+    quantity[:standards] = 10.0**np.arange(standards, 0, -1)
+    cq = 38 - 3.3*np.log10(np.where(np.isnan(quantity), 10, quantity)) + rng.normal(0, 0.2, wells)
+    return pd.DataFrame({'Assigned Quantity': quantity, f'{fluor} CT': cq})
+
+
+def test_fit_curves_matches_linreg():
+    rng = np.random.default_rng(1)
+    fluors = ['CY5', 'FAM', 'NED']
+    frames = [standards_frame(rng, fluor, standards=3+i) for i, fluor in enumerate(fluors)]
+
+    x = np.array([np.log10(df['Assigned Quantity'] * (1 if fluor == 'CY5' else 0.2)) for fluor, df in zip(fluors, frames)])
+    y = np.array([df[f'{fluor} CT'] for fluor, df in zip(fluors, frames)])
+    m, b, r2, efficiency = linreg.fit_curves(x, y)
+
+    for i, (fluor, df) in enumerate(zip(fluors, frames)):
+        expected_m, expected_b = linreg.linreg(df, fluor=fluor, percent_drm=0.2)
+        assert m[i] == pytest.approx(expected_m, rel=1e-12)
+        assert b[i] == pytest.approx(expected_b, rel=1e-12)
+        used = ~np.isnan(x[i])
+        assert r2[i] == pytest.approx(np.corrcoef(x[i][used], y[i][used])[0, 1]**2)
+        assert efficiency[i] == pytest.approx(10**(-1/expected_m) - 1)
+
+        expected = df[f'{fluor} CT'].apply(linreg.quantify, args=(expected_m, expected_b))
+        np.testing.assert_allclose(linreg.quantify(y, m[:, None], b[:, None])[i], expected, rtol=1e-10)
+
+
+def test_fit_curves_degenerate():
+    x = np.array([[np.nan, np.nan, np.nan], [1.0, np.nan, np.nan], [2.0, 2.0, np.nan], [1.0, 2.0, 3.0]])
+    y = np.array([[30.0, 31, 32], [30, 31, 32], [30, 31, 32], [30, 27, 24]])
+    m, b, r2, efficiency = linreg.fit_curves(x, y)
+    assert np.isnan(m[:3]).all() and np.isnan(b[:3]).all()
+    assert (m[3], b[3], r2[3]) == pytest.approx((-3, 33, 1))
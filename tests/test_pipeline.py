@@ -0,0 +1,121 @@
+import os
+import shutil
+import time
+import pytest
+from shared.batch import BatchRunner
+from shared.pipeline import PipelineRunner
+from concurrent.futures.process import BrokenProcessPool
+from shared.synthetic import SyntheticPlate
+
+# tests/test_pipeline.py
+
+
+def write_plates(folder, count, wells=8):
+    os.makedirs(folder)
+    return [SyntheticPlate('PANDAA LASV', wells=wells, seed=i).write(str(folder), 'QuantStudio 5', '.xlsx') for i in range(count)]
+
+
+def dying_render(*args):
+    '''Stands in for render_report - the PDF worker process dies outright, as on a crash in a native library.'''
+    os._exit(1)
+
+
+def test_pipeline_matches_batch(tmp_path, load_config):
+    write_plates(tmp_path / 'batch', 4)
+    shutil.copytree(tmp_path / 'batch', tmp_path / 'pipeline')
+    for folder in ('batch', 'pipeline'):
+        (tmp_path / folder / 'broken.xlsx').write_bytes(b'not a workbook')
+
+    batch = BatchRunner('PANDAA LASV', 'QuantStudio 5', load_config('vhf'), create_pdf=False)
+    batch.collect([str(tmp_path / 'batch')])
+    batch.run()
+    pipeline = PipelineRunner('PANDAA LASV', 'QuantStudio 5', load_config('vhf'), create_pdf=True, keep_results=True)
+    pipeline.collect([str(tmp_path / 'pipeline')])
+    pipeline.run()
+
+    assert [os.path.basename(record['source']) for record in pipeline.records] == [os.path.basename(plate) for plate in batch.plates]
+    assert [record['status'] for record in pipeline.records] == [record['status'] for record in batch.records]
+    failed = [record for record in pipeline.records if record['status'] != 'ok']
+    assert len(failed) == 1 and failed[0]['error'].startswith('parse: Incorrect file') #broken.xlsx - the other plates carry on
+    for before, after in zip(batch.records, pipeline.records):
+        if after['status'] != 'ok':
+            continue
+        assert open(before['summary'], 'rb').read() == open(after['summary'], 'rb').read()
+        assert os.path.exists(after['pdf']) and 'results' in after
+        assert set(after['timings']) == {'read', 'parse', 'analyze', 'export', 'pdf', 'total'}
+
+    summary = pipeline.summary()
+    assert summary['succeeded'] == 4 and summary['failed'] == 1
+    assert summary['utilization']['parse']['plates'] == 5 and summary['utilization']['pdf']['plates'] == 4
+    assert all(0 <= usage['utilization'] <= 1 for usage in summary['utilization'].values())
+
+
+def test_pipeline_back_pressure(tmp_path, monkeypatch, load_config):
+    '''A slow last stage holds back the stages before it, instead of plates piling up in memory.'''
+    plates = write_plates(tmp_path / 'plates', 12, wells=2)
+    export = PipelineRunner.export_plate
+    async def slow_export(self, loop, executor, record, analyzed):
+        time.sleep(0.05) #blocks the event loop too - the worst case for the stages before it
+        return await export(self, loop, executor, record, analyzed)
+    monkeypatch.setattr(PipelineRunner, 'export_plate', slow_export)
+
+    pipeline = PipelineRunner('PANDAA LASV', 'QuantStudio 5', load_config('vhf'), create_pdf=False, queue_size=1, parse_workers=1)
+    pipeline.plates = plates
+    pipeline.run()
+    assert all(record['status'] == 'ok' for record in pipeline.records)
+    assert pipeline.max_in_flight <= 8 #four stages: one plate in each worker and one in each queue
+    assert pipeline.utilization['read']['blocked'] > 0
+
+
+def test_pipeline_stops_on_error(tmp_path, monkeypatch, load_config):
+    '''An error that isn't about a single plate stops every stage, and is raised.'''
+    plates = write_plates(tmp_path / 'plates', 6, wells=2)
+    pipeline = PipelineRunner('PANDAA LASV', 'QuantStudio 5', load_config('vhf'), create_pdf=False)
+    pipeline.plates = plates
+    new_record = pipeline.new_record
+    def fail_third(plate):
+        if plate == plates[2]:
+            raise RuntimeError('out of records')
+        return new_record(plate)
+    monkeypatch.setattr(pipeline, 'new_record', fail_third)
+
+    with pytest.raises(RuntimeError, match='out of records'):
+        pipeline.run()
+    assert pipeline.records == []
+
+
+def test_pipeline_rgq_runs(tmp_path, load_config):
+    '''Rotor-Gene channel files are read ahead into memory, and analyzed as one plate per run.'''
+    for i in range(2):
+        SyntheticPlate('PANDAA LASV', wells=4, seed=i).write(str(tmp_path / 'batch'), 'Rotor-Gene', '.csv')
+    shutil.copytree(tmp_path / 'batch', tmp_path / 'pipeline')
+
+    batch = BatchRunner('PANDAA LASV', 'Rotor-Gene', load_config('vhf'), create_pdf=False)
+    batch.collect([str(tmp_path / 'batch')])
+    batch.run()
+    pipeline = PipelineRunner('PANDAA LASV', 'Rotor-Gene', load_config('vhf'), create_pdf=False)
+    pipeline.collect([str(tmp_path / 'pipeline')])
+    pipeline.run()
+
+    assert len(pipeline.records) == 2 and all(record['status'] == 'ok' for record in pipeline.records)
+    for before, after in zip(batch.records, pipeline.records):
+        assert open(before['summary'], 'rb').read() == open(after['summary'], 'rb').read()
+
+
+def test_pipeline_broken_pdf_pool_stops_run(tmp_path, monkeypatch, load_config):
+    write_plates(tmp_path / 'plates', 4, wells=2)
+    monkeypatch.setattr('shared.pipeline.render_report', dying_render) #PDF worker processes are forked with it
+    pipeline = PipelineRunner('PANDAA LASV', 'QuantStudio 5', load_config('vhf'), create_pdf=True)
+    pipeline.collect([str(tmp_path / 'plates')])
+    with pytest.raises(BrokenProcessPool): #not recorded as a failure of each later plate
+        pipeline.run()
+    assert pipeline.records == []
+
+
+def test_pipeline_unreadable_plate(tmp_path, monkeypatch, load_config):
+    plates = write_plates(tmp_path / 'plates', 2, wells=2)
+    pipeline = PipelineRunner('PANDAA LASV', 'QuantStudio 5', load_config('vhf'), create_pdf=False)
+    pipeline.plates = plates + [str(tmp_path / 'plates' / 'removed.xlsx')]
+    pipeline.run()
+    assert [record['status'] for record in pipeline.records] == ['ok', 'ok', 'failed']
+    assert pipeline.records[-1]['error'].startswith('read: Unable to read results file')
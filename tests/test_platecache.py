@@ -0,0 +1,78 @@
+import os
+import pytest
+from shared.data_analysis import DataImporter
+from shared.platecache import PlateCache
+
+# tests/test_platecache.py
+
+
+def new_importer(filepath, cache, cq_cutoff=35):
+    return DataImporter(cq_cutoff=cq_cutoff, machine_type='QuantStudio 5', assay='PANDAA LASV', division='vhf',
+                        filepath=str(filepath), cache=cache)
+
+
+def test_cache_hit_skips_parsing(tmp_path, monkeypatch, write_qs_xlsx):
+    write_qs_xlsx(tmp_path / 'plate.xlsx')
+    cache = PlateCache(tmp_path / 'cache')
+
+    parsed = new_importer(tmp_path / 'plate.xlsx', cache)
+    parsed.parse()
+
+    def fail(self):
+        raise AssertionError('plate was parsed again')
+    monkeypatch.setattr(DataImporter, 'parse_qs', fail)
+
+    cached = new_importer(tmp_path / 'plate.xlsx', cache)
+    cached.parse()
+    assert cached.results.equals(parsed.results)
+    assert cached.head == parsed.head
+    assert cached.max_dRn_dict == parsed.max_dRn_dict
+    assert cached.ext == '.xlsx'
+
+
+def test_cache_key_changes(tmp_path, write_qs_xlsx):
+    write_qs_xlsx(tmp_path / 'plate.xlsx')
+    cache = PlateCache(tmp_path / 'cache')
+    key = cache.key(new_importer(tmp_path / 'plate.xlsx', cache))
+
+    assert cache.key(new_importer(tmp_path / 'plate.xlsx', cache)) == key
+    assert cache.key(new_importer(tmp_path / 'plate.xlsx', cache, cq_cutoff=30)) != key
+    write_qs_xlsx(tmp_path / 'plate.xlsx', wells=6)
+    assert cache.key(new_importer(tmp_path / 'plate.xlsx', cache)) != key
+
+
+def test_cache_eviction(tmp_path, write_qs_xlsx):
+    cache = PlateCache(tmp_path / 'cache')
+    for i in range(3):
+        write_qs_xlsx(tmp_path / f'plate{i}.xlsx', wells=2+i)
+        new_importer(tmp_path / f'plate{i}.xlsx', cache).parse()
+    entries = sorted(cache.entries())
+    assert len(entries) == 3
+
+    oldest, newest = entries[0][2], entries[-1][2]
+    os.utime(os.path.join(oldest, 'meta.json'), (0, 0))
+    cache.max_bytes = sum(size for _, size, _ in entries) - 1
+    cache.evict()
+    remaining = [entry for _, _, entry in cache.entries()]
+    assert oldest not in remaining and newest in remaining
+
+    cache.clear()
+    assert cache.entries() == []
+
+
+def test_cache_mixed_columns(tmp_path, write_qs_xlsx):
+    '''Columns mixing numbers and text are stored as Parquet, and come back with their original types.'''
+    write_qs_xlsx(tmp_path / 'plate.xlsx', wells=6)
+    cache = PlateCache(tmp_path / 'cache')
+    parsed = new_importer(tmp_path / 'plate.xlsx', None)
+    parsed.parse()
+    parsed.results['Sample Name'] = [1, '1', 2.5, None, True, 'NTC']
+    cache.store(cache.key(parsed), parsed)
+
+    [(_, _, entry)] = cache.entries()
+    assert sorted(os.listdir(entry)) == ['meta.json', 'results.parquet'] #no pickle
+
+    cached = new_importer(tmp_path / 'plate.xlsx', cache)
+    assert cache.load(cache.key(cached), cached)
+    assert cached.results.equals(parsed.results)
+    assert [type(name) for name in cached.results['Sample Name'][:6]] == [int, str, float, type(None), bool, str]
@@ -0,0 +1,51 @@
+import re
+import pandas as pd
+import pytest
+from reportlab import rl_config
+from reportlab.platypus import Paragraph
+from shared.reportbuilder import Report
+
+# tests/test_reportbuilder.py
+
+HEAD = [['Experiment Name', 'Report test'], ['Instrument Type', 'QuantStudio 5 System']]
+
+
+def make_results(rows):
+    return pd.DataFrame({'Well': [f'A{i+1}' for i in range(rows)],
+                         'Sample Name': [f'Sample {i}' for i in range(rows)],
+                         'Cq': [20.123456 + i for i in range(rows)],
+                         'Result': ['Negative' if i % 3 else 'Invalid' for i in range(rows)]})
+
+
+def test_results_to_table(tmp_path):
+    results = make_results(4)
+    results.loc[1, 'Sample Name'] = 'A sample name much too long to fit on one line of its column'
+    report = Report(str(tmp_path / 'r.pdf'), HEAD, results)
+    data, commands = report.results_to_table(results, colWidths=[36, 100, 100, 100])
+
+    assert all(isinstance(cell, Paragraph) for cell in data[0]) #bold column headers
+    assert data[1] == ['A1', 'Sample 0', '20.12', 'Invalid']
+    assert isinstance(data[2][1], Paragraph)                   #wrapped
+    assert ('ALIGN', (2, 1), (2, 4), 'RIGHT') in commands       #one command for the whole run of numbers
+    assert not any(command[0] == 'ALIGN' and command[1][0] != 2 for command in commands)
+
+
+def test_results_to_table_dropped_row(tmp_path):
+    rows = [['Well', 'Sample Name', 'Cq'], ['A1', 'Sample 0', '20.5'], ['', '', '7'], ['A2', 'Sample 1', 'Undetermined']]
+    report = Report(str(tmp_path / 'r.pdf'), HEAD, rows)
+    data, commands = report.results_to_table(rows, colWidths=[36, 100, 100])
+
+    assert data[2] == ['A2', 'Sample 1', 'Undetermined'] #row with a single cell is left out
+    assert [command for command in commands if command[0] == 'ALIGN'] == [('ALIGN', (2, 1), (2, 1), 'RIGHT')]
+
+
+@pytest.mark.parametrize('rows', [5, 200])
+def test_page_numbers(tmp_path, monkeypatch, rows):
+    monkeypatch.setattr(rl_config, 'pageCompression', 0)
+    pdf_file = tmp_path / 'report.pdf'
+    Report(str(pdf_file), HEAD, make_results(rows)).create()
+
+    pdf = pdf_file.read_bytes()
+    pages = pdf.count(b'/Type /Page\n')
+    assert pages >= (1 if rows < 50 else 2)
+    assert re.findall(rb'Page (\d+) of (\d+)', pdf) == [(str(i).encode(), str(pages).encode()) for i in range(1, pages+1)]
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+from shared.data_analysis import DataImporter, DataAnalyzer
+from shared.requant import Requantifier, expand_plate_paths, load_plate, main
+
+# tests/test_requant.py
+
+ASSAY = '076V 184VI'
+
+
+def parse_plates(write_mic_csv, tmp_path, drm_percentage):
+    '''Parse and analyze three Mic plates the usual way, one at a time.'''
+    importers, analyzers = [], []
+    for i, standards in enumerate([{1: 1e6, 2: 1e4, 3: 1e2}, {1: 1e5, 2: 1e3}, {2: 1e6, 4: 1e5, 6: 1e3, 7: 1e2}]):
+        path = tmp_path / f'mic{i}.csv'
+        write_mic_csv(path, ['CY5', 'FAM', 'NED'], standards=standards, wells=6+2*i)
+        importer = DataImporter(assay=ASSAY, machine_type='Mic', division='hiv', drm_percentage=drm_percentage,
+                                filepath=str(path))
+        importer.parse()
+        importers.append(importer)
+
+        analyzer = DataAnalyzer(data=DataImporterCopy(importer))
+        analyzer.hiv_analysis()
+        analyzers.append(analyzer)
+    return importers, analyzers
+
+
+class DataImporterCopy:
+    '''Importer stand-in with a copy of the results, so analysis leaves the parsed frame untouched.'''
+    def __init__(self, importer):
+        self.__dict__.update(importer.__dict__)
+        self.results = importer.results.copy()
+
+
+@pytest.mark.parametrize('drm_percentage', [0.2, 0.25])
+def test_requantify_matches_parse(tmp_path, drm_percentage, write_mic_csv):
+    stored, _ = parse_plates(write_mic_csv, tmp_path, 0.2)
+    expected_importers, expected_analyzers = parse_plates(write_mic_csv, tmp_path, drm_percentage)
+
+    requantifier = Requantifier(ASSAY, drm_percentage=drm_percentage, chunk_size=2)
+    results = list(requantifier.requantify(importer.results for importer in stored))
+
+    assert requantifier.stats['plates'] == 3 and requantifier.stats['curves'] == 9
+    assert requantifier.stats['plates_per_second'] > 0
+    for df, importer, analyzer in zip(results, expected_importers, expected_analyzers):
+        for fluor in ['CY5', 'FAM', 'NED']:
+            np.testing.assert_allclose(df[f'{fluor} Quantity'], importer.results[f'{fluor} Quantity'], rtol=1e-9)
+            assert df.attrs['curves'][fluor] == pytest.approx(importer.curves[fluor])
+        for target in ['076V', '184VI']:
+            np.testing.assert_allclose(df[f'{target} DRM Percentage'], analyzer.df[f'{target} DRM Percentage'], rtol=1e-9)
+            assert df[f'{target} Call'].tolist() == analyzer.df[f'{target} Call'].tolist()
+
+
+def test_requant_cli(tmp_path, write_mic_csv):
+    stored, _ = parse_plates(write_mic_csv, tmp_path, 0.2)
+    archive = tmp_path / 'archive'
+    archive.mkdir()
+    for i, importer in enumerate(stored):
+        importer.results.to_parquet(archive / f'plate{i}.parquet')
+
+    assert expand_plate_paths([str(archive)]) == [str(archive / f'plate{i}.parquet') for i in range(3)]
+    assert main(['--config', 'hiv/config.toml', '--assay', ASSAY, '--drm-percentage', '0.25',
+                 '--out', str(tmp_path / 'out'), str(archive)]) == 0
+    requantified = load_plate(str(tmp_path / 'out' / 'plate2.parquet'))
+    assert len(requantified) == 10 and '184VI Call' in requantified
+
+
+def test_requant_mixed_folder(tmp_path, capsys, write_qs_xlsx, write_mic_csv):
+    '''Plates without assigned quantities (here a VHF plate) are skipped and listed, not fatal.'''
+    stored, _ = parse_plates(write_mic_csv, tmp_path, 0.2)
+    archive = tmp_path / 'archive'
+    archive.mkdir()
+    for i, importer in enumerate(stored):
+        importer.results.to_parquet(archive / f'plate{i}.parquet')
+    write_qs_xlsx(tmp_path / 'vhf.xlsx')
+    vhf = DataImporter(assay='PANDAA LASV', machine_type='QuantStudio 5', division='vhf', filepath=str(tmp_path / 'vhf.xlsx'))
+    vhf.parse()
+    vhf.results.to_parquet(archive / 'plate1-vhf.parquet') #sorts between HIV plates
+
+    assert main(['--config', 'hiv/config.toml', '--assay', ASSAY, '--out', str(tmp_path / 'out'), str(archive)]) == 0
+    assert sorted(p.name for p in (tmp_path / 'out').iterdir()) == [f'plate{i}.parquet' for i in range(3)]
+    assert len(load_plate(str(tmp_path / 'out' / 'plate2.parquet'))) == 10
+    output = capsys.readouterr().out
+    assert 'plate1-vhf.parquet: missing columns: Assigned Quantity' in output and '1 skipped' in output
+
+    with pytest.raises(ValueError):
+        list(Requantifier(ASSAY).requantify([vhf.results]))
@@ -0,0 +1,62 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+from shared.schema import Schema, FormatError, load_schemas
+
+# tests/test_schema.py
+
+
+SPEC = {'rename': {'Name': 'Sample Name', 'Cq (mean)': 'CT'},
+        'dtype': {'CT': 'float', 'Well': 'int', 'Copies': 'float'},
+        'thousands': ',',
+        'na_values': ['-'],
+        'tokens': {'CT': {'Undetermined': 'cq_cutoff'}},
+        'fill': {'Copies': 0},
+        'txt': {'thousands': ''}}
+
+
+def test_schemas_cover_every_machine():
+    schemas = load_schemas()
+    assert sorted(schemas) == ['Mic', 'QuantStudio', 'Rotor-Gene']
+    for tables in schemas.values():
+        for spec in tables.values():
+            Schema(spec) #every table can be built
+
+
+def test_frame_types_columns():
+    schema = Schema(SPEC, cq_cutoff=40)
+    df = schema.frame(['Well', 'Name', 'Cq (mean)', 'Copies'],
+                      [['1', 'S1', 'Undetermined', '1,200.5'],
+                       ['2', 'S2', ' 25.5 ', '-'],
+                       ['3', 'S3', '', '']])
+    assert list(df.columns) == ['Well', 'Sample Name', 'CT', 'Copies']
+    assert df['Well'].tolist() == [1, 2, 3] and df['Well'].dtype == int
+    assert df['CT'].tolist()[:2] == [40, 25.5] and np.isnan(df['CT'][2])
+    assert df['Copies'].tolist() == [1200.5, 0, 0]
+
+
+def test_read_options_match_frame():
+    schema = Schema(SPEC, cq_cutoff=40)
+    text = 'Well,Name,Cq (mean),Copies\n1,S1,Undetermined,"1,200.5"\n2,S2,25.5,-\n3,S3,,\n'
+    df = schema.finish(pd.read_csv(io.StringIO(text), **schema.read_options()))
+    expected = schema.frame(['Well', 'Name', 'Cq (mean)', 'Copies'],
+                            [['1', 'S1', 'Undetermined', '1200.5'], ['2', 'S2', '25.5', '-'], ['3', 'S3', '', '']])
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+
+def test_extension_overrides():
+    assert Schema(SPEC).convert('1,200', 'Copies') == 1200
+    with pytest.raises(FormatError, match="'1,200' in column 'Copies'"): #no thousands separator in .txt files
+        Schema(SPEC, '.txt').convert('1,200', 'Copies')
+    assert Schema(dict(SPEC, txt={'thousands': '', 'coerce': ['Copies']}), '.txt').convert('1,200', 'Copies') == 0 #read as blank, then filled
+
+
+def test_values_that_are_not_numbers():
+    schema = Schema(SPEC, cq_cutoff=40)
+    with pytest.raises(FormatError, match="'abc' in column 'CT'"): #not read as a blank Cq
+        schema.frame(['Well', 'Cq (mean)'], [['1', 'abc']])
+    with pytest.raises(FormatError, match="'A1' in column 'Well'"): #a well position, where a well number is expected
+        schema.frame(['Well', 'Cq (mean)'], [['A1', '20']])
+    with pytest.raises(FormatError, match="'abc' in column 'CT'"):
+        schema.finish(pd.read_csv(io.StringIO('Well,Cq (mean)\n1,abc\n'), **schema.read_options()))
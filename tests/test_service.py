@@ -0,0 +1,85 @@
+import os
+import json
+import http.client
+import pytest
+from urllib.parse import urlencode
+from shared.service import AnalysisService, AssayRegistry, Job, RequestError
+from shared.synthetic import SyntheticPlate
+
+# tests/test_service.py
+
+
+@pytest.fixture(scope='module')
+def service(load_config):
+    service = AnalysisService(AssayRegistry([load_config('hiv'), load_config('vhf')]), workers=2, log=lambda line: None)
+    host, port = service.start(port=0)
+    service.address = (host, port)
+    yield service
+    service.shutdown()
+
+
+def request(service, method, path, body=None):
+    connection = http.client.HTTPConnection(*service.address, timeout=60)
+    try:
+        connection.request(method, path, body=body)
+        response = connection.getresponse()
+        return response.status, response.getheader('Content-Type'), response.read()
+    finally:
+        connection.close()
+
+
+def analyze(service, filepath, **params):
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    query = urlencode({'filename': os.path.basename(filepath), **params})
+    return request(service, 'POST', f'/analyze?{query}', data)
+
+
+def test_assays_and_health(service):
+    status, _, body = request(service, 'GET', '/assays')
+    assays = json.loads(body)
+    assert status == 200 and assays['PANDAA LASV']['division'] == 'vhf' and assays['076V 184VI']['division'] == 'hiv'
+    assert 'Rotor-Gene' not in assays['PANDAA LASV']['machines']
+    status, _, body = request(service, 'GET', '/health')
+    assert status == 200 and json.loads(body)['workers'] == 2
+
+
+def test_analyze(service, tmp_path):
+    plate = SyntheticPlate('076V 184VI', wells=24)
+    filepath = plate.write(str(tmp_path), 'Mic', '.csv')
+
+    status, content_type, body = analyze(service, filepath, assay='076V 184VI', machine='Mic')
+    assert status == 200 and content_type == 'application/json'
+    response = json.loads(body)
+    assert len(response['wells']) == 24 and '184VI Call' in response['wells'][0]
+    assert 'VQ Copies' in response['summary_csv'] and response['pdf'] is None
+
+    status, content_type, body = analyze(service, filepath, assay='076V 184VI', machine='Mic', format='csv')
+    assert status == 200 and content_type == 'text/csv' and body.decode('utf-8').count('\n') > 24
+
+
+def test_analyze_pdf(service, tmp_path):
+    filepath = SyntheticPlate('PANDAA LASV', wells=8).write(str(tmp_path), 'QuantStudio 5', '.xlsx')
+    status, content_type, body = analyze(service, filepath, assay='PANDAA LASV', machine='QuantStudio 5', format='pdf')
+    assert status == 200 and content_type == 'application/pdf' and body.startswith(b'%PDF')
+
+
+def test_bad_requests(service, tmp_path):
+    filepath = SyntheticPlate('PANDAA LASV', wells=8).write(str(tmp_path), 'QuantStudio 5', '.xlsx')
+    assert analyze(service, filepath, assay='No such assay', machine='QuantStudio 5')[0] == 404
+    assert analyze(service, filepath, assay='PANDAA LASV', machine='Rotor-Gene')[0] == 400
+    assert analyze(service, filepath, assay='PANDAA LASV', machine='Mic', filename='plate.txt')[0] == 400
+
+    status, _, body = analyze(service, filepath, assay='076V 184VI', machine='QuantStudio 5') #wrong assay for file
+    assert status == 422 and 'Fluorophores' in json.loads(body)['error']
+    assert request(service, 'GET', '/nothing')[0] == 404
+
+
+def test_queue_is_bounded(load_config):
+    '''Requests beyond the queue are turned away at once, rather than waiting.'''
+    service = AnalysisService(AssayRegistry([load_config('vhf')]), workers=1, queue_size=1) #not started - nothing is taken off the queue
+    runner = service.registry.runner('PANDAA LASV', 'QuantStudio 5', False)
+    service.submit(Job(runner, 'a.xlsx', b'', 'json'))
+    with pytest.raises(RequestError) as error:
+        service.submit(Job(runner, 'b.xlsx', b'', 'json'))
+    assert error.value.status == 503
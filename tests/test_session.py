@@ -0,0 +1,35 @@
+import sys
+import pytest
+import pandas as pd
+from shared.session import AnalysisSession
+from shared.data_analysis import PandaaError
+from shared.synthetic import SyntheticPlate
+
+# tests/test_session.py
+
+
+def test_session_shares_setup(tmp_path, load_config):
+    session = AnalysisSession('PANDAA LASV', 'QuantStudio 5', load_config('vhf'))
+    filepaths = [SyntheticPlate('PANDAA LASV', wells=8, seed=i).write(str(tmp_path), 'QuantStudio 5', '.xlsx') for i in range(2)]
+    importers = [session.importer(filepath) for filepath in filepaths]
+    assert importers[0].config is importers[1].config is session.assays #assays.toml read once
+
+    exporters = []
+    for importer in importers:
+        importer.parse()
+        exporter = session.exporter(importer, session.analyzer(importer))
+        exporter.export()
+        exporters.append(exporter)
+    assert exporters[0].names is exporters[1].names is session.names
+    summary = pd.read_csv(exporters[0].dest_filepath, skiprows=len(exporters[0].header) + 2)
+    assert list(summary.columns) == list(exporters[0].results.columns) and 'Result' in summary
+
+    session.report(exporters[0])
+    logo = sys.modules['reportbuilder'].logo #as imported by the session
+    assert logo is not None
+    assert session.report(exporters[1]).endswith('.pdf') and sys.modules['reportbuilder'].logo is logo #logo decoded once
+
+
+def test_session_unknown_assay(load_config):
+    with pytest.raises(PandaaError):
+        AnalysisSession('No such assay', 'Mic', load_config('vhf'))
@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+import pytest
+
+# tests/test_startup.py
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+STARTUP_BUDGET_MS = 400 #total import time allowed before the main menu can be shown - checked with PANDAA_STARTUP_BUDGET=1
+DEFERRED = ['pandas', 'numpy', 'reportlab', 'openpyxl', 'data_analysis', 'reportbuilder']
+
+
+def import_times(tool):
+    '''Import `<tool>/main.py` (without running main) under -X importtime; returns {module: cumulative µs}.'''
+    code = ("import importlib.util; "
+            f"spec = importlib.util.spec_from_file_location('main', {os.path.join(ROOT, tool, 'main.py')!r}); "
+            "spec.loader.exec_module(importlib.util.module_from_spec(spec))")
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, check=True)
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        indent = len(name) - len(name.lstrip())
+        times[name.strip()] = (int(cumulative), indent)
+    return times
+
+
+@pytest.mark.parametrize('tool', ['hiv', 'vhf'])
+def test_heavy_modules_deferred(tool):
+    times = import_times(tool)
+    loaded = {name.split('.')[0] for name in times}
+    assert not loaded & set(DEFERRED)
+
+
+@pytest.mark.skipif(not os.environ.get('PANDAA_STARTUP_BUDGET'), reason='wall-clock timing - set PANDAA_STARTUP_BUDGET=1 on an idle machine')
+@pytest.mark.parametrize('tool', ['hiv', 'vhf'])
+def test_startup_budget(tool):
+    times = import_times(tool)
+    total_ms = sum(cumulative for cumulative, indent in times.values() if indent == 1) / 1000 #top-level imports only
+    assert total_ms < STARTUP_BUDGET_MS
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from shared.synthetic import SyntheticPlate
+from shared.data_analysis import DataImporter
+from shared.batch import BatchRunner
+
+# tests/test_synthetic.py
+
+
+@pytest.mark.parametrize('machine_type, ext', [('QuantStudio 5', '.xlsx'), ('QuantStudio 3', '.txt'),
+                                               ('Mic', '.xlsx'), ('Mic', '.csv'), ('Rotor-Gene', '.csv')])
+@pytest.mark.parametrize('assay', ['PANDAA Ebola + Marburg', '076V 184VI'])
+def test_every_format_parses(tmp_path, machine_type, ext, assay):
+    plate = SyntheticPlate(assay, wells=96, seed=3)
+    filepath = plate.write(str(tmp_path), machine_type, ext)
+    importer = DataImporter(assay=assay, machine_type=machine_type, division=plate.division, filepath=filepath)
+    importer.parse()
+
+    assert len(importer.results) == 96
+    for fluor in plate.reporter_list:
+        cq = importer.results[f'{fluor} CT'].to_numpy(dtype=float)
+        expected = np.nan_to_num(plate.cq[fluor], nan=importer.cq_cutoff) #undetermined wells get the cutoff
+        assert np.allclose(cq, expected, atol=0.01)
+
+
+def test_384_well_layout():
+    plate = SyntheticPlate('PANDAA LASV', wells=384)
+    assert plate.positions[:2] == ['A1', 'A2'] and plate.positions[-1] == 'P24'
+    assert plate.division == 'vhf'
+
+
+def test_same_seed_same_plate():
+    a, b = SyntheticPlate('076V 184VI', seed=7), SyntheticPlate('076V 184VI', seed=7)
+    assert np.array_equal(a.cq['FAM'], b.cq['FAM'], equal_nan=True)
+    assert not np.array_equal(a.cq['FAM'], SyntheticPlate('076V 184VI', seed=8).cq['FAM'], equal_nan=True)
+
+
+def test_hiv_standard_curve(tmp_path):
+    '''Standard curves fitted from a synthetic Mic plate recover the simulated curve.'''
+    plate = SyntheticPlate('076V 184VI', wells=48, slope=-3.4, intercept=39.0)
+    filepath = plate.write(str(tmp_path), 'Mic', '.csv')
+    importer = DataImporter(assay='076V 184VI', machine_type='Mic', division='hiv', filepath=filepath)
+    importer.parse()
+
+    for fluor in plate.reporter_list:
+        assert importer.curves[fluor]['slope'] == pytest.approx(-3.4, abs=0.1)
+        assert importer.curves[fluor]['r2'] > 0.99
+
+
+def test_unsupported_format(tmp_path):
+    with pytest.raises(ValueError):
+        SyntheticPlate('076V 184VI').write(str(tmp_path), 'Rotor-Gene', '.xlsx')
+
+
+def test_batch_stage_peak_memory(tmp_path, load_config):
+    '''Stages record their peak memory only while it is traced.'''
+    import tracemalloc
+
+    filepath = SyntheticPlate('PANDAA LASV').write(str(tmp_path), 'QuantStudio 5', '.xlsx')
+    runner = BatchRunner('PANDAA LASV', 'QuantStudio 5', load_config('vhf'), create_pdf=False)
+    assert runner.analyze(filepath)['peak_memory'] == {}
+
+    tracemalloc.start()
+    try:
+        record = runner.analyze(filepath)
+    finally:
+        tracemalloc.stop()
+    assert record['status'] == 'ok'
+    assert set(record['peak_memory']) == {'parse', 'analyze', 'export'}
+    assert all(peak > 0 for peak in record['peak_memory'].values())
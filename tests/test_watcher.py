@@ -0,0 +1,127 @@
+import os
+import pytest
+from shared.synthetic import SyntheticPlate
+from shared.watcher import Watcher, sniff_machine, parse_rule
+
+# tests/test_watcher.py
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def new_watcher(load_config, folders, assay='PANDAA LASV', tool='vhf', **kwargs):
+    clock = Clock()
+    lines = []
+    watcher = Watcher(folders, assay, load_config(tool), create_pdf=False, settle=5, clock=clock, log=lines.append, **kwargs)
+    return watcher, clock, lines
+
+
+@pytest.mark.parametrize('machine_type, ext, expected', [('QuantStudio 5', '.xlsx', 'QuantStudio 5'), ('QuantStudio 3', '.txt', 'QuantStudio 3'),
+                                                         ('Mic', '.xlsx', 'Mic'), ('Mic', '.csv', 'Mic'), ('Rotor-Gene', '.csv', 'Rotor-Gene')])
+def test_sniff_machine(tmp_path, machine_type, ext, expected):
+    written = SyntheticPlate('076V 184VI', wells=8).write(str(tmp_path), machine_type, ext)
+    for filepath in written if isinstance(written, list) else [written]:
+        assert sniff_machine(filepath) == expected
+    (tmp_path / 'notes.txt').write_text('nothing to see')
+    assert sniff_machine(str(tmp_path / 'notes.txt')) is None
+
+
+def test_parse_rule():
+    assert parse_rule('exports/qs5=QuantStudio 5') == ('exports/qs5', 'QuantStudio 5')
+    assert parse_rule('exports') == ('exports', None)
+
+
+def test_files_settle_before_analysis(tmp_path, load_config):
+    watcher, clock, _ = new_watcher(load_config, {str(tmp_path): None})
+    path = tmp_path / 'plate.txt'
+    path.write_text('* Instrument Type = QuantStudio 5 System\n')
+    assert watcher.scan() == [] #first seen
+
+    clock.now = 4
+    with open(path, 'a') as f: #still being written
+        f.write('* Experiment Name = x\n')
+    assert watcher.scan() == []
+    clock.now = 8
+    assert watcher.scan() == [] #unchanged for 4 s only
+    clock.now = 9
+    assert watcher.scan() == [('QuantStudio 5', str(path))]
+    clock.now = 20
+    assert watcher.scan() == [] #not again
+
+
+def test_watch_analyzes_new_exports(tmp_path, load_config):
+    qs_folder, shared_folder = tmp_path / 'qs', tmp_path / 'shared'
+    qs_folder.mkdir()
+    shared_folder.mkdir()
+    watcher, clock, lines = new_watcher(load_config, {str(qs_folder): 'QuantStudio 5', str(shared_folder): None})
+
+    qs = SyntheticPlate('PANDAA LASV', wells=8, seed=1).write(str(qs_folder), 'QuantStudio 5', '.xlsx')
+    mic = SyntheticPlate('PANDAA LASV', wells=8, seed=2).write(str(shared_folder), 'Mic', '.csv')
+    rgq = SyntheticPlate('PANDAA LASV', wells=8, seed=3).write(str(shared_folder), 'Rotor-Gene', '.csv')
+    os.rename(rgq[1], rgq[1] + '.part') #last channel not exported yet
+    (shared_folder / 'readme.txt').write_text('not a results file')
+
+    watcher.poll()
+    clock.now = 10
+    watcher.poll()
+    assert sorted(record['source'] for record in watcher.records) == sorted([qs, mic])
+    assert all(record['status'] == 'ok' for record in watcher.records)
+    assert os.path.exists(os.path.splitext(qs)[0] + ' - Summary.csv')
+    assert any(line.startswith('SKIP') and 'readme.txt' in line for line in lines)
+
+    os.rename(rgq[1] + '.part', rgq[1])
+    clock.now = 20
+    watcher.poll()
+    clock.now = 30
+    watcher.poll()
+    assert len(watcher.records) == 3 and watcher.records[-1]['files'] == sorted(rgq)
+
+    # a restarted watcher skips plates that already have a summary
+    restarted, clock, _ = new_watcher(load_config, {str(qs_folder): 'QuantStudio 5', str(shared_folder): None})
+    restarted.poll()
+    clock.now = 10
+    restarted.poll()
+    assert restarted.records == []
+
+
+def test_watch_worker_pool(tmp_path, load_config):
+    watcher, clock, _ = new_watcher(load_config, {str(tmp_path): 'QuantStudio 5'}, workers=2, log_file=str(tmp_path / 'log.jsonl'))
+    filepaths = [SyntheticPlate('PANDAA LASV', wells=8, seed=i).write(str(tmp_path), 'QuantStudio 5', '.xlsx') for i in range(5)]
+    watcher.poll()
+    clock.now = 10
+    watcher.poll()
+    assert len(watcher.running) <= 4 #two plates per worker - the rest wait in the watcher
+    while watcher.waiting:
+        watcher.collect(timeout=None)
+        watcher.dispatch()
+    watcher.close()
+
+    assert sorted(record['source'] for record in watcher.records) == sorted(filepaths)
+    assert all(record['status'] == 'ok' for record in watcher.records)
+    assert len((tmp_path / 'log.jsonl').read_text().splitlines()) == 5
+
+
+def test_watch_worker_dies(tmp_path, monkeypatch, load_config, dying_runner):
+    monkeypatch.setattr('shared.watcher.BatchRunner', dying_runner) #worker processes are forked with it
+    watcher, clock, _ = new_watcher(load_config, {str(tmp_path): 'QuantStudio 5'}, workers=2)
+    for i in range(5):
+        SyntheticPlate('PANDAA LASV', wells=2, seed=i).write(str(tmp_path), 'QuantStudio 5', '.xlsx', name=f'plate{i}')
+    watcher.poll()
+    clock.now = 10
+    watcher.poll()
+    first_pool = watcher.pool
+    while watcher.waiting or watcher.suspects or watcher.running:
+        watcher.collect(timeout=None)
+        watcher.dispatch()
+        assert watcher.pool is None or watcher.pool is first_pool or not watcher.pool._broken
+    watcher.close()
+
+    status = {os.path.basename(record['source']): record['status'] for record in watcher.records}
+    assert status == {'plate0.xlsx': 'ok', 'plate1.xlsx': 'ok', 'plate2.xlsx': 'failed', 'plate3.xlsx': 'ok', 'plate4.xlsx': 'ok'}
+    failed = next(record for record in watcher.records if record['status'] == 'failed')
+    assert 'terminated abruptly' in failed['error']
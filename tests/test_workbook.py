@@ -0,0 +1,75 @@
+import io
+import pandas as pd
+import pytest
+from openpyxl import Workbook as OpenpyxlWorkbook
+from shared.workbook import Workbook, column_indices
+
+# tests/test_workbook.py
+
+
+@pytest.fixture
+def xlsx_path(tmp_path):
+    '''Workbook with a header block, blank rows, mixed types, and a results table further down.'''
+    wb = OpenpyxlWorkbook()
+    ws = wb.active
+    ws.title = 'Results'
+    ws.append(['Block Type', '96-Well Block'])
+    ws.append(['Experiment Name', 'Test run'])
+    ws.append([])
+    ws.append(['Instrument Type', 'QuantStudio™ 3 System', None, 'extra'])
+    for i, name in enumerate(['Well', 'Well Position', 'CT', 'Cq Conf', 'Quantity'], start=1):
+        ws.cell(row=10, column=i, value=name)
+    rows = [[1, 'A1', 25.5, 0.9, None],
+            [2, 'A2', 'Undetermined', 0, 1000],
+            [3, 'A3', 30, 0.95, 12.25]]
+    for r, row in enumerate(rows, start=11):
+        for c, value in enumerate(row, start=1):
+            ws.cell(row=r, column=c, value=value)
+    other = wb.create_sheet('Samples')
+    other.append(['Well', 'Type'])
+    other.append([1, 'Standard'])
+    path = tmp_path / 'plate.xlsx'
+    wb.save(path)
+    return path
+
+
+def test_column_indices():
+    assert column_indices('A:B') == [0, 1]
+    assert column_indices('A,C:D') == [0, 2, 3]
+    assert column_indices('AA') == [26]
+
+
+@pytest.mark.parametrize('kwargs', [{'skiprows': 9}, {'usecols': 'A:B'}, {}])
+def test_read_sheet_matches_read_excel(xlsx_path, kwargs):
+    expected = pd.read_excel(xlsx_path, sheet_name='Results', **kwargs)
+    result = Workbook(str(xlsx_path)).read_sheet('Results', **kwargs)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_sheets_read_once(xlsx_path):
+    workbook = Workbook(io.BytesIO(xlsx_path.read_bytes()))
+    assert workbook.sheet_names == ['Results', 'Samples']
+    workbook.read_sheet('Results', skiprows=9)
+    rows = workbook.rows['Results']
+    workbook.read_sheet('Results', usecols='A:B')
+    assert workbook.rows['Results'] is rows
+    pd.testing.assert_frame_equal(workbook.read_sheet('Samples'), pd.read_excel(xlsx_path, sheet_name='Samples'))
+
+
+@pytest.mark.parametrize('skiprows', [9, 5]) #header at expected row, or further down
+def test_read_table_matches_extract_results(xlsx_path, skiprows):
+    from shared.data_analysis import DataImporter
+    importer = DataImporter()
+    expected = importer.extract_results(pd.read_excel(xlsx_path, sheet_name='Results', skiprows=skiprows))
+    result = Workbook(str(xlsx_path)).read_table('Results', skiprows=skiprows)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_read_table_with_schema(xlsx_path):
+    from shared.schema import Schema, load_schemas
+    schema = Schema(load_schemas()['QuantStudio']['results'], '.xlsx', cq_cutoff=35)
+    result = Workbook(str(xlsx_path)).read_table('Results', skiprows=5, schema=schema)
+    assert list(result.columns) == ['Well No.', 'Well', 'CT', 'Cq Conf', 'Quantity']
+    assert result['CT'].tolist() == [25.5, 35, 30]
+    assert result['Quantity'].tolist() == [0, 1000, 12.25]
+    assert result['CT'].dtype == result['Cq Conf'].dtype == float
@@ -4,15 +4,15 @@
 #
 #   This script contains a main() function that can be used to run PANDAA data analysis from a GUI.
 #
+#   Files are chosen, and errors shown, through gui.py - the analysis classes themselves never show a dialog.
 #
 ##############################################################################################################################
 
 import sys, os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'shared'))) #look for custom dependencies in shared folder
 
-import data_analysis as vhf
 from userinterface import PandaaMenu
-from reportbuilder import Report, get_app_info
+import instrument #stage timing spans (PANDAA_TRACE) and profiling (PANDAA_PROFILE) - off unless switched on
 from importlib import util
 import time, tomli
 
@@ -41,7 +41,8 @@ def main():
                      assay_choices=extc['assay_choices'],
                      assay_format=extc['assay_choice_format'],
                      machine_choices=extc['machine_choices'])
-    app.start()
+    with instrument.span('menu'):
+        app.start()
 
     # Retrieve user's selections
     assay_selected = app.assay
@@ -51,35 +52,49 @@ def main():
         print("Error: No assay or machine selected. Exiting.")
         return
 
-    # Initialize the data importer and parse the file
+    # Load data analysis only once the menu is closed, so the menu appears as quickly as possible
+    import data_analysis as vhf
+    import gui
+
+    # Initialize the data importer, let the user choose the results file(s), and parse them
     importer = vhf.DataImporter(assay=assay_selected, machine_type=machine_selected,
                                 cq_cutoff=intc['cq_cutoff'], division=intc['division'])
-    importer.parse()
+    with instrument.span('select_file', machine=machine_selected):
+        importer.filepath = gui.attempt(gui.choose_results, importer)
+    with instrument.span('parse', assay=assay_selected, machine=machine_selected):
+        gui.attempt(importer.parse)
 
     # Analyze the data
-    analyzer = vhf.DataAnalyzer(data=importer,
-                                pos_cutoff=intc['pos_cutoff'], dRn_percent_cutoff=intc['dRn_percent_cutoff'])
-    analyzer.vhf_analysis()
+    with instrument.span('analyze'):
+        analyzer = vhf.DataAnalyzer(data=importer,
+                                    pos_cutoff=intc['pos_cutoff'], dRn_percent_cutoff=intc['dRn_percent_cutoff'])
+        gui.attempt(analyzer.vhf_analysis)
 
     # Export the results
     if intc['wait']:
         time.sleep(0.3) #program runs extremely quickly - adding sleep step may improve perceived legitimacy
-    exporter = vhf.DataExporter(importer, analyzer,
-                                columns=extc['export_columns'])
-    exporter.export()
+    with instrument.span('export'):
+        exporter = vhf.DataExporter(importer, analyzer,
+                                    columns=extc['export_columns'])
+        gui.attempt(exporter.export, retry=exporter.save) #if the summary is open in another program, only saving is retried
+    gui.saved(exporter)
     
     # Make the results into a PDF
     if extc['create_pdf']:
-        pdf_filepath = os.path.splitext(exporter.dest_filepath)[0] + '.pdf'
-        get_app_info(info['name'], info['version'], info['use'])
-        if 'QuantStudio' not in machine_selected:
-            pdf = Report(pdf_filepath, exporter.header, exporter.results, path_as_filename=exporter.dest_filepath)
-        else:
-            pdf = Report(pdf_filepath, exporter.header, exporter.results)
-        pdf.create()
+        with instrument.span('pdf'):
+            from reportbuilder import Report, get_app_info #ReportLab is only loaded when PDFs are created
+            pdf_filepath = os.path.splitext(exporter.dest_filepath)[0] + '.pdf'
+            get_app_info(info['name'], info['version'], info['use'])
+            if 'QuantStudio' not in machine_selected:
+                pdf = Report(pdf_filepath, exporter.header, exporter.results, path_as_filename=exporter.dest_filepath)
+            else:
+                pdf = Report(pdf_filepath, exporter.header, exporter.results)
+            gui.attempt(pdf.create)
+        gui.saved_pdf(pdf_filepath)
     
     print("Analysis complete. Results exported successfully.")
 
 
 if __name__ == '__main__':
-    main()
+    with instrument.profiled(intc['division']):
+        main()